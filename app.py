@@ -70,14 +70,44 @@ app.register_blueprint(app_rutas)
 db.init_app(app)
 migrate = Migrate(app, db)
 
-# ✅ INICIALIZAR CACHE
-cache.init_app(app, config={"CACHE_TYPE": "simple"})
+# ♻️ Invalidación de caches tras cada commit (eventos del ORM)
+import invalidacion  # noqa: F401
+# 📈 Cartera total mantenida en cada flush (eventos del ORM)
+import cartera  # noqa: F401
+
+# 🔬 Consultas SQL por petición (solo con SQL_INSTRUMENTACION=1)
+from instrumentacion import iniciar_instrumentacion
+iniciar_instrumentacion(app)
+
+# 📊 Métricas Prometheus (/metrics): peticiones, pool y caminos calientes
+from metricas import iniciar_metricas
+iniciar_metricas(app)
+
+# ✅ INICIALIZAR CACHE — compartido entre workers de gunicorn
+# Por defecto en disco (FileSystemCache); con CACHE_REDIS_URL usa Redis
+# (o cualquier servidor compatible, p. ej. Valkey/KeyDB corriendo en local).
+cache_config = {
+    "CACHE_TYPE": os.getenv("CACHE_TYPE", "FileSystemCache"),
+    "CACHE_DIR": os.getenv("CACHE_DIR", os.path.join(app.instance_path, "cache")),
+    "CACHE_DEFAULT_TIMEOUT": 300,
+}
+if os.getenv("CACHE_REDIS_URL"):
+    cache_config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "RedisCache")
+    cache_config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL")
+cache.init_app(app, config=cache_config)
+
+# ======================================================
+# 🖥️ Comandos de consola (flask rebuild-liquidaciones, ...)
+# ======================================================
+from comandos import registrar_comandos
+registrar_comandos(app)
 
 # ======================================================
 # 🗃️ Crear tablas si no existen
 # ======================================================
 with app.app_context():
     db.create_all()
+    cartera.asegurar_estado_global()
 
 # ======================================================
 # ▶️ Punto de entrada
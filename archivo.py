@@ -0,0 +1,143 @@
+# ======================================================
+# archivo.py — archivar préstamos viejos ya pagados (por lotes)
+# ======================================================
+#
+# Saca de las tablas calientes los préstamos con saldo <= 0 y más de N días,
+# junto con SUS abonos, y los copia a prestamo_archivado / abono_archivado
+# (o solo los borra con borrar=True). Cada lote es una transacción corta:
+# nada de un DELETE gigante que deje abonos huérfanos o bloquee la tabla.
+#
+# Los recálculos de liquidación suman también las tablas de archivo
+# (helpers.abonos_con_archivo / prestamos_con_archivo), así que reconstruir
+# fechas archivadas da la misma caja. Con borrar=True esas filas ya no
+# existen: reconstruir esas fechas las dejaría fuera.
+
+from datetime import timedelta
+
+from sqlalchemy import and_, delete, func, insert, literal, select, update
+
+from cartera import ajustar_cartera
+from extensions import db
+from invalidacion import anotar_cambios
+from modelos import Cliente, Prestamo, Abono, PrestamoArchivado, AbonoArchivado
+from tiempo import hora_actual, local_date
+
+DIAS_ARCHIVO = 180
+LOTE_ARCHIVO = 500
+
+_COLUMNAS_PRESTAMO = (
+    "id", "cliente_id", "monto", "interes", "plazo", "fecha", "saldo",
+    "frecuencia", "ultima_aplicacion_interes",
+)
+_COLUMNAS_ABONO = ("id", "prestamo_id", "monto", "fecha", "clave_idempotencia")
+
+
+def _filtro_archivables(limite):
+    return and_(Prestamo.saldo <= 0, Prestamo.fecha < limite)
+
+
+def contar_archivables(limite):
+    return db.session.query(func.count(Prestamo.id)).filter(_filtro_archivables(limite)).scalar() or 0
+
+
+def _copiar(modelo_origen, modelo_destino, columnas, condicion, ahora):
+    """INSERT INTO <archivo> SELECT ... FROM <tabla caliente> WHERE condicion."""
+    origen = select(
+        *(getattr(modelo_origen, c) for c in columnas),
+        literal(ahora, type_=db.DateTime),
+    ).where(condicion)
+    db.session.execute(
+        insert(modelo_destino).from_select([*columnas, "archivado_en"], origen)
+    )
+
+
+def archivar_lote(limite, lote: int = LOTE_ARCHIVO, borrar: bool = False):
+    """
+    Archiva (o borra) UN lote de préstamos anteriores a `limite` con sus
+    abonos, en su propia transacción. Devuelve (préstamos, abonos).
+    """
+    # 🔒 FOR UPDATE SKIP LOCKED en Postgres: no choca con abonos en curso
+    ids = list(
+        db.session.execute(
+            select(Prestamo.id)
+            .where(_filtro_archivables(limite))
+            .order_by(Prestamo.id)
+            .limit(lote)
+            .with_for_update(skip_locked=True)
+        ).scalars()
+    )
+    if not ids:
+        db.session.rollback()
+        return 0, 0
+
+    clientes = set(
+        db.session.execute(
+            select(Prestamo.cliente_id).where(Prestamo.id.in_(ids)).distinct()
+        ).scalars()
+    )
+    saldo_lote = float(
+        db.session.execute(
+            select(func.coalesce(func.sum(Prestamo.saldo), 0.0)).where(Prestamo.id.in_(ids))
+        ).scalar() or 0.0
+    )
+
+    if not borrar:
+        ahora = hora_actual()
+        _copiar(Abono, AbonoArchivado, _COLUMNAS_ABONO, Abono.prestamo_id.in_(ids), ahora)
+        _copiar(Prestamo, PrestamoArchivado, _COLUMNAS_PRESTAMO, Prestamo.id.in_(ids), ahora)
+
+    # Hijos primero (sin cascada del ORM no quedan abonos huérfanos)
+    sin_sync = {"synchronize_session": False}
+    abonos = db.session.execute(
+        delete(Abono).where(Abono.prestamo_id.in_(ids)), execution_options=sin_sync
+    ).rowcount
+    db.session.execute(
+        update(Cliente)
+        .where(Cliente.prestamo_actual_id.in_(ids))
+        .values(prestamo_actual_id=None),
+        execution_options=sin_sync,
+    )
+    db.session.execute(
+        delete(Prestamo).where(Prestamo.id.in_(ids)), execution_options=sin_sync
+    )
+
+    # Escrituras masivas: cartera e invalidación a mano
+    ajustar_cartera(db.session, -saldo_lote)
+    anotar_cambios(db.session, fechas=[local_date()], clientes=clientes)
+    db.session.commit()
+    return len(ids), abonos
+
+
+def archivar_prestamos_viejos(
+    dias: int = DIAS_ARCHIVO,
+    lote: int = LOTE_ARCHIVO,
+    borrar: bool = False,
+    max_lotes: int = None,
+    progreso=None,
+):
+    """
+    Archiva por lotes hasta terminar (o hasta `max_lotes`).
+    `progreso(prestamos, abonos, pendientes_al_inicio)` se llama tras cada lote.
+    Devuelve {"prestamos", "abonos", "lotes", "pendientes", "limite"}.
+    """
+    limite = local_date() - timedelta(days=dias)
+    pendientes = contar_archivables(limite)
+    total_prestamos = total_abonos = lotes = 0
+
+    while max_lotes is None or lotes < max_lotes:
+        prestamos, abonos = archivar_lote(limite, lote, borrar)
+        if not prestamos:
+            break
+        lotes += 1
+        total_prestamos += prestamos
+        total_abonos += abonos
+        if progreso:
+            progreso(total_prestamos, total_abonos, pendientes)
+
+    return {
+        "prestamos": total_prestamos,
+        "abonos": total_abonos,
+        "lotes": lotes,
+        "pendientes": contar_archivables(limite),
+        "limite": limite,
+    }
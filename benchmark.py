@@ -0,0 +1,447 @@
+# ======================================================
+# benchmark.py — medición de las rutas calientes con una cartera sintética
+# ======================================================
+#
+# Uso:
+#   python benchmark.py                      # escala 1: 5k clientes activos, 50k préstamos,
+#                                            # 2M abonos, 200k movimientos de caja (SQLite)
+#   python benchmark.py --escala 0.05        # corrida rápida
+#   python benchmark.py --bd postgresql://... --borrar-bd   # Postgres efímero (¡borra sus tablas!)
+#   python benchmark.py --guardar-base       # el resultado queda como línea base
+#
+# 1) Genera la cartera con semilla fija (mismos datos en cada corrida) usando
+#    INSERT masivos (executemany por bloques), y deja consistentes saldos,
+#    liquidaciones, cartera y secuencia de códigos.
+# 2) Mide cada ruta con el cliente de pruebas de Flask: mínimo, mediana y p95
+#    en ms, y consultas SQL por petición (header Server-Timing de
+#    instrumentacion.py).
+# 3) Guarda el JSON y lo compara con la línea base: más consultas que antes o
+#    un mínimo por encima de la tolerancia → regresión (código de salida 1).
+#
+# Línea base versionada (benchmark_base.json): escala 1, semilla 2024, 10
+# repeticiones, SQLite. Las consultas valen en cualquier máquina; los tiempos
+# solo se comparan contra una base de la misma plataforma. Para regenerarla
+# (p. ej. en la máquina de CI, o tras un cambio que mejora una ruta):
+#   python benchmark.py --escala 1 --repeticiones 10 --guardar-base
+# y versionar el benchmark_base.json resultante.
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ESCALA_BASE = {
+    "clientes_activos": 5_000,
+    "clientes_cancelados": 2_000,
+    "prestamos": 50_000,
+    "abonos": 2_000_000,
+    "movimientos": 200_000,
+}
+DIAS_HISTORIA = 365
+TIPOS_MOVIMIENTO = ("entrada_manual", "salida", "gasto", "prestamo")
+PESOS_MOVIMIENTO = (40, 25, 25, 10)
+TAMANO_BLOQUE = 20_000
+REPETICIONES = 10
+TOLERANCIA = 0.25
+# Diferencias menores que esto son ruido (rutas de pocos ms), no regresión
+MARGEN_MS = 5.0
+SEMILLA = 2024
+
+RESULTADO_POR_DEFECTO = "benchmark_resultado.json"
+BASE_POR_DEFECTO = "benchmark_base.json"
+
+_RE_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+def _argumentos():
+    p = argparse.ArgumentParser(description="Benchmark de las rutas calientes.")
+    p.add_argument("--escala", type=float, default=1.0, help="Multiplica los volúmenes de ESCALA_BASE.")
+    p.add_argument("--semilla", type=int, default=SEMILLA)
+    p.add_argument("--bd", help="URL de BD (por defecto, un SQLite temporal).")
+    p.add_argument("--borrar-bd", action="store_true", help="Necesario con --bd: se borran y recrean las tablas.")
+    p.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    p.add_argument("--salida", default=RESULTADO_POR_DEFECTO)
+    p.add_argument("--base", default=BASE_POR_DEFECTO)
+    p.add_argument("--guardar-base", action="store_true", help="Guardar también el resultado como línea base.")
+    p.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Aumento de mediana aceptado (0.25 = 25%%).")
+    p.add_argument("--margen-ms", type=float, default=MARGEN_MS, help="Aumento absoluto mínimo para contar como regresión.")
+    return p.parse_args()
+
+
+def _preparar_entorno(args, directorio):
+    """Variables que app.py lee al importarse (por eso antes de importarla)."""
+    if args.bd:
+        if not args.borrar_bd:
+            sys.exit("Con --bd hay que pasar --borrar-bd: el benchmark recrea todas las tablas.")
+        os.environ["DATABASE_URL"] = args.bd
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'benchmark.db')}"
+    os.environ["CACHE_DIR"] = os.path.join(directorio, "cache")
+    os.environ["SQL_INSTRUMENTACION"] = "1"
+    os.environ["SQL_LENTA_MS"] = "1e9"  # sin log de lentas durante la medición
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+# ======================================================
+# 🏭 CARTERA SINTÉTICA
+# ======================================================
+def _volumenes(escala):
+    v = {k: max(1, int(round(n * escala))) for k, n in ESCALA_BASE.items()}
+    v["prestamos"] = max(v["prestamos"], v["clientes_activos"] + v["clientes_cancelados"])
+    return v
+
+
+def _momento(rng, dia):
+    return datetime.combine(dia, datetime.min.time()) + timedelta(
+        hours=rng.randint(8, 19), minutes=rng.randint(0, 59), seconds=rng.randint(0, 59)
+    )
+
+
+class _Insertador:
+    """Junta filas por modelo y las inserta de a TAMANO_BLOQUE (executemany)."""
+
+    def __init__(self, db, insert):
+        self.db = db
+        self.insert = insert
+        self.filas = {}
+        self.totales = {}
+
+    def agregar(self, modelo, fila):
+        lote = self.filas.setdefault(modelo, [])
+        lote.append(fila)
+        if len(lote) >= TAMANO_BLOQUE:
+            # Todos, en el orden en que aparecieron: los padres antes que los hijos (FK)
+            self.vaciar()
+
+    def vaciar(self, modelo=None):
+        for m in [modelo] if modelo else list(self.filas):
+            lote = self.filas.get(m)
+            if lote:
+                self.db.session.execute(self.insert(m), lote)
+                self.totales[m.__tablename__] = self.totales.get(m.__tablename__, 0) + len(lote)
+                self.filas[m] = []
+
+
+def generar_cartera(escala, semilla):
+    """Llena la BD vacía con la cartera sintética. Devuelve los volúmenes creados."""
+    from sqlalchemy import insert, text, update
+
+    from cartera import reconciliar_cartera
+    from codigos import formatear_codigo, siguiente_codigo_inicial
+    from extensions import db
+    from helpers import rebuild_liquidaciones
+    from modelos import Cliente, Prestamo, Abono, MovimientoCaja, EstadoGlobal
+    from orden import ORDEN_PASO
+    from tiempo import local_date
+
+    rng = random.Random(semilla)
+    v = _volumenes(escala)
+    hoy = local_date()
+    inicio = hoy - timedelta(days=DIAS_HISTORIA)
+    abonos_por_prestamo = v["abonos"] / v["prestamos"]
+
+    n_clientes = v["clientes_activos"] + v["clientes_cancelados"]
+    # Cada activo tiene su préstamo vigente; los demás ya están pagados:
+    # uno por cancelado y el resto repartido al azar entre todos
+    pagados = [0] + [0] * v["clientes_activos"] + [1] * v["clientes_cancelados"]
+    for _ in range(v["prestamos"] - n_clientes):
+        pagados[rng.randint(1, n_clientes)] += 1
+
+    ins = _Insertador(db, insert)
+    punteros = []
+    prestamo_id = abono_id = 0
+
+    def crear_prestamo(cid, fecha, fraccion_pagada):
+        nonlocal prestamo_id, abono_id
+        prestamo_id += 1
+        monto = float(rng.choice([50, 100, 150, 200, 300, 500, 1000]))
+        interes = float(rng.choice([10, 15, 20]))
+        total = round(monto * (1 + interes / 100), 2)
+        pagado = round(total * fraccion_pagada, 2)
+        n = max(1, int(round(abonos_por_prestamo * rng.uniform(0.5, 1.5)))) if pagado > 0 else 0
+        cuota = round(pagado / n, 2) if n else 0.0
+        ins.agregar(Prestamo, {
+            "id": prestamo_id, "cliente_id": cid, "monto": monto, "interes": interes,
+            "plazo": rng.choice([20, 30, 45]), "fecha": fecha,
+            "saldo": round(total - pagado, 2), "frecuencia": "diario",
+            "ultima_aplicacion_interes": fecha,
+        })
+        ultimo = None
+        dias_disponibles = max((hoy - fecha).days, 0)
+        for i in range(n):
+            abono_id += 1
+            monto_abono = cuota if i < n - 1 else round(pagado - cuota * (n - 1), 2)
+            ultimo = fecha + timedelta(days=min(dias_disponibles, (i * dias_disponibles) // n + rng.randint(0, 1)))
+            ins.agregar(Abono, {
+                "id": abono_id, "prestamo_id": prestamo_id,
+                "monto": monto_abono, "fecha": _momento(rng, ultimo),
+            })
+        return prestamo_id, round(total - pagado, 2), ultimo
+
+    # Clientes primero (los préstamos apuntan a ellos); el puntero al préstamo vigente, después
+    for cid in range(1, n_clientes + 1):
+        activo = cid <= v["clientes_activos"]
+        ins.agregar(Cliente, {
+            "id": cid, "codigo": formatear_codigo(cid), "nombre": f"Cliente {cid:05d}",
+            "direccion": f"Calle {rng.randint(1, 400)} #{rng.randint(1, 2000)}",
+            "telefono": f"9{rng.randint(10_000_000, 99_999_999)}",
+            "orden": cid * ORDEN_PASO, "cancelado": not activo, "saldo": 0.0,
+            "fecha_creacion": inicio,
+        })
+    ins.vaciar(Cliente)
+
+    for cid in range(1, n_clientes + 1):
+        activo = cid <= v["clientes_activos"]
+        ultimo_abono = None
+        vigente = None
+        for _ in range(pagados[cid]):
+            fecha = hoy - timedelta(days=rng.randint(60, DIAS_HISTORIA))
+            vigente, _, ultimo = crear_prestamo(cid, fecha, 1.0)
+            ultimo_abono = max(filter(None, [ultimo_abono, ultimo]), default=None)
+        saldo = 0.0
+        if activo:
+            fecha = hoy - timedelta(days=rng.randint(0, 45))
+            vigente, saldo, ultimo = crear_prestamo(cid, fecha, rng.uniform(0.0, 0.9))
+            ultimo_abono = max(filter(None, [ultimo_abono, ultimo]), default=None)
+        punteros.append({
+            "id": cid, "prestamo_actual_id": vigente, "saldo": saldo,
+            "ultimo_abono_fecha": ultimo_abono,
+        })
+
+    for i in range(1, v["movimientos"] + 1):
+        dia = inicio + timedelta(days=rng.randint(0, DIAS_HISTORIA))
+        ins.agregar(MovimientoCaja, {
+            "id": i, "tipo": rng.choices(TIPOS_MOVIMIENTO, PESOS_MOVIMIENTO)[0], "monto": float(rng.randint(5, 300)),
+            "descripcion": f"Movimiento sintético {i}", "fecha": _momento(rng, dia),
+        })
+
+    ins.vaciar()
+    for i in range(0, len(punteros), TAMANO_BLOQUE):
+        db.session.execute(update(Cliente), punteros[i:i + TAMANO_BLOQUE])
+
+    # Postgres: los ids se dieron a mano, las secuencias quedaron atrás
+    if db.engine.dialect.name == "postgresql":
+        for tabla in ("cliente", "prestamo", "abono", "movimiento_caja"):
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {tabla}))"
+            ))
+    db.session.commit()
+
+    # Derivados: liquidaciones, cartera mantenida y secuencia de códigos
+    rebuild_liquidaciones(inicio, hoy)
+    reconciliar_cartera()
+    db.session.execute(
+        update(EstadoGlobal).where(EstadoGlobal.id == 1)
+        .values(siguiente_codigo=siguiente_codigo_inicial())
+    )
+    db.session.commit()
+
+    # Estadísticas frescas para el planificador antes de medir
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+    return ins.totales
+
+
+# ======================================================
+# ⏱️ MEDICIÓN
+# ======================================================
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+
+def _medir(hacer, repeticiones):
+    """Una vuelta de calentamiento y `repeticiones` medidas."""
+    hacer(-1)
+    tiempos, consultas = [], []
+    for i in range(repeticiones):
+        t0 = time.perf_counter()
+        resp = hacer(i)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        if resp.status_code >= 400:
+            raise RuntimeError(f"HTTP {resp.status_code}: {resp.get_data(as_text=True)[:300]}")
+        m = _RE_CONSULTAS.search(resp.headers.get("Server-Timing", ""))
+        consultas.append(int(m.group(1)) if m else 0)
+    return {
+        "ms_min": round(min(tiempos), 2),
+        "ms_mediana": round(statistics.median(tiempos), 2),
+        "ms_p95": round(_percentil(tiempos, 0.95), 2),
+        "consultas": int(statistics.median(consultas)),
+        "consultas_max": max(consultas),
+        "repeticiones": repeticiones,
+    }
+
+
+def medir_rutas(app, volumenes, repeticiones):
+    from extensions import db
+    from modelos import Abono
+    from codigos import formatear_codigo
+    from tiempo import local_date
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as s:
+        s["usuario"] = "benchmark"
+    fetch = {"X-Requested-With": "fetch"}
+    hoy = local_date()
+    activos = volumenes["clientes_activos"]
+    rng = random.Random(SEMILLA)
+
+    def abonar(i, prefijo):
+        codigo = formatear_codigo(rng.randint(1, activos))
+        return cliente.post(
+            "/registrar_abono_por_codigo",
+            data={"codigo": codigo, "monto": "0.5", "clave": f"{prefijo}-{i}"},
+            headers=fetch,
+        )
+
+    rutas = {
+        "index": lambda i: cliente.get("/"),
+        "dashboard": lambda i: cliente.get("/dashboard"),
+        "liquidacion_view": lambda i: cliente.get("/liquidacion"),
+        "liquidaciones_rango_30d": lambda i: cliente.get(
+            f"/liquidaciones?desde={hoy - timedelta(days=30)}&hasta={hoy}"
+        ),
+        "clientes_cancelados_view": lambda i: cliente.get("/clientes_cancelados"),
+        "registrar_abono_por_codigo": lambda i: abonar(i, "bench-abono"),
+    }
+    resultados = {}
+    for nombre, hacer in rutas.items():
+        resultados[nombre] = _medir(hacer, repeticiones)
+        print(f"  {nombre:<28} {resultados[nombre]['ms_mediana']:>9.2f} ms  "
+              f"{resultados[nombre]['consultas']:>4} consultas")
+
+    # eliminar_abono: abonos propios creados antes (fuera de la medición)
+    for i in range(-1, repeticiones):
+        abonar(i, "bench-borrar")
+    with app.app_context():
+        ids = {
+            clave: aid for aid, clave in db.session.query(Abono.id, Abono.clave_idempotencia)
+            .filter(Abono.clave_idempotencia.like("bench-borrar-%"))
+        }
+    resultados["eliminar_abono"] = _medir(
+        lambda i: cliente.post(f"/eliminar_abono/{ids[f'bench-borrar-{i}']}", headers=fetch),
+        repeticiones,
+    )
+    print(f"  {'eliminar_abono':<28} {resultados['eliminar_abono']['ms_mediana']:>9.2f} ms  "
+          f"{resultados['eliminar_abono']['consultas']:>4} consultas")
+    return resultados
+
+
+# ======================================================
+# 📊 COMPARACIÓN CON LA LÍNEA BASE
+# ======================================================
+def comparar(resultado, base, tolerancia, margen_ms=MARGEN_MS):
+    """
+    Lista de regresiones (texto) frente a la línea base.
+
+    Las consultas por petición no dependen de la máquina: más consultas que
+    la base siempre es regresión. Los tiempos se comparan por el mínimo (el
+    menos sensible a la carga de la máquina) y solo cuentan si la base se
+    generó en la misma plataforma; si no, se muestran como aviso.
+    """
+    if base["meta"].get("volumenes") != resultado["meta"].get("volumenes") or \
+            base["meta"].get("dialecto") != resultado["meta"].get("dialecto"):
+        print("⚠️ La línea base es de otra escala o BD: la comparación es orientativa.")
+    misma_maquina = base["meta"].get("plataforma") == resultado["meta"].get("plataforma")
+
+    regresiones = []
+    for ruta, actual in resultado["rutas"].items():
+        anterior = base["rutas"].get(ruta)
+        if not anterior:
+            continue
+        if actual["consultas"] > anterior["consultas"]:
+            regresiones.append(
+                f"{ruta}: {anterior['consultas']} → {actual['consultas']} consultas"
+            )
+        limite = max(anterior["ms_min"] * (1 + tolerancia), anterior["ms_min"] + margen_ms)
+        if actual["ms_min"] > limite:
+            texto = (
+                f"{ruta}: mínimo {anterior['ms_min']:.2f} → {actual['ms_min']:.2f} ms "
+                f"(tolerancia {tolerancia:.0%})"
+            )
+            if misma_maquina:
+                regresiones.append(texto)
+            else:
+                print(f"⚠️ {texto} — base de otra máquina, no cuenta como regresión")
+    return regresiones
+
+
+def main():
+    args = _argumentos()
+    directorio = tempfile.mkdtemp(prefix="arquitos_bench_")
+    _preparar_entorno(args, directorio)
+
+    try:
+        from app import app
+        from cartera import asegurar_estado_global
+        from extensions import db
+
+        app.config["TESTING"] = True
+        with app.app_context():
+            if args.bd:
+                db.drop_all()
+                db.create_all()
+                asegurar_estado_global()
+            dialecto = db.engine.dialect.name
+
+            print(f"🏭 Generando cartera (escala {args.escala}, semilla {args.semilla}, {dialecto})…")
+            t0 = time.perf_counter()
+            totales = generar_cartera(args.escala, args.semilla)
+            print(f"   {totales} en {time.perf_counter() - t0:.1f} s")
+            db.session.remove()
+
+        print(f"⏱️ Midiendo ({args.repeticiones} repeticiones por ruta)…")
+        volumenes = _volumenes(args.escala)
+        resultado = {
+            "meta": {
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "escala": args.escala,
+                "semilla": args.semilla,
+                "volumenes": volumenes,
+                "dialecto": dialecto,
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+            },
+            "rutas": medir_rutas(app, volumenes, args.repeticiones),
+        }
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"💾 Resultado en {args.salida}")
+
+    if args.guardar_base:
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"📌 Línea base guardada en {args.base}")
+        return 0
+
+    if not os.path.exists(args.base):
+        print(f"(sin línea base en {args.base}; use --guardar-base para crearla)")
+        return 0
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    regresiones = comparar(resultado, base, args.tolerancia, args.margen_ms)
+    if regresiones:
+        print("❌ Regresiones frente a la línea base:")
+        for r in regresiones:
+            print("   - " + r)
+        return 1
+    print("✅ Sin regresiones frente a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
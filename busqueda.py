@@ -0,0 +1,86 @@
+# ======================================================
+# busqueda.py — buscador de clientes (autocompletar)
+# ======================================================
+#
+# Busca por código, nombre, dirección y teléfono y devuelve solo los primeros
+# N resultados, para no tener que renderizar toda la cartera y filtrar en el
+# navegador.
+#
+# - Postgres: coincidencia en cualquier parte del texto (ILIKE '%q%'),
+#   resuelta con índices GIN de pg_trgm.
+# - SQLite (desarrollo): solo por prefijo (LIKE 'q%'), que usa los índices
+#   COLLATE NOCASE; un '%q%' ahí sería un recorrido completo.
+#
+# Los índices se crean en la migración y, para BDs nuevas sin migraciones
+# (db.create_all), con el DDL de abajo.
+
+from sqlalchemy import DDL, case, event, func, or_, select
+
+from extensions import db
+from modelos import Cliente
+
+LIMITE_BUSQUEDA = 10
+MAX_LIMITE_BUSQUEDA = 50
+MIN_CARACTERES = 2
+
+_COLUMNAS = ("codigo", "nombre", "direccion", "telefono")
+
+# Mismos índices que la migración f1c7b3e9d254
+_DDL_POSTGRES = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"CREATE INDEX IF NOT EXISTS ix_cliente_{c}_trgm ON cliente USING gin ({c} gin_trgm_ops)"
+    for c in _COLUMNAS
+]
+_DDL_SQLITE = [
+    f"CREATE INDEX IF NOT EXISTS ix_cliente_{c}_nocase ON cliente ({c} COLLATE NOCASE)"
+    for c in _COLUMNAS
+]
+
+for _sentencia in _DDL_POSTGRES:
+    event.listen(Cliente.__table__, "after_create", DDL(_sentencia).execute_if(dialect="postgresql"))
+for _sentencia in _DDL_SQLITE:
+    event.listen(Cliente.__table__, "after_create", DDL(_sentencia).execute_if(dialect="sqlite"))
+
+
+def _escapar_like(texto):
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def buscar_clientes(texto, limite: int = LIMITE_BUSQUEDA):
+    """
+    Primeros `limite` clientes que coinciden con `texto`.
+    Orden: código exacto, nombre que empieza con el texto, activos antes que
+    cancelados, y por nombre. Devuelve filas (id, codigo, nombre, direccion,
+    telefono, saldo, cancelado).
+    """
+    texto = (texto or "").strip()
+    if len(texto) < MIN_CARACTERES:
+        return []
+    limite = max(1, min(int(limite), MAX_LIMITE_BUSQUEDA))
+
+    columnas = [getattr(Cliente, c) for c in _COLUMNAS]
+    patron = _escapar_like(texto)
+
+    if db.engine.dialect.name == "postgresql":
+        condicion = or_(*(col.ilike(f"%{patron}%", escape="\\") for col in columnas))
+        empieza = Cliente.nombre.ilike(f"{patron}%", escape="\\")
+    else:
+        # LIKE de SQLite ya ignora mayúsculas (ASCII) y usa el índice NOCASE
+        condicion = or_(*(col.like(f"{patron}%", escape="\\") for col in columnas))
+        empieza = Cliente.nombre.like(f"{patron}%", escape="\\")
+
+    consulta = (
+        select(
+            Cliente.id, Cliente.codigo, Cliente.nombre, Cliente.direccion,
+            Cliente.telefono, Cliente.saldo, Cliente.cancelado,
+        )
+        .where(condicion)
+        .order_by(
+            case((func.lower(Cliente.codigo) == texto.lower(), 0), else_=1),
+            case((empieza, 0), else_=1),
+            Cliente.cancelado.is_(True),
+            Cliente.nombre,
+            Cliente.id,
+        )
+        .limit(limite)
+    )
+    return db.session.execute(consulta).all()
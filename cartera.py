@@ -0,0 +1,138 @@
+# ======================================================
+# cartera.py — cartera total mantenida (estado_global.cartera_total)
+# ======================================================
+#
+# En vez de SUM(prestamo.saldo) sobre toda la tabla en cada pantalla, la
+# cartera se guarda en la fila única de estado_global y se ajusta dentro de
+# la MISMA transacción en que cambia algún Prestamo.saldo (before_flush):
+# préstamo nuevo (+saldo), saldo modificado (+diferencia), préstamo borrado
+# (-saldo). Los borrados masivos (query.delete) llaman a ajustar_cartera a
+# mano. `flask reconciliar-cartera` la recalcula desde cero.
+#
+# Los ajustes se juntan en la sesión y se escriben en UN UPDATE justo antes
+# del commit (como la versión en invalidacion.py): la fila id=1 no queda
+# bloqueada durante toda la transacción ni antes que liquidacion.
+
+from sqlalchemy import event, func, select, update, insert, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from modelos import Prestamo, EstadoGlobal
+
+
+def _saldo_en_bd(session, prestamo):
+    """Saldo que tiene hoy la fila en la BD (antes de este flush)."""
+    historial = inspect(prestamo).attrs.saldo.history
+    if historial.deleted:
+        return float(historial.deleted[0] or 0)
+    if historial.added:
+        # Se asignó sin haber cargado el valor anterior: leerlo directo
+        return float(
+            session.connection().execute(
+                select(Prestamo.saldo).where(Prestamo.id == prestamo.id)
+            ).scalar() or 0
+        )
+    return float(prestamo.saldo or 0)
+
+
+_CLAVE_CARTERA = "cartera_pendiente"
+
+
+def ajustar_cartera(session, delta):
+    """Suma `delta` a la cartera de la transacción actual (se escribe al confirmar)."""
+    if not delta:
+        return
+    session.info[_CLAVE_CARTERA] = session.info.get(_CLAVE_CARTERA, 0.0) + delta
+
+
+@event.listens_for(Session, "before_flush")
+def _antes_de_flush(session, flush_context, instances):
+    delta = 0.0
+
+    for obj in session.new:
+        if isinstance(obj, Prestamo):
+            delta += float(obj.saldo or 0)
+
+    for obj in session.deleted:
+        if isinstance(obj, Prestamo):
+            delta -= _saldo_en_bd(session, obj)
+
+    for obj in session.dirty:
+        if isinstance(obj, Prestamo) and obj not in session.deleted:
+            if inspect(obj).attrs.saldo.history.has_changes():
+                delta += float(obj.saldo or 0) - _saldo_en_bd(session, obj)
+
+    ajustar_cartera(session, delta)
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_de_commit(session):
+    session.flush()
+    delta = session.info.pop(_CLAVE_CARTERA, 0.0)
+    if not delta:
+        return
+    session.connection().execute(
+        update(EstadoGlobal)
+        .where(EstadoGlobal.id == 1)
+        .values(cartera_total=EstadoGlobal.cartera_total + delta)
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _despues_de_rollback(session):
+    session.info.pop(_CLAVE_CARTERA, None)
+
+
+def calcular_cartera():
+    """SUM(prestamo.saldo) completo (solo para reconciliar o si falta la fila)."""
+    return float(
+        db.session.query(func.coalesce(func.sum(Prestamo.saldo), 0)).scalar() or 0.0
+    )
+
+
+def cartera_total():
+    """Cartera mantenida (una lectura por PK); si falta la fila, la suma completa."""
+    valor = db.session.execute(
+        select(EstadoGlobal.cartera_total).where(EstadoGlobal.id == 1)
+    ).scalar()
+    if valor is None:
+        return calcular_cartera()
+    return round(float(valor), 2)
+
+
+def asegurar_estado_global():
+    """Crea la fila id=1 si no existe (BD nueva sin migraciones)."""
+    # Solo el id: con columnas nuevas aún sin migrar, `flask db upgrade` igual arranca
+    if db.session.execute(select(EstadoGlobal.id).where(EstadoGlobal.id == 1)).scalar():
+        return
+    try:
+        from codigos import siguiente_codigo_inicial
+
+        db.session.execute(
+            insert(EstadoGlobal).values(
+                id=1,
+                version=0,
+                cartera_total=calcular_cartera(),
+                siguiente_codigo=siguiente_codigo_inicial(),
+            )
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Otro worker la creó al mismo tiempo
+        db.session.rollback()
+
+
+def reconciliar_cartera():
+    """Recalcula la cartera desde cero. Devuelve (anterior, nueva)."""
+    asegurar_estado_global()
+    anterior = db.session.execute(
+        select(EstadoGlobal.cartera_total).where(EstadoGlobal.id == 1)
+    ).scalar()
+    # En un solo UPDATE, para no pisar un ajuste que entre entre medio
+    suma = select(func.coalesce(func.sum(Prestamo.saldo), 0)).scalar_subquery()
+    db.session.execute(
+        update(EstadoGlobal).where(EstadoGlobal.id == 1).values(cartera_total=suma)
+    )
+    db.session.commit()
+    return float(anterior or 0), cartera_total()
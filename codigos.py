@@ -0,0 +1,78 @@
+# ======================================================
+# codigos.py — asignación de códigos de cliente (secuencia)
+# ======================================================
+#
+# Antes: 6 dígitos al azar + SELECT hasta no chocar, cada vez más lento a
+# medida que se llena el espacio. Ahora: contador en estado_global
+# (siguiente_codigo) que se toma con UN solo UPDATE ... RETURNING. El UPDATE
+# bloquea la fila, así que dos /nuevo_cliente a la vez nunca reciben el
+# mismo número.
+#
+# Invariante: siguiente_codigo > todo código numérico en uso. Los códigos
+# escritos a mano en el formulario lo empujan hacia arriba
+# (registrar_codigo_manual), por eso la secuencia nunca choca con ellos.
+
+from sqlalchemy import case, select, update
+
+from extensions import db
+from modelos import Cliente, EstadoGlobal
+
+DIGITOS_CODIGO = 6
+# Códigos más largos que esto no cuentan como numéricos (no entran en BigInteger)
+MAX_DIGITOS_NUMERICOS = 15
+
+
+def formatear_codigo(numero):
+    return str(numero).zfill(DIGITOS_CODIGO)
+
+
+def _numero(codigo):
+    codigo = (codigo or "").strip()
+    if codigo.isascii() and codigo.isdigit() and len(codigo) <= MAX_DIGITOS_NUMERICOS:
+        return int(codigo)
+    return None
+
+
+def siguiente_codigo_inicial():
+    """Máximo código numérico existente + 1 (BD nueva o reconciliación)."""
+    numeros = (_numero(c) for c in db.session.execute(select(Cliente.codigo)).scalars())
+    return max((n for n in numeros if n is not None), default=0) + 1
+
+
+def asignar_codigo():
+    """
+    Reserva el siguiente código libre y lo devuelve formateado ("000123").
+    Va en su propia transacción corta (como un nextval): un formulario que
+    se abandona deja un hueco, nunca un código repetido.
+    """
+    with db.engine.begin() as conexion:
+        numero = conexion.execute(
+            update(EstadoGlobal)
+            .where(EstadoGlobal.id == 1)
+            .values(siguiente_codigo=EstadoGlobal.siguiente_codigo + 1)
+            .returning(EstadoGlobal.siguiente_codigo - 1)
+        ).scalar()
+    if numero is None:
+        raise RuntimeError("Falta la fila estado_global (ver asegurar_estado_global)")
+    return formatear_codigo(numero)
+
+
+def registrar_codigo_manual(codigo):
+    """
+    Si `codigo` es numérico y alcanza a la secuencia, la adelanta para que
+    nunca lo reparta. Va en la transacción del alta del cliente.
+    """
+    numero = _numero(codigo)
+    if numero is None:
+        return
+    db.session.execute(
+        update(EstadoGlobal)
+        .where(EstadoGlobal.id == 1)
+        .values(
+            siguiente_codigo=case(
+                (EstadoGlobal.siguiente_codigo <= numero, numero + 1),
+                else_=EstadoGlobal.siguiente_codigo,
+            )
+        ),
+        execution_options={"synchronize_session": False},
+    )
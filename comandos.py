@@ -0,0 +1,179 @@
+# ======================================================
+# comandos.py — comandos de consola (flask <comando>)
+# ======================================================
+
+from datetime import datetime
+
+import click
+from sqlalchemy import func, text
+
+from extensions import db
+from modelos import (
+    Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion,
+    PrestamoArchivado, AbonoArchivado,
+)
+from tiempo import local_date, day_range
+
+
+def _parse_fecha(valor):
+    """Convierte 'YYYY-MM-DD' a date (o None si viene vacío)."""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter("Formato de fecha inválido (use YYYY-MM-DD).")
+
+
+def _primera_fecha_con_datos():
+    """Fecha más antigua con movimientos o liquidaciones registradas."""
+    candidatas = [
+        db.session.query(func.min(Liquidacion.fecha)).scalar(),
+        db.session.query(func.min(Prestamo.fecha)).scalar(),
+        db.session.query(func.min(Abono.fecha)).scalar(),
+        db.session.query(func.min(MovimientoCaja.fecha)).scalar(),
+        db.session.query(func.min(PrestamoArchivado.fecha)).scalar(),
+        db.session.query(func.min(AbonoArchivado.fecha)).scalar(),
+    ]
+    fechas = [c.date() if isinstance(c, datetime) else c for c in candidatas if c]
+    return min(fechas) if fechas else None
+
+
+def registrar_comandos(app):
+    """Registra los comandos de consola en la app."""
+
+    # ---------------------------------------------------
+    # 🔁 flask rebuild-liquidaciones [--desde] [--hasta]
+    # ---------------------------------------------------
+    @app.cli.command("rebuild-liquidaciones")
+    @click.option("--desde", help="Fecha inicial YYYY-MM-DD (por defecto, la más antigua con datos).")
+    @click.option("--hasta", help="Fecha final YYYY-MM-DD (por defecto, hoy).")
+    def rebuild_liquidaciones_cmd(desde, hasta):
+        """Reconstruye la cadena de liquidaciones (caja arrastrada) en un rango."""
+        from helpers import rebuild_liquidaciones
+
+        desde = _parse_fecha(desde) or _primera_fecha_con_datos()
+        hasta = _parse_fecha(hasta) or local_date()
+
+        if desde is None:
+            click.echo("No hay datos para reconstruir.")
+            return
+
+        liquidaciones = rebuild_liquidaciones(desde, hasta)
+        caja_final = liquidaciones[-1].caja if liquidaciones else 0.0
+        click.echo(
+            f"✅ {len(liquidaciones)} liquidaciones reconstruidas "
+            f"({desde} → {hasta}). Caja final: {caja_final:.2f}"
+        )
+
+    # ---------------------------------------------------
+    # 🗄️ flask archivar-prestamos [--dias] [--lote] [--borrar]
+    # ---------------------------------------------------
+    @app.cli.command("archivar-prestamos")
+    @click.option("--dias", default=180, show_default=True, help="Antigüedad mínima del préstamo.")
+    @click.option("--lote", default=500, show_default=True, help="Préstamos por transacción.")
+    @click.option("--max-lotes", type=int, help="Cortar después de N lotes.")
+    @click.option("--borrar", is_flag=True, help="Borrar en vez de copiar a las tablas de archivo.")
+    def archivar_prestamos_cmd(dias, lote, max_lotes, borrar):
+        """Archiva por lotes los préstamos pagados más viejos que --dias, con sus abonos."""
+        from archivo import archivar_prestamos_viejos
+
+        # Sin copia, reconstruir liquidaciones de esas fechas ya no los vería
+        if borrar and not click.confirm(
+            "⚠️ Con --borrar los abonos no quedan en el archivo y "
+            "rebuild-liquidaciones sobre sus fechas bajaría la caja. ¿Continuar?"
+        ):
+            return
+
+        def progreso(prestamos, abonos, pendientes):
+            click.echo(f"  … {prestamos}/{pendientes} préstamos, {abonos} abonos")
+
+        r = archivar_prestamos_viejos(
+            dias=dias, lote=lote, borrar=borrar, max_lotes=max_lotes, progreso=progreso
+        )
+        accion = "borrados" if borrar else "archivados"
+        click.echo(
+            f"✅ {r['prestamos']} préstamos y {r['abonos']} abonos {accion} "
+            f"en {r['lotes']} lotes (anteriores a {r['limite']}). Pendientes: {r['pendientes']}"
+        )
+
+    # ---------------------------------------------------
+    # 📈 flask reconciliar-cartera
+    # ---------------------------------------------------
+    @app.cli.command("reconciliar-cartera")
+    def reconciliar_cartera_cmd():
+        """Recalcula la cartera total mantenida desde SUM(prestamo.saldo)."""
+        from cartera import reconciliar_cartera
+
+        anterior, nueva = reconciliar_cartera()
+        diferencia = round(nueva - anterior, 2)
+        click.echo(
+            f"✅ Cartera reconciliada: {anterior:.2f} → {nueva:.2f} "
+            f"(diferencia {diferencia:+.2f})"
+        )
+
+    # ---------------------------------------------------
+    # 🔢 flask rebalancear-orden
+    # ---------------------------------------------------
+    @app.cli.command("rebalancear-orden")
+    def rebalancear_orden_cmd():
+        """Reparte de nuevo las llaves de orden de la ruta (huecos parejos)."""
+        from orden import rebalancear_orden, ORDEN_PASO
+
+        cambiados = rebalancear_orden()
+        db.session.commit()
+        click.echo(f"✅ Orden rebalanceado de a {ORDEN_PASO}: {cambiados} clientes actualizados.")
+
+    # ---------------------------------------------------
+    # 🔍 flask explicar-consultas
+    # ---------------------------------------------------
+    @app.cli.command("explicar-consultas")
+    def explicar_consultas_cmd():
+        """
+        Muestra el plan (EXPLAIN) de las consultas calientes.
+
+        Sirve para comprobar que los índices de la migración 9b1d4e7a2c30
+        se usan. Resultado esperado:
+          - Postgres: "Index Scan" / "Bitmap Index Scan" / "Index Only Scan" sobre ix_*
+          - SQLite:   "SEARCH <tabla> USING INDEX ix_*"
+        Con tablas casi vacías Postgres puede preferir "Seq Scan"; correrlo
+        sobre datos reales (después de ANALYZE) antes de sacar conclusiones.
+        """
+        from helpers import consulta_clientes_activos, consulta_totales_diarios
+
+        hoy = local_date()
+        start, end = day_range(hoy)
+        cliente_id = db.session.query(func.min(Cliente.id)).scalar() or 0
+
+        consultas = {
+            "Totales del día (abonos, préstamos, caja por tipo)": consulta_totales_diarios(hoy),
+            "Listado de clientes activos (index)": consulta_clientes_activos(),
+            "Movimientos de un tipo en el día": MovimientoCaja.query.filter(
+                MovimientoCaja.tipo == "gasto",
+                MovimientoCaja.fecha >= start,
+                MovimientoCaja.fecha < end,
+            ),
+            "Préstamo más reciente de un cliente": (
+                Prestamo.query.filter(Prestamo.cliente_id == cliente_id)
+                .order_by(Prestamo.fecha.desc())
+                .limit(1)
+            ),
+            "Liquidación anterior (caja arrastrada)": (
+                Liquidacion.query.filter(Liquidacion.fecha < hoy)
+                .order_by(Liquidacion.fecha.desc())
+                .limit(1)
+            ),
+        }
+
+        dialecto = db.engine.dialect
+        prefijo = "EXPLAIN QUERY PLAN " if dialecto.name == "sqlite" else "EXPLAIN "
+
+        for titulo, consulta in consultas.items():
+            sql = str(
+                consulta.statement.compile(
+                    dialect=dialecto, compile_kwargs={"literal_binds": True}
+                )
+            )
+            click.echo(f"\n=== {titulo} ===")
+            for fila in db.session.execute(text(prefijo + sql)):
+                click.echo("  " + " | ".join(str(c) for c in fila))
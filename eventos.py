@@ -0,0 +1,152 @@
+# ======================================================
+# eventos.py — avisos en vivo al index (Server-Sent Events)
+# ======================================================
+#
+# Pub/sub en memoria del proceso: cada conexión a /eventos tiene su cola y
+# después de cada commit con cambios (invalidacion.al_confirmar_cambios) se
+# deja un aviso en todas. El flujo de cada conexión junta los avisos, arma
+# un delta compacto (solo lo que cambió del resumen + saldos de los clientes
+# tocados) y lo manda como evento "cambio".
+#
+# Los commits de OTRO worker de gunicorn no llegan a esta cola: para esos,
+# cada latido compara estado_global.version y, si cambió, manda el resumen.
+
+import json
+import os
+import queue
+import threading
+import time
+
+from invalidacion import al_confirmar_cambios, version_datos
+
+# Cada conexión abierta ocupa un hilo del worker (gthread) mientras dure.
+# El tope es por proceso (la cola es en memoria): hilos del worker menos una
+# reserva para que abonos y páginas siempre tengan hilo libre. Con el tope
+# lleno /eventos responde 204 y el index pasa a consultar por intervalos.
+HILOS_WORKER = int(os.getenv("GUNICORN_THREADS", "8"))
+HILOS_RESERVADOS = 2
+MAX_SUSCRIPTORES = max(HILOS_WORKER - HILOS_RESERVADOS, 0)
+if os.getenv("EVENTOS_MAX_SUSCRIPTORES"):
+    MAX_SUSCRIPTORES = min(int(os.getenv("EVENTOS_MAX_SUSCRIPTORES")), MAX_SUSCRIPTORES)
+LATIDO_SEGUNDOS = 15
+# Se corta cada tanto: EventSource se reconecta solo y se libera el hilo
+DURACION_MAXIMA_SEGUNDOS = 300
+
+_suscriptores = set()
+_lock = threading.Lock()
+
+
+def suscribir():
+    """Nueva cola de avisos, o None si ya hay demasiadas conexiones abiertas."""
+    with _lock:
+        if len(_suscriptores) >= MAX_SUSCRIPTORES:
+            return None
+        cola = queue.Queue(maxsize=100)
+        _suscriptores.add(cola)
+    return cola
+
+
+def desuscribir(cola):
+    with _lock:
+        _suscriptores.discard(cola)
+
+
+def publicar(aviso):
+    """Deja el aviso en todas las colas (sin bloquear nunca el commit)."""
+    with _lock:
+        colas = list(_suscriptores)
+    for cola in colas:
+        try:
+            cola.put_nowait(aviso)
+        except queue.Full:
+            # Conexión lenta: ya tiene avisos pendientes, el delta se arma igual
+            pass
+
+
+@al_confirmar_cambios
+def _al_confirmar(fechas, clientes):
+    publicar({"clientes": list(clientes)})
+
+
+def _juntar_avisos(cola, primero):
+    """Junta el aviso recibido con los que ya esperan en la cola."""
+    clientes = set(primero["clientes"])
+    while True:
+        try:
+            clientes.update(cola.get_nowait()["clientes"])
+        except queue.Empty:
+            return clientes
+
+
+def _solo_cambios(nuevo, anterior):
+    return {k: v for k, v in nuevo.items() if anterior.get(k) != v}
+
+
+def _evento(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
+
+
+def flujo_eventos(cola):
+    """
+    Generador SSE de una conexión (se usa con stream_with_context).
+    Solo toma conexión de la BD para armar cada delta y la devuelve enseguida.
+    """
+    from extensions import db
+    from helpers import obtener_resumenes_del_dia
+    from modelos import Cliente
+    from tiempo import local_date
+
+    enviado = {"resumen_hoy": {}, "resumen_total": {}}
+    version = None
+    fin = time.monotonic() + DURACION_MAXIMA_SEGUNDOS
+
+    def armar_delta(clientes):
+        nonlocal version
+        version = version_datos()
+        resumenes = obtener_resumenes_del_dia(local_date())
+
+        delta = {}
+        for clave in ("resumen_hoy", "resumen_total"):
+            cambios = _solo_cambios(resumenes[clave], enviado[clave])
+            if cambios:
+                delta[clave] = cambios
+                enviado[clave] = dict(resumenes[clave])
+
+        if clientes:
+            filas = (
+                db.session.query(Cliente.id, Cliente.saldo, Cliente.cancelado)
+                .filter(Cliente.id.in_(clientes))
+                .all()
+            )
+            delta["clientes"] = [
+                {"id": cid, "saldo": round(float(saldo or 0), 2), "cancelado": bool(cancelado)}
+                for cid, saldo, cancelado in filas
+            ]
+        return delta
+
+    try:
+        yield "retry: 3000\n\n"
+        # Estado inicial: la página pudo venir de un 304 o de la copia offline
+        delta = armar_delta(set())
+        db.session.close()
+        yield _evento("cambio", delta)
+
+        while time.monotonic() < fin:
+            try:
+                clientes = _juntar_avisos(cola, cola.get(timeout=LATIDO_SEGUNDOS))
+            except queue.Empty:
+                # Latido: ¿cambió algo en otro worker?
+                actual = version_datos()
+                db.session.close()
+                if actual == version:
+                    yield ": latido\n\n"
+                    continue
+                clientes = set()
+
+            delta = armar_delta(clientes)
+            db.session.close()
+            if delta:
+                yield _evento("cambio", delta)
+    finally:
+        desuscribir(cola)
+        db.session.remove()
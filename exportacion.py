@@ -0,0 +1,97 @@
+# ======================================================
+# exportacion.py — exportar historial a CSV en streaming
+# ======================================================
+#
+# Las filas se leen con yield_per (cursor del lado del servidor en Postgres)
+# y se escriben al CSV de a bloques, así la memoria queda plana aunque se
+# baje un año entero o más.
+
+import csv
+import io
+
+from sqlalchemy import select
+
+from extensions import db
+from modelos import Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion
+
+FILAS_POR_BLOQUE = 1000
+
+
+def _consulta_abonos(inicio, fin):
+    return (
+        select(
+            Abono.id, Abono.fecha, Cliente.codigo, Cliente.nombre,
+            Abono.prestamo_id, Abono.monto,
+        )
+        .join(Prestamo, Abono.prestamo_id == Prestamo.id)
+        .join(Cliente, Prestamo.cliente_id == Cliente.id)
+        .where(Abono.fecha >= inicio, Abono.fecha < fin)
+        .order_by(Abono.fecha, Abono.id)
+    )
+
+
+def _consulta_movimientos(inicio, fin):
+    return (
+        select(
+            MovimientoCaja.id, MovimientoCaja.fecha, MovimientoCaja.tipo,
+            MovimientoCaja.monto, MovimientoCaja.descripcion,
+        )
+        .where(MovimientoCaja.fecha >= inicio, MovimientoCaja.fecha < fin)
+        .order_by(MovimientoCaja.fecha, MovimientoCaja.id)
+    )
+
+
+def _consulta_liquidaciones(inicio, fin):
+    return (
+        select(
+            Liquidacion.fecha, Liquidacion.caja_manual, Liquidacion.entradas,
+            Liquidacion.entradas_caja, Liquidacion.prestamos_hoy,
+            Liquidacion.salidas, Liquidacion.gastos, Liquidacion.caja,
+        )
+        .where(Liquidacion.fecha >= inicio.date(), Liquidacion.fecha < fin.date())
+        .order_by(Liquidacion.fecha)
+    )
+
+
+# tipo -> (encabezados, consulta(inicio, fin)); inicio/fin son datetimes [inicio, fin)
+EXPORTACIONES = {
+    "abonos": (
+        ["id", "fecha", "codigo_cliente", "cliente", "prestamo_id", "monto"],
+        _consulta_abonos,
+    ),
+    "movimientos": (
+        ["id", "fecha", "tipo", "monto", "descripcion"],
+        _consulta_movimientos,
+    ),
+    "liquidaciones": (
+        ["fecha", "caja_anterior", "abonos", "entradas_caja", "prestamos",
+         "salidas", "gastos", "caja"],
+        _consulta_liquidaciones,
+    ),
+}
+
+
+def filas_csv(tipo, inicio, fin):
+    """
+    Generador de texto CSV para `tipo` entre [inicio, fin).
+    Empieza con BOM para que Excel abra bien los acentos.
+    """
+    encabezados, consulta = EXPORTACIONES[tipo]
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def vaciar():
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return texto
+
+    escritor.writerow(encabezados)
+    yield "\ufeff" + vaciar()
+
+    resultado = db.session.execute(
+        consulta(inicio, fin).execution_options(yield_per=FILAS_POR_BLOQUE)
+    )
+    for bloque in resultado.partitions():
+        escritor.writerows(bloque)
+        yield vaciar()
@@ -0,0 +1,43 @@
+# ======================================================
+# gunicorn.conf.py — configuración y hooks del servidor (gunicorn lo carga solo)
+# ======================================================
+
+import glob
+import os
+import tempfile
+
+# Métricas (/metrics): cada worker escribe sus contadores en este directorio
+# y cualquier worker los suma al responder. Se define acá, antes de que los
+# workers importen prometheus_client.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "arquitos_metricas")
+)
+
+
+def on_starting(server):
+    """Directorio de métricas limpio en cada arranque (los contadores vuelven a 0)."""
+    directorio = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(directorio, exist_ok=True)
+    for archivo in glob.glob(os.path.join(directorio, "*.db")):
+        os.remove(archivo)
+
+
+def child_exit(server, worker):
+    """Worker muerto: sus gauges "live" dejan de sumar."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    """Al salir un worker, termina los recálculos encolados antes de cerrar."""
+    from recalculo import detener_recalculos
+
+    detener_recalculos(esperar=True)
+
+
+# Hilos por worker (gthread): las conexiones SSE de /eventos quedan abiertas
+# y no deben acaparar el único hilo de un worker sync. Se deja en el entorno
+# para que eventos.py calcule su tope con el mismo número.
+os.environ.setdefault("GUNICORN_THREADS", "8")
+threads = int(os.environ["GUNICORN_THREADS"])
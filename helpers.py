@@ -4,29 +4,349 @@
 # ======================================================
 
 from datetime import date, datetime, timedelta
-from sqlalchemy import func, case
+from sqlalchemy import func, case, and_, or_, select, union_all
+from sqlalchemy.orm import aliased, contains_eager, lazyload
 from extensions import db
-from modelos import Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion
+from modelos import (
+    Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion,
+    PrestamoArchivado, AbonoArchivado,
+)
 from tiempo import hora_actual, local_date, day_range
 from extensions import cache
+from cartera import cartera_total as obtener_cartera_total
+from codigos import asignar_codigo
+from invalidacion import version_datos
+from metricas import RECALCULOS_LIQUIDACION, DELTAS_LIQUIDACION, CACHE_RESUMEN
 
 
 # ---------------------------------------------------
 # 🔹 Generar código único
 # ---------------------------------------------------
-import random
 def generar_codigo_cliente():
-    """Genera un código numérico único de 6 dígitos para un cliente."""
-    while True:
-        codigo = ''.join(random.choices('0123456789', k=6))
-        if not Cliente.query.filter_by(codigo=codigo).first():
-            return codigo
+    """Siguiente código libre de la secuencia (una sola consulta, ver codigos.py)."""
+    return asignar_codigo()
+
+
+# ---------------------------------------------------
+# 📋 Listado liviano de clientes activos (index)
+# ---------------------------------------------------
+def consulta_clientes_activos():
+    """
+    Arma (sin ejecutar) la consulta del index: clientes activos en orden de
+    ruta con SOLO su préstamo vigente y el último abono de ese préstamo.
+
+    El último abono sale de ROW_NUMBER() sobre los abonos de los préstamos
+    vigentes, así que no se cargan los préstamos ni abonos históricos.
+    Filas: (Cliente, monto_ultimo_abono, fecha_ultimo_abono).
+    """
+    prestamos_vigentes = (
+        db.session.query(Cliente.prestamo_actual_id)
+        .filter(Cliente.cancelado == False, Cliente.prestamo_actual_id.isnot(None))
+    )
+    ranking = (
+        db.session.query(
+            Abono.prestamo_id,
+            Abono.monto,
+            Abono.fecha,
+            func.row_number()
+            .over(
+                partition_by=Abono.prestamo_id,
+                order_by=(Abono.fecha.desc(), Abono.id.desc()),
+            )
+            .label("rn"),
+        )
+        .filter(Abono.prestamo_id.in_(prestamos_vigentes))
+        .subquery()
+    )
+
+    return (
+        db.session.query(Cliente, ranking.c.monto, ranking.c.fecha)
+        .outerjoin(Cliente.prestamo_actual)
+        .outerjoin(
+            ranking,
+            and_(ranking.c.prestamo_id == Cliente.prestamo_actual_id, ranking.c.rn == 1),
+        )
+        .options(
+            contains_eager(Cliente.prestamo_actual).options(lazyload(Prestamo.abonos)),
+            lazyload(Cliente.prestamos),
+        )
+        .filter(Cliente.cancelado == False)
+        .order_by(Cliente.orden.asc().nullsfirst(), Cliente.id.asc())
+    )
+
+
+def listar_clientes_activos():
+    """
+    Clientes activos en orden de ruta (ver consulta_clientes_activos), en una
+    sola consulta. Cada cliente queda con `_ultimo_abono = (monto, fecha)`.
+    """
+    clientes = []
+    for cliente, monto, fecha in consulta_clientes_activos().all():
+        cliente._ultimo_abono = (float(monto or 0.0), fecha)
+        clientes.append(cliente)
+    return clientes
+
+
+# ---------------------------------------------------
+# 📋 Clientes cancelados (por páginas, sin N+1)
+# ---------------------------------------------------
+CANCELADOS_POR_PAGINA = 200
+
+# Orden de la vista: orden de ruta (los sin orden al final) y luego id
+_ORDEN_SIN_VALOR = 2147483647
+
+
+def _filtro_cancelados():
+    return and_(Cliente.cancelado == True, Cliente.saldo <= 0.01)
+
+
+def _renovado():
+    """EXISTS: otro cliente ACTIVO con el mismo código."""
+    otro = aliased(Cliente)
+    return (
+        select(otro.id)
+        .where(otro.codigo == Cliente.codigo, otro.cancelado == False, otro.id != Cliente.id)
+        .exists()
+    )
+
+
+def listar_clientes_cancelados(despues=None, limite: int = CANCELADOS_POR_PAGINA):
+    """
+    Una página de clientes cancelados, ya armada para la vista, en UNA consulta:
+    - último préstamo de cada cliente con ROW_NUMBER() sobre sus préstamos,
+    - último abono de ese préstamo con ROW_NUMBER() sobre sus abonos,
+    - 'renovado' con un EXISTS contra los clientes activos del mismo código.
+    Paginación por llave (keyset): `despues` es la llave (orden, id) del
+    último de la página anterior. Devuelve (filas, llave_siguiente o None).
+    Los clientes sin préstamos no se muestran (igual que antes).
+    """
+    llave_orden = func.coalesce(Cliente.orden, _ORDEN_SIN_VALOR)
+
+    ultimo_prestamo = (
+        select(
+            Prestamo.id.label("prestamo_id"),
+            Prestamo.cliente_id,
+            Prestamo.monto,
+            Prestamo.interes,
+            Prestamo.fecha,
+            func.row_number()
+            .over(
+                partition_by=Prestamo.cliente_id,
+                order_by=(Prestamo.fecha.desc(), Prestamo.id.desc()),
+            )
+            .label("rn"),
+        )
+        .join(Cliente, Cliente.id == Prestamo.cliente_id)
+        .where(_filtro_cancelados())
+        .subquery()
+    )
+    ultimo_abono = (
+        select(
+            Abono.prestamo_id,
+            Abono.monto,
+            func.row_number()
+            .over(
+                partition_by=Abono.prestamo_id,
+                order_by=(Abono.fecha.desc(), Abono.id.desc()),
+            )
+            .label("rn"),
+        )
+        .where(
+            Abono.prestamo_id.in_(
+                select(ultimo_prestamo.c.prestamo_id).where(ultimo_prestamo.c.rn == 1)
+            )
+        )
+        .subquery()
+    )
+
+    consulta = (
+        select(
+            Cliente.id, Cliente.orden, Cliente.codigo, Cliente.nombre, Cliente.saldo,
+            Cliente.ultimo_abono_fecha,
+            ultimo_prestamo.c.monto, ultimo_prestamo.c.interes, ultimo_prestamo.c.fecha,
+            ultimo_abono.c.monto.label("ultimo_abono_monto"),
+            _renovado().label("renovado"),
+            llave_orden.label("llave_orden"),
+        )
+        .join(
+            ultimo_prestamo,
+            and_(ultimo_prestamo.c.cliente_id == Cliente.id, ultimo_prestamo.c.rn == 1),
+        )
+        .outerjoin(
+            ultimo_abono,
+            and_(ultimo_abono.c.prestamo_id == ultimo_prestamo.c.prestamo_id, ultimo_abono.c.rn == 1),
+        )
+        .where(_filtro_cancelados())
+        .order_by(llave_orden.asc(), Cliente.id.asc())
+        .limit(limite + 1)
+    )
+    if despues is not None:
+        orden_previo, id_previo = despues
+        consulta = consulta.where(
+            or_(
+                llave_orden > orden_previo,
+                and_(llave_orden == orden_previo, Cliente.id > id_previo),
+            )
+        )
+
+    resultado = db.session.execute(consulta).all()
+    hay_mas = len(resultado) > limite
+    resultado = resultado[:limite]
+
+    filas = []
+    for r in resultado:
+        fecha_salida = r.ultimo_abono_fecha or r.fecha
+        try:
+            dias = (fecha_salida - r.fecha).days if fecha_salida else 0
+        except TypeError:
+            dias = 0
+
+        filas.append({
+            "id": r.id,
+            "orden": r.orden,
+            "codigo": r.codigo,
+            "dias": dias,
+            "fecha_salida": fecha_salida.strftime("%d-%m-%Y") if fecha_salida else "—",
+            "nombre": r.nombre,
+            "salida_total": r.monto + (r.monto * (r.interes or 0) / 100),
+            "ultimo_abono_monto": float(r.ultimo_abono_monto or 0.0),
+            "saldo": round(r.saldo or 0.0, 2),
+            "renovado": bool(r.renovado),
+        })
+
+    siguiente = (resultado[-1].llave_orden, resultado[-1].id) if hay_mas else None
+    return filas, siguiente
+
+
+def totales_clientes_cancelados():
+    """(total cancelados con préstamos, cuántos renovados) en una consulta."""
+    con_prestamos = select(Prestamo.id).where(Prestamo.cliente_id == Cliente.id).exists()
+    total, renovados = db.session.execute(
+        select(
+            func.count(Cliente.id),
+            func.coalesce(func.sum(case((_renovado(), 1), else_=0)), 0),
+        ).where(_filtro_cancelados(), con_prestamos)
+    ).one()
+    return int(total or 0), int(renovados or 0)
+
+
+# ---------------------------------------------------
+# 💰 Registrar un abono (sin commit)
+# ---------------------------------------------------
+def aplicar_abono(cliente, prestamo, monto: float, hoy: date = None, filas=None, clave=None):
+    """
+    Agrega el Abono y su entrada en caja, y actualiza saldos y estado:
+    - mensual_interes: NO baja saldo, solo quita la alerta de interés.
+    - resto: baja el saldo y cancela al cliente si llega a 0.
+    No hace commit ni toca la liquidación (eso lo hace quien llama).
+    Con `filas` ({"abonos": [], "movimientos": []}) las filas se juntan para
+    un INSERT masivo en vez de agregarse a la sesión una por una.
+    `clave` es la clave de idempotencia que manda el teléfono (opcional).
+    Devuelve el resultado en el formato de la respuesta JSON.
+    """
+    hoy = hoy or local_date()
+    frecuencia = (prestamo.frecuencia or "").lower().strip()
+
+    def _agregar(modelo, clave, **valores):
+        if filas is None:
+            db.session.add(modelo(**valores))
+        else:
+            filas[clave].append(valores)
+
+    _agregar(
+        Abono, "abonos",
+        prestamo_id=prestamo.id,
+        monto=monto,
+        fecha=hora_actual(),
+        clave_idempotencia=clave
+    )
+
+    # ======================================================
+    # ✅ CASO 1: MENSUAL SOLO INTERÉS (NO baja saldo, SÍ quita alerta)
+    # ======================================================
+    if frecuencia == "mensual_interes":
+        _agregar(
+            MovimientoCaja, "movimientos",
+            tipo="entrada_manual",  # cambia si quieres: "interes"
+            monto=monto,
+            descripcion=f"Pago interés mensual (solo interés) de {cliente.nombre}",
+            fecha=hora_actual(),
+            cliente_id=cliente.id,
+            prestamo_id=prestamo.id
+        )
+
+        # ✅ quita la alerta visual
+        cliente.ultimo_interes_fecha = hoy
+
+        # para mostrar "Último abono" en el index
+        cliente.ultimo_abono_fecha = hoy
+
+        return {
+            "ok": True,
+            "cliente_id": cliente.id,
+            "cliente_nombre": cliente.nombre,
+            "saldo": float(cliente.saldo or 0),
+            "cancelado": False,
+            "monto": float(monto),
+            "interes_aplicado": True,
+            "modo": "mensual_interes"
+        }
+
+    # ======================================================
+    # ✅ CASO 2: ABONO NORMAL (SÍ baja saldo)
+    # ======================================================
+
+    # saldo del préstamo (si no existe, usa el del cliente)
+    saldo_cliente = round(float(cliente.saldo or 0), 2)
+    saldo_prestamo = round(float(getattr(prestamo, "saldo", None) or saldo_cliente), 2)
+
+    # aplicar abono
+    nuevo_saldo = round(saldo_prestamo - monto, 2)
+    if nuevo_saldo < 0:
+        nuevo_saldo = 0.0
+
+    # caja
+    _agregar(
+        MovimientoCaja, "movimientos",
+        tipo="entrada_manual",
+        monto=monto,
+        descripcion=f"Abono de {cliente.nombre} (código {cliente.codigo})",
+        fecha=hora_actual(),
+        cliente_id=cliente.id,
+        prestamo_id=prestamo.id
+    )
+
+    # actualizar saldos
+    prestamo.saldo = nuevo_saldo
+    cliente.saldo = nuevo_saldo
+
+    # para index
+    cliente.ultimo_abono_fecha = hoy
+
+    # cancelar si llegó a 0
+    cancelado = False
+    if nuevo_saldo <= 0:
+        prestamo.saldo = 0.0
+        cliente.saldo = 0.0
+        cliente.cancelado = True
+        cancelado = True
+
+    return {
+        "ok": True,
+        "cliente_id": cliente.id,
+        "cliente_nombre": cliente.nombre,
+        "saldo": float(cliente.saldo or 0),
+        "cancelado": cancelado,
+        "monto": float(monto),
+        "interes_aplicado": False,
+        "modo": "normal"
+    }
 
 
 # ---------------------------------------------------
 # 🔹 Crear liquidación arrastrando caja anterior (única oficial)
 # ---------------------------------------------------
-def crear_liquidacion_para_fecha(fecha: date):
+def crear_liquidacion_para_fecha(fecha: date, commit: bool = True):
     """Crea la liquidación para una fecha determinada arrastrando la caja del día anterior."""
     liq_existente = Liquidacion.query.filter_by(fecha=fecha).first()
     if liq_existente:
@@ -44,7 +364,10 @@ def crear_liquidacion_para_fecha(fecha: date):
         caja=caja_anterior
     )
     db.session.add(nueva)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return nueva
 
 
@@ -56,20 +379,18 @@ def obtener_resumen_total():
     Resumen oficial del sistema:
     - caja_total: la caja de HOY según la liquidación
       (caja_anterior + abonos + entradas_manual - (prestamos + salidas + gastos))
-    - cartera_total: suma de saldos de préstamos activos
+    - cartera_total: suma de saldos de préstamos (mantenida, ver cartera.py)
     """
     hoy = local_date()
 
-    # Nos aseguramos de tener la liquidación del día actual recalculada
-    liq_hoy = actualizar_liquidacion_por_movimiento(hoy, commit=True)
+    # Liquidación de hoy tal como la mantiene el libro incremental
+    liq_hoy = obtener_liquidacion_del_dia(hoy, commit=True)
 
     # 👉 Caja oficial del sistema = caja calculada en la liquidación de hoy
     caja_total = float(liq_hoy.caja or 0.0)
 
-    # Cartera total (igual que antes)
-    cartera_total = float(
-        db.session.query(func.coalesce(func.sum(Prestamo.saldo), 0)).scalar() or 0.0
-    )
+    # Cartera total mantenida (cartera.py), sin recorrer toda la tabla
+    cartera_total = obtener_cartera_total()
 
     return {
         "caja_total": caja_total,
@@ -77,58 +398,102 @@ def obtener_resumen_total():
     }
 
 
-def actualizar_liquidacion_por_movimiento(fecha: date, commit: bool = True):
-    start, end = day_range(fecha)
+# ---------------------------------------------------
+# 📊 Totales del día en una sola consulta
+# ---------------------------------------------------
+# El préstamo entregado se suma desde Prestamo, no desde el movimiento "prestamo"
+TIPOS_MOVIMIENTO_CAJA = ("entrada_manual", "salida", "gasto", "prestamo_revertido")
 
-    # 💰 Entradas por abonos
-    entradas_abonos = (
-        db.session.query(func.coalesce(func.sum(Abono.monto), 0))
-        .filter(Abono.fecha >= start, Abono.fecha < end)
-        .scalar() or 0.0
-    )
 
-    # 💵 Entradas manuales
-    entradas_manual = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0))
-        .filter(
-            MovimientoCaja.tipo == 'entrada_manual',
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end
-        )
-        .scalar() or 0.0
-    )
+# ---------------------------------------------------
+# 🗄️ Abonos y préstamos incluyendo los archivados (archivo.py)
+# ---------------------------------------------------
+# Archivar saca filas de las tablas calientes, pero el dinero ya entró a
+# caja: todo recálculo de liquidación suma también las tablas de archivo.
+def abonos_con_archivo(inicio: datetime, fin: datetime):
+    """Subconsulta (fecha, monto) de abonos vivos y archivados en [inicio, fin)."""
+    return union_all(
+        select(Abono.fecha, Abono.monto)
+        .where(Abono.fecha >= inicio, Abono.fecha < fin),
+        select(AbonoArchivado.fecha, AbonoArchivado.monto)
+        .where(AbonoArchivado.fecha >= inicio, AbonoArchivado.fecha < fin),
+    ).subquery()
 
-    # 💸 Salidas manuales
-    salidas_manual = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0))
-        .filter(
-            MovimientoCaja.tipo == 'salida',
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end
-        )
-        .scalar() or 0.0
-    )
 
-    # 🧾 Gastos
-    gastos = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0))
-        .filter(
-            MovimientoCaja.tipo == 'gasto',
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end
+def prestamos_con_archivo(desde: date, hasta: date):
+    """Subconsulta (fecha, monto) de préstamos vivos y archivados en [desde, hasta]."""
+    return union_all(
+        select(Prestamo.fecha, Prestamo.monto)
+        .where(Prestamo.fecha >= desde, Prestamo.fecha <= hasta),
+        select(PrestamoArchivado.fecha, PrestamoArchivado.monto)
+        .where(PrestamoArchivado.fecha >= desde, PrestamoArchivado.fecha <= hasta),
+    ).subquery()
+
+
+def consulta_totales_diarios(fecha: date):
+    """Arma (sin ejecutar) la consulta única de totales del día."""
+    start, end = day_range(fecha)
+
+    sub_abonos = abonos_con_archivo(start, end)
+    abonos = select(func.coalesce(func.sum(sub_abonos.c.monto), 0)).scalar_subquery()
+    sub_prestamos = prestamos_con_archivo(fecha, fecha)
+    prestamos = select(func.coalesce(func.sum(sub_prestamos.c.monto), 0)).scalar_subquery()
+    por_tipo = [
+        func.coalesce(
+            func.sum(case((MovimientoCaja.tipo == tipo, MovimientoCaja.monto), else_=0)), 0
         )
-        .scalar() or 0.0
+        for tipo in TIPOS_MOVIMIENTO_CAJA
+    ]
+
+    return (
+        db.session.query(abonos, prestamos, *por_tipo)
+        .filter(MovimientoCaja.fecha >= start, MovimientoCaja.fecha < end)
     )
 
-    # 💳 Préstamos entregados — ahora desde Prestamo
-    prestamos_entregados = (
-        db.session.query(func.coalesce(func.sum(Prestamo.monto), 0))
-        .filter(
-            Prestamo.fecha >= start,
-            Prestamo.fecha < end
+
+def totales_diarios(fecha: date):
+    """
+    Devuelve todos los totales de un día con UNA sola consulta:
+    abonos y préstamos como subconsultas escalares y los movimientos de caja
+    con SUM(CASE ...) por tipo.
+
+    Claves: abonos, entrada_manual, salida, gasto, prestamo, prestamo_revertido.
+    "prestamo" es el monto entregado según la tabla Prestamo (igual que la liquidación).
+    """
+    fila = consulta_totales_diarios(fecha).one()
+
+    totales = {"abonos": float(fila[0] or 0.0), "prestamo": float(fila[1] or 0.0)}
+    for tipo, valor in zip(TIPOS_MOVIMIENTO_CAJA, fila[2:]):
+        totales[tipo] = float(valor or 0.0)
+    return totales
+
+
+def actualizar_liquidacion_por_movimiento(fecha: date, commit: bool = True):
+    """
+    Reconstrucción COMPLETA de la liquidación de un día: vuelve a sumar
+    abonos, movimientos de caja y préstamos. Las rutas de escritura usan
+    aplicar_delta_liquidacion(); esto queda para recálculos explícitos.
+    """
+    RECALCULOS_LIQUIDACION.inc()
+
+    # 🔒 Crear (si falta) y bloquear la fila del día ANTES de sumar: un
+    # aplicar_delta_liquidacion concurrente espera y suma encima, en vez de
+    # que el recálculo pise el delta (SELECT ... FOR UPDATE en Postgres)
+    liq = crear_liquidacion_para_fecha(fecha, commit=commit)
+    if liq.id is not None:
+        liq = (
+            Liquidacion.query.filter(Liquidacion.id == liq.id)
+            .with_for_update()
+            .populate_existing()
+            .one()
         )
-        .scalar() or 0.0
-    )
+
+    totales = totales_diarios(fecha)
+    entradas_abonos = totales["abonos"]
+    entradas_manual = totales["entrada_manual"]
+    salidas_manual = totales["salida"]
+    gastos = totales["gasto"]
+    prestamos_entregados = totales["prestamo"]
 
     # 📦 Caja anterior
     liq_anterior = (
@@ -138,9 +503,6 @@ def actualizar_liquidacion_por_movimiento(fecha: date, commit: bool = True):
     )
     caja_anterior = liq_anterior.caja if liq_anterior else 0.0
 
-    # 🔄 Crear o actualizar registro de liquidación
-    liq = crear_liquidacion_para_fecha(fecha)
-
     liq.entradas = entradas_abonos
     liq.entradas_caja = entradas_manual
     liq.salidas = salidas_manual
@@ -160,15 +522,272 @@ def actualizar_liquidacion_por_movimiento(fecha: date, commit: bool = True):
     return liq
 
 
+# ---------------------------------------------------
+# 🔁 Reconstrucción por rango (una consulta por tabla)
+# ---------------------------------------------------
+def _como_fecha(valor):
+    """func.date() devuelve date en Postgres y texto 'YYYY-MM-DD' en SQLite."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    return valor
+
+
+def rebuild_liquidaciones(desde: date, hasta: date = None, commit: bool = True):
+    """
+    Reconstruye todas las liquidaciones entre `desde` y `hasta` (hoy por defecto).
+
+    En vez de recalcular día por día, suma el rango completo con un GROUP BY
+    por tabla (abonos y préstamos incluyen los archivados, movimientos de
+    caja), arrastra la caja con
+    una suma acumulada a partir de la última liquidación anterior a `desde`
+    y guarda todas las filas en un solo flush/commit.
+    """
+    hasta = hasta or local_date()
+    if desde > hasta:
+        return []
+
+    inicio, _ = day_range(desde)
+    _, fin = day_range(hasta)
+
+    # 🔒 Bloquear las filas del rango ANTES de sumar (igual que
+    # actualizar_liquidacion_por_movimiento): un aplicar_delta_liquidacion
+    # concurrente espera a este commit y suma encima, en vez de que estos
+    # totales absolutos pisen su delta. La de hoy se crea si falta para
+    # poder bloquearla (SELECT ... FOR UPDATE en Postgres).
+    hoy = local_date()
+    if desde <= hoy <= hasta:
+        crear_liquidacion_para_fecha(hoy, commit=commit)
+    existentes = {
+        l.fecha: l
+        for l in Liquidacion.query.filter(
+            Liquidacion.fecha >= desde, Liquidacion.fecha <= hasta
+        )
+        .order_by(Liquidacion.fecha.asc())
+        .with_for_update()
+        .populate_existing()
+    }
+
+    # 💰 Abonos por día (vivos + archivados)
+    sub_abonos = abonos_con_archivo(inicio, fin)
+    dia_abono = func.date(sub_abonos.c.fecha)
+    abonos = {
+        _como_fecha(dia): float(total or 0.0)
+        for dia, total in db.session.query(dia_abono, func.sum(sub_abonos.c.monto))
+        .group_by(dia_abono)
+    }
+
+    # 💵 Movimientos de caja por día y tipo
+    dia_mov = func.date(MovimientoCaja.fecha)
+    movimientos = {}
+    for dia, tipo, total in (
+        db.session.query(dia_mov, MovimientoCaja.tipo, func.sum(MovimientoCaja.monto))
+        .filter(
+            MovimientoCaja.tipo.in_(tuple(CAMPO_LIQUIDACION_POR_TIPO)),
+            MovimientoCaja.fecha >= inicio,
+            MovimientoCaja.fecha < fin,
+        )
+        .group_by(dia_mov, MovimientoCaja.tipo)
+    ):
+        movimientos[(_como_fecha(dia), tipo)] = float(total or 0.0)
+
+    # 💳 Préstamos entregados por día (vivos + archivados)
+    sub_prestamos = prestamos_con_archivo(desde, hasta)
+    prestamos = {
+        _como_fecha(dia): float(total or 0.0)
+        for dia, total in db.session.query(sub_prestamos.c.fecha, func.sum(sub_prestamos.c.monto))
+        .group_by(sub_prestamos.c.fecha)
+    }
+
+    # 📦 Caja arrastrada desde antes del rango
+    liq_anterior = (
+        Liquidacion.query.filter(Liquidacion.fecha < desde)
+        .order_by(Liquidacion.fecha.desc())
+        .first()
+    )
+    caja = float(liq_anterior.caja or 0.0) if liq_anterior else 0.0
+
+    resultado = []
+    nuevas = []
+    dia = desde
+    while dia <= hasta:
+        liq = existentes.get(dia)
+        if liq is None:
+            liq = Liquidacion(fecha=dia)
+            nuevas.append(liq)
+
+        liq.entradas = abonos.get(dia, 0.0)
+        liq.entradas_caja = movimientos.get((dia, "entrada_manual"), 0.0)
+        liq.salidas = movimientos.get((dia, "salida"), 0.0)
+        liq.gastos = movimientos.get((dia, "gasto"), 0.0)
+        liq.prestamos_hoy = prestamos.get(dia, 0.0)
+
+        # Suma acumulada: la caja de ayer es la caja inicial de hoy
+        liq.caja_manual = caja
+        caja = (
+            caja
+            + liq.entradas
+            + liq.entradas_caja
+            - (liq.prestamos_hoy + liq.salidas + liq.gastos)
+        )
+        liq.caja = caja
+
+        resultado.append(liq)
+        dia += timedelta(days=1)
+
+    db.session.add_all(nuevas)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+
+    return resultado
+
 
 # ---------------------------------------------------
-# ♻️ Cache resumen
+# ➕ Libro incremental de la liquidación de HOY
 # ---------------------------------------------------
-def eliminar_cache_resumen_hoy():
+# Tipo de MovimientoCaja → columna de Liquidacion que lo acumula
+# ("prestamo" y "prestamo_revertido" no entran: el préstamo se cuenta desde Prestamo)
+CAMPO_LIQUIDACION_POR_TIPO = {
+    "entrada_manual": "entradas_caja",
+    "salida": "salidas",
+    "gasto": "gastos",
+}
+
+
+def delta_por_movimiento(tipo: str, monto: float):
+    """Devuelve el delta de liquidación que produce un movimiento de caja."""
+    campo = CAMPO_LIQUIDACION_POR_TIPO.get(tipo)
+    return {campo: float(monto or 0.0)} if campo else {}
+
+
+def obtener_liquidacion_del_dia(fecha: date = None, commit: bool = True):
     """
-    Elimina el cache del resumen diario basado en la fecha actual en Chile.
-    Esto asegura que los cambios en abonos, préstamos o caja se reflejen correctamente.
+    Lee la liquidación del día sin recalcularla.
+    Solo si todavía no existe (primer acceso del día) se reconstruye completa.
+    """
+    fecha = fecha or local_date()
+    liq = Liquidacion.query.filter_by(fecha=fecha).first()
+    if liq is None:
+        liq = actualizar_liquidacion_por_movimiento(fecha, commit=commit)
+    return liq
+
+
+def aplicar_delta_liquidacion(
+    entradas: float = 0.0,
+    entradas_caja: float = 0.0,
+    salidas: float = 0.0,
+    gastos: float = 0.0,
+    prestamos_hoy: float = 0.0,
+):
+    """
+    Suma (o resta, con montos negativos) un movimiento a la liquidación de HOY
+    con un único UPDATE atómico, sin volver a escanear las tablas.
+
+    Corre dentro de la transacción de la ruta: el commit lo hace quien llama.
+    Si la liquidación de hoy aún no existe se reconstruye completa; por eso el
+    movimiento debe estar ya agregado a la sesión (se hace flush aquí).
     """
     hoy = local_date()
-    clave = f"resumen_{hoy.isoformat()}"
-    cache.delete(clave)
+    db.session.flush()
+
+    caja = entradas + entradas_caja - (prestamos_hoy + salidas + gastos)
+    actualizadas = (
+        Liquidacion.query.filter(Liquidacion.fecha == hoy)
+        .update(
+            {
+                Liquidacion.entradas: func.coalesce(Liquidacion.entradas, 0) + entradas,
+                Liquidacion.entradas_caja: func.coalesce(Liquidacion.entradas_caja, 0) + entradas_caja,
+                Liquidacion.salidas: func.coalesce(Liquidacion.salidas, 0) + salidas,
+                Liquidacion.gastos: func.coalesce(Liquidacion.gastos, 0) + gastos,
+                Liquidacion.prestamos_hoy: func.coalesce(Liquidacion.prestamos_hoy, 0) + prestamos_hoy,
+                Liquidacion.caja: func.coalesce(Liquidacion.caja, 0) + caja,
+            },
+            synchronize_session=False,
+        )
+    )
+
+    if not actualizadas:
+        # Primer movimiento del día: la reconstrucción ya incluye este movimiento
+        actualizar_liquidacion_por_movimiento(hoy, commit=False)
+        return
+    DELTAS_LIQUIDACION.inc()
+
+    # El UPDATE no toca objetos ya cargados en la sesión
+    for obj in db.session.identity_map.values():
+        if isinstance(obj, Liquidacion) and obj.fecha == hoy:
+            db.session.expire(obj)
+
+
+def delta_por_eliminacion(prestamos, movimientos=()):
+    """
+    Delta (negativo) que resulta de borrar préstamos —con sus abonos— y
+    movimientos de caja. Solo cuenta lo registrado HOY, igual que la
+    liquidación del día.
+    """
+    hoy = local_date()
+    start, end = day_range(hoy)
+    delta = {"entradas": 0.0, "prestamos_hoy": 0.0}
+
+    for p in prestamos:
+        if p.fecha == hoy:
+            delta["prestamos_hoy"] -= float(p.monto or 0.0)
+        for a in p.abonos:
+            if a.fecha and start <= a.fecha < end:
+                delta["entradas"] -= float(a.monto or 0.0)
+
+    for m in movimientos:
+        if m.fecha and start <= m.fecha < end:
+            for campo, monto in delta_por_movimiento(m.tipo, m.monto).items():
+                delta[campo] = delta.get(campo, 0.0) - monto
+
+    return delta
+
+
+# ---------------------------------------------------
+# ♻️ Cache resumen (compartido entre workers: ver CACHE_TYPE en app.py)
+# ---------------------------------------------------
+# La clave incluye la fecha y estado_global.version leída ANTES de calcular:
+# si una escritura confirma mientras otro request arma el resumen, ese
+# resultado queda guardado bajo la versión vieja y nadie lo vuelve a leer.
+# Cada commit sube la versión, así que no hace falta borrar nada; el timeout
+# corto solo limpia las entradas de versiones ya superadas.
+CACHE_TIMEOUT_RESUMEN = 10 * 60
+
+
+def clave_cache_resumen(fecha: date, version):
+    return f"resumen_{fecha.isoformat()}_v{version}"
+
+
+def obtener_resumenes_del_dia(fecha: date = None):
+    """
+    Resúmenes de la tarjeta del index (resumen_hoy + resumen_total).
+    Se leen del cache compartido; si no están, se calculan y se guardan.
+    """
+    fecha = fecha or local_date()
+    clave = clave_cache_resumen(fecha, version_datos())
+
+    data = cache.get(clave)
+    if data is not None:
+        CACHE_RESUMEN.labels("hit").inc()
+        return data
+    CACHE_RESUMEN.labels("miss").inc()
+
+    liq_hoy = obtener_liquidacion_del_dia(fecha, commit=True)
+    data = {
+        "resumen_hoy": {
+            "entradas": liq_hoy.entradas,
+            "entradas_caja": liq_hoy.entradas_caja,
+            "prestamos_hoy": liq_hoy.prestamos_hoy,
+            "salidas": liq_hoy.salidas,
+            "gastos": liq_hoy.gastos,
+            "caja_manual": liq_hoy.caja_manual,
+            "caja": liq_hoy.caja,
+        },
+        "resumen_total": obtener_resumen_total(),
+    }
+    cache.set(clave, data, timeout=CACHE_TIMEOUT_RESUMEN)
+    return data
+
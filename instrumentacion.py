@@ -0,0 +1,177 @@
+# ======================================================
+# instrumentacion.py — consultas SQL por petición (opcional)
+# ======================================================
+#
+# Se activa con SQL_INSTRUMENTACION=1. Para cada petición cuenta las
+# consultas, suma su tiempo en la BD y guarda las más lentas:
+#
+# - Header Server-Timing (se ve en la pestaña Network del navegador):
+#     Server-Timing: db;dur=12.3;desc="8 consultas", app;dur=40.1
+# - Log de consultas lentas (>= SQL_LENTA_MS), con muestreo
+#   (SQL_LENTA_MUESTREO, 0..1) y el SQL normalizado (sin valores).
+# - Resumen en memoria por endpoint (/diagnostico/sql). Es por proceso:
+#   cada worker de gunicorn tiene el suyo.
+#
+# Las consultas fuera de una petición (hilo de recálculo, comandos) no se
+# cuentan.
+
+import heapq
+import os
+import random
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", "100"))
+SQL_LENTA_MUESTREO = float(os.getenv("SQL_LENTA_MUESTREO", "1.0"))
+LENTAS_POR_PETICION = 5
+LENTAS_POR_ENDPOINT = 5
+
+_resumen = {}
+_lock = threading.Lock()
+_activa = False
+
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTA = re.compile(r"\(\s*(?:\?|%\([^)]*\)s|%s)(?:\s*,\s*(?:\?|%\([^)]*\)s|%s))+\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_sql(sql):
+    """SQL sin valores ni listas largas: misma forma → misma línea en el log."""
+    sql = _RE_TEXTO.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_LISTA.sub("(...)", sql)
+    return _RE_ESPACIOS.sub(" ", sql).strip()
+
+
+def instrumentacion_activa():
+    return _activa
+
+
+# ---------------------------------------------------
+# 🔌 Eventos del engine
+# ---------------------------------------------------
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_inicio_sql", []).append(time.perf_counter())
+
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    pila = conn.info.get("_inicio_sql")
+    if not pila:
+        return
+    duracion = (time.perf_counter() - pila.pop()) * 1000
+    if not has_request_context():
+        return
+    datos = g.get("_sql")
+    if datos is None:
+        return
+
+    datos["consultas"] += 1
+    datos["tiempo_ms"] += duracion
+    # Las N más lentas de la petición (heap mínimo por duración)
+    lentas = datos["lentas"]
+    if len(lentas) < LENTAS_POR_PETICION:
+        heapq.heappush(lentas, (duracion, statement))
+    elif duracion > lentas[0][0]:
+        heapq.heapreplace(lentas, (duracion, statement))
+
+    if duracion >= SQL_LENTA_MS and random.random() < SQL_LENTA_MUESTREO:
+        print(
+            f"[SQL LENTA] {duracion:.1f} ms {request.endpoint or request.path} "
+            f"{'(executemany) ' if executemany else ''}{normalizar_sql(statement)}"
+        )
+
+
+def _error_al_ejecutar(contexto):
+    # La consulta falló: after_cursor_execute no va a correr
+    conn = contexto.connection
+    if conn is not None and conn.info.get("_inicio_sql"):
+        conn.info["_inicio_sql"].pop()
+
+
+# ---------------------------------------------------
+# 🌐 Hooks de Flask
+# ---------------------------------------------------
+def _al_empezar_peticion():
+    g._sql = {"consultas": 0, "tiempo_ms": 0.0, "lentas": []}
+    g._sql_inicio = time.perf_counter()
+
+
+def _al_terminar_peticion(response):
+    datos = g.pop("_sql", None)
+    if datos is None:
+        return response
+    total_ms = (time.perf_counter() - g.pop("_sql_inicio")) * 1000
+
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={datos["tiempo_ms"]:.1f};desc="{datos["consultas"]} consultas", '
+        f"app;dur={total_ms:.1f}",
+    )
+    _acumular(request.endpoint or "sin_endpoint", datos, total_ms)
+    return response
+
+
+def _acumular(endpoint, datos, total_ms):
+    with _lock:
+        r = _resumen.setdefault(endpoint, {
+            "peticiones": 0,
+            "consultas": 0,
+            "max_consultas": 0,
+            "db_ms": 0.0,
+            "total_ms": 0.0,
+            "lentas": [],
+        })
+        r["peticiones"] += 1
+        r["consultas"] += datos["consultas"]
+        r["max_consultas"] = max(r["max_consultas"], datos["consultas"])
+        r["db_ms"] += datos["tiempo_ms"]
+        r["total_ms"] += total_ms
+        for duracion, sql in datos["lentas"]:
+            fila = (duracion, normalizar_sql(sql))
+            if len(r["lentas"]) < LENTAS_POR_ENDPOINT:
+                heapq.heappush(r["lentas"], fila)
+            elif duracion > r["lentas"][0][0]:
+                heapq.heapreplace(r["lentas"], fila)
+
+
+def resumen_por_endpoint():
+    """Promedios y consultas más lentas por endpoint (este proceso)."""
+    with _lock:
+        copia = {k: dict(v, lentas=list(v["lentas"])) for k, v in _resumen.items()}
+
+    resultado = {}
+    for endpoint, r in sorted(copia.items(), key=lambda kv: -kv[1]["db_ms"]):
+        n = r["peticiones"] or 1
+        resultado[endpoint] = {
+            "peticiones": r["peticiones"],
+            "consultas_promedio": round(r["consultas"] / n, 1),
+            "consultas_max": r["max_consultas"],
+            "db_ms_promedio": round(r["db_ms"] / n, 2),
+            "total_ms_promedio": round(r["total_ms"] / n, 2),
+            "mas_lentas": [
+                {"ms": round(d, 2), "sql": sql}
+                for d, sql in sorted(r["lentas"], reverse=True)
+            ],
+        }
+    return resultado
+
+
+def iniciar_instrumentacion(app):
+    """Registra eventos y hooks si SQL_INSTRUMENTACION está activa."""
+    global _activa
+    if os.getenv("SQL_INSTRUMENTACION", "").lower() not in ("1", "true", "si", "sí"):
+        return
+    if _activa:
+        return
+    _activa = True
+    event.listen(Engine, "before_cursor_execute", _antes_de_ejecutar)
+    event.listen(Engine, "after_cursor_execute", _despues_de_ejecutar)
+    event.listen(Engine, "handle_error", _error_al_ejecutar)
+    app.before_request(_al_empezar_peticion)
+    app.after_request(_al_terminar_peticion)
@@ -0,0 +1,169 @@
+# ======================================================
+# invalidacion.py — invalidación central de caches (eventos SQLAlchemy)
+# ======================================================
+#
+# Durante la transacción (after_flush) se anotan las fechas y clientes
+# tocados por Abono, MovimientoCaja, Prestamo, Cliente y Liquidacion.
+# Recién después del commit (after_commit) se borran exactamente esas
+# entradas del cache, así nadie vuelve a cachear datos sin confirmar.
+# Los resúmenes del día no se borran: su clave lleva la versión (ver
+# clave_cache_resumen en helpers.py) y el commit ya la dejó obsoleta.
+# Si hay rollback, lo anotado se descarta.
+#
+# En la misma transacción se sube estado_global.version: es el token barato
+# que usan los ETag de "/" y del historial (una consulta, sin tocar el ORM).
+# El UPDATE va como ÚLTIMA escritura, justo antes del commit (before_commit):
+# la fila id=1 queda bloqueada solo un instante y siempre después de
+# liquidacion, igual en las rutas que en el recálculo (sin deadlocks).
+
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from extensions import cache
+from modelos import Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion, EstadoGlobal
+from tiempo import local_date
+
+_CLAVE_PENDIENTE = "invalidacion_pendiente"
+_CLAVE_VERSION = "version_incrementada"
+_MODELOS_VERSIONADOS = (Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion)
+
+# Funciones extra llamadas tras cada commit con cambios: f(fechas, clientes)
+_oyentes = []
+
+
+def al_confirmar_cambios(funcion):
+    """Registra una función(fechas, clientes) que corre después de cada commit con cambios."""
+    _oyentes.append(funcion)
+    return funcion
+
+
+def clave_cache_historial(cliente_id):
+    return f"historial_{cliente_id}"
+
+
+def version_datos():
+    """Versión actual de los datos (None si la fila aún no existe)."""
+    from extensions import db
+
+    return db.session.execute(
+        select(EstadoGlobal.version).where(EstadoGlobal.id == 1)
+    ).scalar()
+
+
+def _incrementar_version(session):
+    """Marca la transacción: la versión sube UNA vez, al confirmar."""
+    session.info[_CLAVE_VERSION] = True
+
+
+def _como_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return None
+
+
+def _anotar(session, obj, fechas, clientes):
+    """Anota qué fechas y clientes afecta un objeto nuevo, modificado o borrado."""
+    hoy = local_date()
+
+    if isinstance(obj, Abono):
+        fechas.add(_como_fecha(obj.fecha) or hoy)
+        if obj.prestamo_id is not None:
+            prestamo = session.get(Prestamo, obj.prestamo_id)
+            if prestamo is not None:
+                clientes.add(prestamo.cliente_id)
+
+    elif isinstance(obj, MovimientoCaja):
+        fechas.add(_como_fecha(obj.fecha) or hoy)
+
+    elif isinstance(obj, Prestamo):
+        # El saldo del préstamo entra en la cartera de hoy
+        fechas.add(hoy)
+        fechas.add(_como_fecha(obj.fecha) or hoy)
+        clientes.add(obj.cliente_id)
+
+    elif isinstance(obj, Cliente):
+        clientes.add(obj.id)
+
+    elif isinstance(obj, Liquidacion):
+        fechas.add(obj.fecha)
+
+
+def _pendiente(session):
+    return session.info.setdefault(
+        _CLAVE_PENDIENTE, {"fechas": set(), "clientes": set()}
+    )
+
+
+def anotar_cambios(session, fechas=(), clientes=()):
+    """
+    Anota a mano fechas/clientes para invalidar tras el commit.
+    Para escrituras que no pasan por el flush del ORM (INSERT masivo con executemany).
+    """
+    pendiente = _pendiente(session)
+    pendiente["fechas"].update(fechas)
+    pendiente["clientes"].update(clientes)
+    _incrementar_version(session)
+
+
+@event.listens_for(Session, "after_flush")
+def _despues_de_flush(session, flush_context):
+    pendiente = _pendiente(session)
+    versionar = False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        _anotar(session, obj, pendiente["fechas"], pendiente["clientes"])
+        versionar = versionar or isinstance(obj, _MODELOS_VERSIONADOS)
+    if versionar:
+        _incrementar_version(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_de_commit(session):
+    # Lo que quede sin flush se escribe primero: el UPDATE de la versión
+    # tiene que ser lo último de la transacción
+    session.flush()
+    if not session.info.pop(_CLAVE_VERSION, False):
+        return
+    # La fila id=1 la crean la migración o cartera.asegurar_estado_global()
+    session.connection().execute(
+        update(EstadoGlobal)
+        .where(EstadoGlobal.id == 1)
+        .values(version=EstadoGlobal.version + 1)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _despues_de_commit(session):
+    session.info.pop(_CLAVE_VERSION, None)
+    pendiente = session.info.pop(_CLAVE_PENDIENTE, None)
+    if not pendiente:
+        return
+
+    fechas = {f for f in pendiente["fechas"] if f}
+    clientes = {c for c in pendiente["clientes"] if c is not None}
+    if fechas or clientes:
+        invalidar(fechas, clientes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _despues_de_rollback(session):
+    session.info.pop(_CLAVE_PENDIENTE, None)
+    session.info.pop(_CLAVE_VERSION, None)
+
+
+def invalidar(fechas, clientes):
+    """Borra los historiales de esos clientes y avisa a los oyentes."""
+    claves = [clave_cache_historial(c) for c in clientes]
+
+    try:
+        if claves:
+            cache.delete_many(*claves)
+        for oyente in _oyentes:
+            oyente(fechas, clientes)
+    except Exception as e:
+        # Nunca romper la respuesta por el cache: como mucho queda viejo
+        current_app.logger.error(f"[INVALIDACION] Error: {e}")
@@ -0,0 +1,141 @@
+# ======================================================
+# metricas.py — métricas Prometheus (/metrics)
+# ======================================================
+#
+# - Peticiones por endpoint del blueprint: cantidad, latencia (histograma)
+#   y errores (respuestas 5xx).
+# - Pool de conexiones de SQLAlchemy: conexiones en uso, overflow y checkouts.
+# - Caminos calientes: recálculos completos de liquidación, deltas aplicados
+#   y aciertos/fallos del caché de resúmenes.
+#
+# Con gunicorn cada worker es un proceso: gunicorn.conf.py define
+# PROMETHEUS_MULTIPROC_DIR y cada worker escribe sus valores en archivos de
+# ese directorio; /metrics los suma todos (MultiProcessCollector). Sin esa
+# variable (flask run) se usa el registro en memoria del proceso.
+
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+BUCKETS_LATENCIA = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PETICIONES = Counter(
+    "arquitos_peticiones_total",
+    "Peticiones HTTP atendidas",
+    ["endpoint", "metodo", "estado"],
+)
+LATENCIA = Histogram(
+    "arquitos_peticion_segundos",
+    "Duración de la petición hasta tener la respuesta (sin el cuerpo en streaming)",
+    ["endpoint"],
+    buckets=BUCKETS_LATENCIA,
+)
+ERRORES = Counter(
+    "arquitos_errores_total",
+    "Respuestas 5xx por endpoint",
+    ["endpoint"],
+)
+
+POOL_EN_USO = Gauge(
+    "arquitos_pool_conexiones_en_uso",
+    "Conexiones del pool tomadas ahora mismo (suma de workers vivos)",
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "arquitos_pool_overflow",
+    "Conexiones abiertas por encima de pool_size (suma de workers vivos)",
+    multiprocess_mode="livesum",
+)
+POOL_CHECKOUTS = Counter(
+    "arquitos_pool_checkouts_total",
+    "Veces que se tomó una conexión del pool",
+)
+
+RECALCULOS_LIQUIDACION = Counter(
+    "arquitos_recalculos_liquidacion_total",
+    "Reconstrucciones completas de la liquidación de un día",
+)
+DELTAS_LIQUIDACION = Counter(
+    "arquitos_deltas_liquidacion_total",
+    "Deltas aplicados a la liquidación del día (camino normal de escritura)",
+)
+CACHE_RESUMEN = Counter(
+    "arquitos_cache_resumen_total",
+    "Lecturas del caché de resúmenes del index",
+    ["resultado"],
+)
+
+
+# ---------------------------------------------------
+# 🔌 Pool de conexiones
+# ---------------------------------------------------
+def _overflow(pool):
+    # StaticPool / SingletonThreadPool (SQLite en memoria) no tienen overflow
+    overflow = getattr(pool, "overflow", None)
+    return max(overflow(), 0) if overflow else 0
+
+
+def _escuchar_pool(engine):
+    def al_tomar(dbapi_con, registro, proxy):
+        POOL_CHECKOUTS.inc()
+        POOL_EN_USO.inc()
+        POOL_OVERFLOW.set(_overflow(engine.pool))
+
+    def al_devolver(dbapi_con, registro):
+        POOL_EN_USO.dec()
+        POOL_OVERFLOW.set(_overflow(engine.pool))
+
+    # Sobre el engine: si se hace dispose(), el pool nuevo hereda los eventos
+    event.listen(engine, "checkout", al_tomar)
+    event.listen(engine, "checkin", al_devolver)
+
+
+# ---------------------------------------------------
+# 🌐 Peticiones
+# ---------------------------------------------------
+def _al_empezar_peticion():
+    g._metricas_inicio = time.perf_counter()
+
+
+def _al_terminar_peticion(response):
+    inicio = g.pop("_metricas_inicio", None)
+    if inicio is None:
+        return response
+    endpoint = request.endpoint or "sin_endpoint"
+    LATENCIA.labels(endpoint).observe(time.perf_counter() - inicio)
+    PETICIONES.labels(endpoint, request.method, str(response.status_code)).inc()
+    if response.status_code >= 500:
+        ERRORES.labels(endpoint).inc()
+    return response
+
+
+def iniciar_metricas(app):
+    """Hooks de petición y eventos del pool (después de db.init_app)."""
+    from extensions import db
+
+    app.before_request(_al_empezar_peticion)
+    app.after_request(_al_terminar_peticion)
+    with app.app_context():
+        _escuchar_pool(db.engine)
+
+
+def generar_metricas():
+    """(texto, content_type) para /metrics, sumando todos los workers."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
@@ -0,0 +1,47 @@
+"""Agregar prestamo_actual_id a Cliente
+
+Revision ID: 3e8f0a6b5d17
+Revises: 9b1d4e7a2c30
+Create Date: 2026-10-17 11:03:12.284519
+
+Puntero al préstamo vigente de cada cliente, para no recorrer todos sus
+préstamos en cada cálculo. Se rellena con el préstamo más reciente
+(fecha y luego id) de cada cliente existente.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8f0a6b5d17'
+down_revision = '9b1d4e7a2c30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prestamo_actual_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_cliente_prestamo_actual_id', 'prestamo',
+            ['prestamo_actual_id'], ['id'], ondelete='SET NULL'
+        )
+
+    # Backfill: préstamo más reciente de cada cliente
+    op.execute(
+        """
+        UPDATE cliente
+        SET prestamo_actual_id = (
+            SELECT p.id FROM prestamo p
+            WHERE p.cliente_id = cliente.id
+            ORDER BY p.fecha DESC, p.id DESC
+            LIMIT 1
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_cliente_prestamo_actual_id', type_='foreignkey')
+        batch_op.drop_column('prestamo_actual_id')
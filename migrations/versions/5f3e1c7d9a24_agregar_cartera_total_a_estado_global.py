@@ -0,0 +1,43 @@
+"""Agregar cartera_total a estado_global
+
+Revision ID: 5f3e1c7d9a24
+Revises: d2b6f8c41e09
+Create Date: 2026-10-17 17:05:31.662140
+
+Cartera total (SUM de prestamo.saldo) mantenida en la fila única de
+estado_global. Se rellena con la suma actual; después la ajusta cada
+flush que cambia un saldo (ver cartera.py).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3e1c7d9a24'
+down_revision = 'd2b6f8c41e09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Si db.create_all() (app.py) creó estado_global, ya trae la columna
+    columnas = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('estado_global')}
+    if 'cartera_total' not in columnas:
+        with op.batch_alter_table('estado_global', schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('cartera_total', sa.Float(), nullable=False, server_default='0')
+            )
+
+    # Backfill: cartera actual
+    op.execute(
+        """
+        UPDATE estado_global
+        SET cartera_total = (SELECT COALESCE(SUM(saldo), 0) FROM prestamo)
+        WHERE id = 1
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('estado_global', schema=None) as batch_op:
+        batch_op.drop_column('cartera_total')
@@ -0,0 +1,31 @@
+"""Agregar clave_idempotencia a Abono
+
+Revision ID: 7c4a9e2f1b86
+Revises: 3e8f0a6b5d17
+Create Date: 2026-10-17 15:42:08.913274
+
+Clave generada por el teléfono para cada abono. Con el índice único, los
+reintentos de la cola offline del service worker no registran dos veces el
+mismo pago. Los abonos existentes quedan con NULL.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4a9e2f1b86'
+down_revision = '3e8f0a6b5d17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('abono', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('clave_idempotencia', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_abono_clave_idempotencia', ['clave_idempotencia'])
+
+
+def downgrade():
+    with op.batch_alter_table('abono', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_abono_clave_idempotencia', type_='unique')
+        batch_op.drop_column('clave_idempotencia')
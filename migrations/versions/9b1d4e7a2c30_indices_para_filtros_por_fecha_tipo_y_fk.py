@@ -0,0 +1,60 @@
+"""Índices para filtros por fecha, tipo y claves foráneas
+
+Revision ID: 9b1d4e7a2c30
+Revises: 4c2f5d2031f9
+Create Date: 2026-10-17 10:12:41.503117
+
+Índices según los accesos de las rutas:
+- abono(fecha) y movimiento_caja(fecha): totales del día y reconstrucción por rango.
+- movimiento_caja(tipo, fecha): reportes por tipo y día.
+- prestamo(fecha): préstamos entregados en el día / mes.
+- prestamo(cliente_id, fecha) y abono(prestamo_id, fecha): préstamo más
+  reciente de un cliente y sus abonos (también cubren las FK).
+- cliente(cancelado, orden): listado de activos en orden de ruta.
+- liquidacion(fecha) ya tiene índice único; cubre `fecha < x ORDER BY fecha DESC`.
+
+Verificación: `flask explicar-consultas` (ver comandos.py).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1d4e7a2c30'
+down_revision = '4c2f5d2031f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('abono', schema=None) as batch_op:
+        batch_op.create_index('ix_abono_fecha', ['fecha'], unique=False)
+        batch_op.create_index('ix_abono_prestamo_id_fecha', ['prestamo_id', 'fecha'], unique=False)
+
+    with op.batch_alter_table('movimiento_caja', schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_caja_fecha', ['fecha'], unique=False)
+        batch_op.create_index('ix_movimiento_caja_tipo_fecha', ['tipo', 'fecha'], unique=False)
+
+    with op.batch_alter_table('prestamo', schema=None) as batch_op:
+        batch_op.create_index('ix_prestamo_fecha', ['fecha'], unique=False)
+        batch_op.create_index('ix_prestamo_cliente_id_fecha', ['cliente_id', 'fecha'], unique=False)
+
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.create_index('ix_cliente_cancelado_orden', ['cancelado', 'orden'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_index('ix_cliente_cancelado_orden')
+
+    with op.batch_alter_table('prestamo', schema=None) as batch_op:
+        batch_op.drop_index('ix_prestamo_cliente_id_fecha')
+        batch_op.drop_index('ix_prestamo_fecha')
+
+    with op.batch_alter_table('movimiento_caja', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_caja_tipo_fecha')
+        batch_op.drop_index('ix_movimiento_caja_fecha')
+
+    with op.batch_alter_table('abono', schema=None) as batch_op:
+        batch_op.drop_index('ix_abono_prestamo_id_fecha')
+        batch_op.drop_index('ix_abono_fecha')
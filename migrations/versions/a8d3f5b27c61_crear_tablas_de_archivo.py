@@ -0,0 +1,74 @@
+"""Crear tablas de archivo de préstamos y abonos
+
+Revision ID: a8d3f5b27c61
+Revises: 5f3e1c7d9a24
+Create Date: 2026-10-17 18:12:57.204881
+
+prestamo_archivado y abono_archivado reciben, por lotes, los préstamos
+pagados más viejos y sus abonos (ver archivo.py), con el mismo id.
+
+app.py corre db.create_all() al importarse: en una BD existente las dos
+tablas (con sus índices) pueden estar creadas antes de llegar aquí.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f5b27c61'
+down_revision = '5f3e1c7d9a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'prestamo_archivado' not in tablas:
+        _crear_prestamo_archivado()
+    if 'abono_archivado' not in tablas:
+        _crear_abono_archivado()
+
+
+def _crear_prestamo_archivado():
+    op.create_table(
+        'prestamo_archivado',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('monto', sa.Float(), nullable=False),
+        sa.Column('interes', sa.Float(), nullable=True),
+        sa.Column('plazo', sa.Integer(), nullable=True),
+        sa.Column('fecha', sa.Date(), nullable=True),
+        sa.Column('saldo', sa.Float(), nullable=True),
+        sa.Column('frecuencia', sa.String(length=20), nullable=True),
+        sa.Column('ultima_aplicacion_interes', sa.Date(), nullable=True),
+        sa.Column('archivado_en', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('prestamo_archivado', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_prestamo_archivado_cliente_id'), ['cliente_id'], unique=False)
+
+
+def _crear_abono_archivado():
+    op.create_table(
+        'abono_archivado',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('prestamo_id', sa.Integer(), nullable=False),
+        sa.Column('monto', sa.Float(), nullable=False),
+        sa.Column('fecha', sa.DateTime(), nullable=True),
+        sa.Column('clave_idempotencia', sa.String(length=64), nullable=True),
+        sa.Column('archivado_en', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('abono_archivado', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_abono_archivado_prestamo_id'), ['prestamo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('abono_archivado', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_abono_archivado_prestamo_id'))
+    op.drop_table('abono_archivado')
+
+    with op.batch_alter_table('prestamo_archivado', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_prestamo_archivado_cliente_id'))
+    op.drop_table('prestamo_archivado')
@@ -0,0 +1,49 @@
+"""Agregar siguiente_codigo a estado_global
+
+Revision ID: b4e8d1a6c372
+Revises: f1c7b3e9d254
+Create Date: 2026-10-17 19:41:08.306517
+
+Secuencia de códigos de cliente (ver codigos.py). Se rellena con el mayor
+código numérico existente + 1, así nunca reparte uno que ya está en uso.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8d1a6c372'
+down_revision = 'f1c7b3e9d254'
+branch_labels = None
+depends_on = None
+
+
+MAX_DIGITOS_NUMERICOS = 15
+
+
+def upgrade():
+    # Si db.create_all() (app.py) creó estado_global, ya trae la columna
+    columnas = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('estado_global')}
+    if 'siguiente_codigo' not in columnas:
+        with op.batch_alter_table('estado_global', schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('siguiente_codigo', sa.BigInteger(), nullable=False, server_default='1')
+            )
+
+    # Backfill: los códigos pueden tener letras; se filtran en Python (una pasada)
+    conexion = op.get_bind()
+    numeros = [
+        int(c.strip())
+        for (c,) in conexion.execute(sa.text('SELECT codigo FROM cliente'))
+        if c and c.strip().isascii() and c.strip().isdigit()
+        and len(c.strip()) <= MAX_DIGITOS_NUMERICOS
+    ]
+    conexion.execute(
+        sa.text('UPDATE estado_global SET siguiente_codigo = :n WHERE id = 1'),
+        {'n': max(numeros, default=0) + 1},
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('estado_global', schema=None) as batch_op:
+        batch_op.drop_column('siguiente_codigo')
@@ -0,0 +1,63 @@
+"""Orden de ruta con huecos (cliente.orden de a 1024)
+
+Revision ID: c7a2e5f08b13
+Revises: b4e8d1a6c372
+Create Date: 2026-10-17 20:05:52.917364
+
+Solo datos: cliente.orden pasa de posición 1..n a llave con huecos (ver
+orden.py). Activos: posición actual * 1024 (ordenados por orden, id; los
+sin orden primero, como los mostraba el index). Cancelados: orden * 1024,
+para que al reactivarlos vuelvan al mismo lugar relativo.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a2e5f08b13'
+down_revision = 'b4e8d1a6c372'
+branch_labels = None
+depends_on = None
+
+
+ORDEN_PASO = 1024
+
+
+def upgrade():
+    conexion = op.get_bind()
+    activos = conexion.execute(sa.text(
+        """
+        SELECT id FROM cliente
+        WHERE cancelado = false OR cancelado IS NULL
+        ORDER BY CASE WHEN orden IS NULL THEN 0 ELSE 1 END, orden, id
+        """
+    )).scalars().all()
+    conexion.execute(
+        sa.text('UPDATE cliente SET orden = orden * :paso WHERE cancelado = true AND orden IS NOT NULL'),
+        {'paso': ORDEN_PASO},
+    )
+    if activos:
+        conexion.execute(
+            sa.text('UPDATE cliente SET orden = :orden WHERE id = :id'),
+            [{'id': cid, 'orden': i * ORDEN_PASO} for i, cid in enumerate(activos, start=1)],
+        )
+
+
+def downgrade():
+    conexion = op.get_bind()
+    activos = conexion.execute(sa.text(
+        """
+        SELECT id FROM cliente
+        WHERE cancelado = false OR cancelado IS NULL
+        ORDER BY CASE WHEN orden IS NULL THEN 0 ELSE 1 END, orden, id
+        """
+    )).scalars().all()
+    conexion.execute(
+        sa.text('UPDATE cliente SET orden = orden / :paso WHERE cancelado = true AND orden IS NOT NULL'),
+        {'paso': ORDEN_PASO},
+    )
+    if activos:
+        conexion.execute(
+            sa.text('UPDATE cliente SET orden = :orden WHERE id = :id'),
+            [{'id': cid, 'orden': i} for i, cid in enumerate(activos, start=1)],
+        )
@@ -0,0 +1,44 @@
+"""Crear estado_global con la versión de datos
+
+Revision ID: d2b6f8c41e09
+Revises: 7c4a9e2f1b86
+Create Date: 2026-10-17 16:20:44.507391
+
+Tabla de una sola fila (id=1). `version` sube en cada transacción que
+escribe clientes, préstamos, abonos o caja, y se usa como ETag para
+responder 304 en "/" y en el historial de abonos.
+
+app.py corre db.create_all() al importarse, así que en una BD existente la
+tabla (y su fila id=1) puede estar creada antes de llegar aquí.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b6f8c41e09'
+down_revision = '7c4a9e2f1b86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conexion = op.get_bind()
+    if not sa.inspect(conexion).has_table('estado_global'):
+        op.create_table(
+            'estado_global',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.execute(
+        """
+        INSERT INTO estado_global (id, version)
+        SELECT 1, 0
+        WHERE NOT EXISTS (SELECT 1 FROM estado_global WHERE id = 1)
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('estado_global')
@@ -0,0 +1,40 @@
+"""Índices por fecha en las tablas de archivo
+
+Revision ID: d8f2a6c4e571
+Revises: c7a2e5f08b13
+Create Date: 2026-10-18 10:14:52.318604
+
+Los recálculos de liquidación suman también abono_archivado y
+prestamo_archivado por rango de fechas. db.create_all() (app.py) ya los
+crea si la tabla es nueva; aquí solo se agregan los que faltan.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2a6c4e571'
+down_revision = 'c7a2e5f08b13'
+branch_labels = None
+depends_on = None
+
+
+INDICES = (
+    ('abono_archivado', 'ix_abono_archivado_fecha'),
+    ('prestamo_archivado', 'ix_prestamo_archivado_fecha'),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for tabla, indice in INDICES:
+        if indice in {i['name'] for i in inspector.get_indexes(tabla)}:
+            continue
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.create_index(indice, ['fecha'], unique=False)
+
+
+def downgrade():
+    for tabla, indice in INDICES:
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.drop_index(indice)
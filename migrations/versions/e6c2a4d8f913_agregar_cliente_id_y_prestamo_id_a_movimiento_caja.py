@@ -0,0 +1,103 @@
+"""Agregar cliente_id y prestamo_id a MovimientoCaja
+
+Revision ID: e6c2a4d8f913
+Revises: a8d3f5b27c61
+Create Date: 2026-10-17 18:48:20.731905
+
+FK (ON DELETE SET NULL) e índice para encontrar los movimientos de un
+cliente sin el ILIKE sobre la descripción.
+
+Backfill de cliente_id: solo por coincidencia EXACTA con las descripciones
+que generan las rutas. Si varias filas de cliente coinciden (las
+renovaciones crean un Cliente nuevo con el mismo nombre y código) se toma
+la creada más recientemente en o antes de la fecha del movimiento; si
+todas son posteriores, la más antigua. prestamo_id no se rellena en filas
+viejas: la descripción no identifica el préstamo.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6c2a4d8f913'
+down_revision = 'a8d3f5b27c61'
+branch_labels = None
+depends_on = None
+
+
+# Descripciones que escriben las rutas, en función del nombre y código
+DESCRIPCIONES = (
+    'Abono de {nombre} (código {codigo})',
+    'Pago interés mensual (solo interés) de {nombre}',
+    'Préstamo inicial a {nombre}',
+    'Renovación del préstamo para {nombre}',
+    'Reactivación de {nombre} — deuda pendiente',
+    'Préstamo a {nombre}',
+    '♻️ Reversión de capital del cliente {nombre}',
+)
+
+
+def _elegir_cliente(candidatos, dia):
+    """Último creado en o antes de `dia`; si todos son posteriores, el más antiguo."""
+    previos = [c for c in candidatos if c[0] <= dia]
+    if previos:
+        return max(previos)[1]
+    return min(candidatos)[1]
+
+
+def upgrade():
+    with op.batch_alter_table('movimiento_caja', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cliente_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('prestamo_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_movimiento_caja_cliente_id', 'cliente',
+            ['cliente_id'], ['id'], ondelete='SET NULL'
+        )
+        batch_op.create_foreign_key(
+            'fk_movimiento_caja_prestamo_id', 'prestamo',
+            ['prestamo_id'], ['id'], ondelete='SET NULL'
+        )
+        batch_op.create_index('ix_movimiento_caja_cliente_id', ['cliente_id'], unique=False)
+        batch_op.create_index('ix_movimiento_caja_prestamo_id', ['prestamo_id'], unique=False)
+
+    # Backfill: cliente cuya descripción coincide exactamente. Se resuelve en
+    # Python (una pasada por tabla): el "más reciente hasta la fecha del
+    # movimiento" no se expresa igual en SQLite y Postgres.
+    conexion = op.get_bind()
+    por_descripcion = {}
+    for cid, nombre, codigo, creado in conexion.execute(sa.text(
+        'SELECT id, nombre, codigo, fecha_creacion FROM cliente'
+    )):
+        if not nombre:
+            continue
+        # (fecha de creación, id): a igual fecha gana el id mayor
+        clave = (str(creado or '')[:10], cid)
+        for plantilla in DESCRIPCIONES:
+            descripcion = plantilla.format(nombre=nombre, codigo=codigo)
+            por_descripcion.setdefault(descripcion, []).append(clave)
+
+    cambios = []
+    for mid, descripcion, fecha in conexion.execute(sa.text(
+        'SELECT id, descripcion, fecha FROM movimiento_caja WHERE cliente_id IS NULL'
+    )):
+        candidatos = por_descripcion.get(descripcion)
+        if candidatos:
+            cambios.append({
+                'id': mid,
+                'cliente_id': _elegir_cliente(candidatos, str(fecha or '')[:10]),
+            })
+    if cambios:
+        conexion.execute(
+            sa.text('UPDATE movimiento_caja SET cliente_id = :cliente_id WHERE id = :id'),
+            cambios,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('movimiento_caja', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_caja_prestamo_id')
+        batch_op.drop_index('ix_movimiento_caja_cliente_id')
+        batch_op.drop_constraint('fk_movimiento_caja_prestamo_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_movimiento_caja_cliente_id', type_='foreignkey')
+        batch_op.drop_column('prestamo_id')
+        batch_op.drop_column('cliente_id')
@@ -0,0 +1,45 @@
+"""Índices de búsqueda de clientes (código, nombre, dirección, teléfono)
+
+Revision ID: f1c7b3e9d254
+Revises: e6c2a4d8f913
+Create Date: 2026-10-17 19:20:41.518230
+
+Postgres: pg_trgm + GIN por columna, para ILIKE '%texto%'.
+SQLite: índices COLLATE NOCASE, para LIKE 'texto%' (ver busqueda.py).
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7b3e9d254'
+down_revision = 'e6c2a4d8f913'
+branch_labels = None
+depends_on = None
+
+
+COLUMNAS = ('codigo', 'nombre', 'direccion', 'telefono')
+
+
+def upgrade():
+    dialecto = op.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for c in COLUMNAS:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_cliente_{c}_trgm '
+                f'ON cliente USING gin ({c} gin_trgm_ops)'
+            )
+    elif dialecto == 'sqlite':
+        for c in COLUMNAS:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_cliente_{c}_nocase '
+                f'ON cliente ({c} COLLATE NOCASE)'
+            )
+
+
+def downgrade():
+    dialecto = op.get_bind().dialect.name
+    sufijo = 'trgm' if dialecto == 'postgresql' else 'nocase'
+    for c in COLUMNAS:
+        op.execute(f'DROP INDEX IF EXISTS ix_cliente_{c}_{sufijo}')
+    # La extensión pg_trgm se deja: otras tablas podrían usarla
@@ -12,6 +12,10 @@ from tiempo import hora_actual, local_date
 # ---------------------------------------------------
 class Cliente(db.Model):
     __tablename__ = "cliente"
+    __table_args__ = (
+        # Listado de activos ordenado por ruta (index)
+        db.Index("ix_cliente_cancelado_orden", "cancelado", "orden"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(50), nullable=False, index=True)
@@ -34,43 +38,71 @@ class Cliente(db.Model):
     # 👉 SOLO para mensual_pago
     proximo_pago_fecha = db.Column(db.Date, nullable=True)
 
+    # 👉 Préstamo vigente (el más reciente); lo mantienen creación y renovación
+    prestamo_actual_id = db.Column(
+        db.Integer,
+        db.ForeignKey(
+            "prestamo.id",
+            name="fk_cliente_prestamo_actual_id",
+            use_alter=True,
+            ondelete="SET NULL",
+        ),
+        nullable=True,
+    )
+
     # ---------------------------------------------------
     # 🔗 RELACIONES
     # ---------------------------------------------------
     prestamos = db.relationship(
         "Prestamo",
         backref="cliente",
+        foreign_keys="Prestamo.cliente_id",
         lazy="selectin",
         cascade="all, delete-orphan"
     )
 
+    prestamo_actual = db.relationship(
+        "Prestamo",
+        foreign_keys=[prestamo_actual_id],
+        post_update=True,
+        lazy="select",
+    )
+
     # ---------------------------------------------------
     # 🔹 FUNCIONES DE CÁLCULO
     # ---------------------------------------------------
-    def saldo_total(self):
+    def ultimo_prestamo(self):
+        """Préstamo vigente: usa el puntero y solo recorre la lista si falta."""
+        if self.prestamo_actual_id is not None:
+            return self.prestamo_actual
         if not self.prestamos:
+            return None
+        return max(self.prestamos, key=lambda p: p.fecha or date.min)
+
+    def saldo_total(self):
+        u = self.ultimo_prestamo()
+        if u is None:
             return float(self.saldo or 0.0)
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         return float(u.saldo or 0.0)
 
     def capital_total(self):
-        if not self.prestamos:
+        u = self.ultimo_prestamo()
+        if u is None:
             return 0.0
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         total = u.monto + (u.monto * (u.interes or 0) / 100)
         return float(total)
 
     def capital_total_sin_interes(self):
-        if not self.prestamos:
+        u = self.ultimo_prestamo()
+        if u is None:
             return float(self.saldo or 0.0)
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         return float(u.monto or 0.0)
 
     def cuota_total(self):
-        if not self.prestamos:
+        u = self.ultimo_prestamo()
+        if u is None:
             return 0.0
 
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         if not u.plazo or u.plazo <= 0:
             return 0.0
 
@@ -93,10 +125,10 @@ class Cliente(db.Model):
         return self.cuota_total()
 
     def cuotas_atrasadas(self):
-        if not self.prestamos:
+        u = self.ultimo_prestamo()
+        if u is None:
             return 0
 
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         if not u.plazo or not u.fecha:
             return 0
 
@@ -117,10 +149,15 @@ class Cliente(db.Model):
         return min(cuotas, u.plazo)
 
     def ultimo_abono_monto(self):
-        if not self.prestamos:
+        # El listado del index ya trae el último abono (helpers.listar_clientes_activos)
+        precargado = getattr(self, "_ultimo_abono", None)
+        if precargado is not None:
+            return precargado[0]
+
+        u = self.ultimo_prestamo()
+        if u is None:
             return 0.0
 
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
         if not u.abonos:
             return 0.0
 
@@ -138,11 +175,10 @@ class Cliente(db.Model):
         if self.cancelado:
             return "cancelado"
 
-        if not self.prestamos:
+        u = self.ultimo_prestamo()
+        if u is None:
             return ""
 
-        u = max(self.prestamos, key=lambda p: p.fecha or date.min)
-
         def _d(x):
             if not x:
                 return None
@@ -203,13 +239,17 @@ class Cliente(db.Model):
 # ---------------------------------------------------
 class Prestamo(db.Model):
     __tablename__ = "prestamo"
+    __table_args__ = (
+        # Préstamo más reciente de un cliente
+        db.Index("ix_prestamo_cliente_id_fecha", "cliente_id", "fecha"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id"), nullable=False)
     monto = db.Column(db.Float, nullable=False)
     interes = db.Column(db.Float, default=0.0)
     plazo = db.Column(db.Integer)
-    fecha = db.Column(db.Date, default=local_date)  # ✅ Fecha local de Chile
+    fecha = db.Column(db.Date, default=local_date, index=True)  # ✅ Fecha local de Chile
     saldo = db.Column(db.Float, default=0.0)
     frecuencia = db.Column(db.String(20), default="diario")
     ultima_aplicacion_interes = db.Column(db.Date, default=local_date)  # 🕒 Nuevo
@@ -227,11 +267,19 @@ class Prestamo(db.Model):
 # ---------------------------------------------------
 class Abono(db.Model):
     __tablename__ = "abono"
+    __table_args__ = (
+        # Abonos de un préstamo (historial, último abono)
+        db.Index("ix_abono_prestamo_id_fecha", "prestamo_id", "fecha"),
+        # Deduplicación de la cola offline (NULL en abonos sin clave)
+        db.UniqueConstraint("clave_idempotencia", name="uq_abono_clave_idempotencia"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     prestamo_id = db.Column(db.Integer, db.ForeignKey("prestamo.id"), nullable=False)
     monto = db.Column(db.Float, nullable=False)
-    fecha = db.Column(db.DateTime(timezone=False), default=hora_actual)  # ✅ Hora real de Chile sin tzinfo
+    fecha = db.Column(db.DateTime(timezone=False), default=hora_actual, index=True)  # ✅ Hora real de Chile sin tzinfo
+    # 🔑 Clave generada en el teléfono: un reintento offline nunca cobra dos veces
+    clave_idempotencia = db.Column(db.String(64), nullable=True)
 
 
 # ---------------------------------------------------
@@ -239,12 +287,32 @@ class Abono(db.Model):
 # ---------------------------------------------------
 class MovimientoCaja(db.Model):
     __tablename__ = "movimiento_caja"
+    __table_args__ = (
+        # Movimientos de un tipo en un rango de fechas (reportes por día)
+        db.Index("ix_movimiento_caja_tipo_fecha", "tipo", "fecha"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(20), nullable=False)
     monto = db.Column(db.Float, nullable=False)
     descripcion = db.Column(db.String(255))
-    fecha = db.Column(db.DateTime(timezone=False), default=hora_actual)
+    fecha = db.Column(db.DateTime(timezone=False), default=hora_actual, index=True)
+    # 🔗 Cliente/préstamo del movimiento (NULL en gastos, salidas y entradas manuales)
+    cliente_id = db.Column(
+        db.Integer,
+        db.ForeignKey("cliente.id", name="fk_movimiento_caja_cliente_id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+    prestamo_id = db.Column(
+        db.Integer,
+        db.ForeignKey("prestamo.id", name="fk_movimiento_caja_prestamo_id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+
+    # Sin backref: nadie recorre los movimientos desde el préstamo
+    prestamo = db.relationship("Prestamo", foreign_keys=[prestamo_id], lazy="select")
 
 
 # ---------------------------------------------------
@@ -286,3 +354,51 @@ class Liquidacion(db.Model):
     @property
     def total_caja(self):
         return self.caja or 0.0
+
+
+# ---------------------------------------------------
+# 🗄️ ARCHIVO (préstamos viejos ya pagados y sus abonos)
+# ---------------------------------------------------
+# Copia fila a fila de prestamo/abono (mismo id) que archivo.py saca de las
+# tablas calientes. Sin FK: el cliente puede eliminarse después.
+class PrestamoArchivado(db.Model):
+    __tablename__ = "prestamo_archivado"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cliente_id = db.Column(db.Integer, nullable=False, index=True)
+    monto = db.Column(db.Float, nullable=False)
+    interes = db.Column(db.Float)
+    plazo = db.Column(db.Integer)
+    # Recálculos de liquidación por rango de fechas
+    fecha = db.Column(db.Date, index=True)
+    saldo = db.Column(db.Float)
+    frecuencia = db.Column(db.String(20))
+    ultima_aplicacion_interes = db.Column(db.Date)
+    archivado_en = db.Column(db.DateTime(timezone=False), default=hora_actual)
+
+
+class AbonoArchivado(db.Model):
+    __tablename__ = "abono_archivado"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    prestamo_id = db.Column(db.Integer, nullable=False, index=True)
+    monto = db.Column(db.Float, nullable=False)
+    # Recálculos de liquidación por rango de fechas
+    fecha = db.Column(db.DateTime(timezone=False), index=True)
+    clave_idempotencia = db.Column(db.String(64))
+    archivado_en = db.Column(db.DateTime(timezone=False), default=hora_actual)
+
+
+# ---------------------------------------------------
+# 🔢 ESTADO GLOBAL (una sola fila, id=1)
+# ---------------------------------------------------
+class EstadoGlobal(db.Model):
+    __tablename__ = "estado_global"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Sube en cada transacción que toca clientes, préstamos, abonos o caja (ETag)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    # SUM(prestamo.saldo) mantenida en cada flush (cartera.py)
+    cartera_total = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    # Próximo código de cliente a repartir (codigos.py)
+    siguiente_codigo = db.Column(db.BigInteger, nullable=False, default=1, server_default="1")
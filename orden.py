@@ -0,0 +1,284 @@
+# ======================================================
+# orden.py — orden de ruta con huecos (Cliente.orden)
+# ======================================================
+#
+# Cliente.orden ya no es la posición 1..n sino una LLAVE de orden con huecos
+# (de a ORDEN_PASO). Insertar o mover un cliente escribe solo SU fila: se le
+# da una llave entre la de sus vecinos. La posición que se ve (1, 2, 3...)
+# se calcula al renderizar (loop.index), así el index nunca escribe.
+#
+# Cuando dos vecinos quedan pegados (sin entero libre entre sus llaves) se
+# reparte de nuevo toda la ruta de a ORDEN_PASO; es raro y también se puede
+# hacer fuera de horario con `flask rebalancear-orden`.
+#
+# Reordenar (/reordenar_ruta): se lee la ruta UNA vez, se calculan las
+# llaves en memoria y se guardan solo las que cambian en un único
+# executemany. El arrastre del index manda solo el movido y sus vecinos
+# (aplicar_movimientos_entre): una fila por arrastre.
+
+from bisect import bisect_left
+
+from sqlalchemy import func, select, update
+
+from extensions import db
+from invalidacion import anotar_cambios
+from modelos import Cliente
+
+ORDEN_PASO = 1024
+
+
+def _llaves_activos(excluir_id=None):
+    consulta = select(Cliente.orden).where(Cliente.cancelado == False)
+    if excluir_id is not None:
+        consulta = consulta.where(Cliente.id != excluir_id)
+    return consulta.order_by(Cliente.orden.asc().nullsfirst(), Cliente.id.asc())
+
+
+def orden_al_final():
+    """Llave para agregar un cliente al final de la ruta (una consulta)."""
+    maximo = db.session.execute(
+        select(func.max(Cliente.orden)).where(Cliente.cancelado == False)
+    ).scalar()
+    return (maximo or 0) + ORDEN_PASO
+
+
+def _entre(antes, despues):
+    """Llave entera estrictamente entre dos vecinos, o None si no hay hueco."""
+    if antes is None and despues is None:
+        return ORDEN_PASO
+    if antes is None:
+        return despues - ORDEN_PASO
+    if despues is None:
+        return antes + ORDEN_PASO
+    if despues - antes < 2:
+        return None
+    return (antes + despues) // 2
+
+
+def orden_para_posicion(posicion, excluir_id=None):
+    """
+    Llave para que un cliente quede en la posición `posicion` (1 = primero)
+    entre los activos, sin contar a `excluir_id` (el que se está moviendo).
+    Lee solo los dos vecinos; si no hay hueco, rebalancea y vuelve a leer.
+    """
+    posicion = max(1, int(posicion))
+    for _ in range(2):
+        vecinos = list(
+            db.session.execute(
+                _llaves_activos(excluir_id).offset(max(posicion - 2, 0)).limit(2)
+            ).scalars()
+        )
+        if None not in vecinos:
+            if posicion == 1:
+                llave = _entre(None, vecinos[0] if vecinos else None)
+            elif not vecinos:
+                # Posición más allá del final
+                return orden_al_final()
+            else:
+                llave = _entre(vecinos[0], vecinos[1] if len(vecinos) > 1 else None)
+            if llave is not None:
+                return llave
+        # Vecinos pegados (o sin llave): repartir de nuevo y recalcular
+        rebalancear_orden()
+    raise RuntimeError("No se pudo calcular el orden tras rebalancear")
+
+
+def _ruta_actual():
+    """[(id, orden)] de los activos en orden de ruta."""
+    return db.session.execute(
+        select(Cliente.id, Cliente.orden)
+        .where(Cliente.cancelado == False)
+        .order_by(Cliente.orden.asc().nullsfirst(), Cliente.id.asc())
+    ).all()
+
+
+def _guardar_llaves(nuevas, actuales):
+    """UPDATE por lotes (executemany) de las llaves que cambiaron, sin commit."""
+    cambios = [
+        {"id": cid, "orden": orden}
+        for cid, orden in nuevas.items()
+        if actuales.get(cid) != orden
+    ]
+    if cambios:
+        db.session.execute(update(Cliente), cambios)
+        # No pasa por el flush: subir la versión a mano (ETag del index)
+        anotar_cambios(db.session)
+        # El UPDATE por lotes no refresca los objetos ya cargados en la sesión
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, Cliente):
+                db.session.expire(obj, ["orden"])
+    return len(cambios)
+
+
+def _espaciar(ids):
+    return {cid: i * ORDEN_PASO for i, cid in enumerate(ids, start=1)}
+
+
+def _repartir(antes, despues, cantidad):
+    """`cantidad` llaves enteras crecientes entre dos llaves, o None si no caben."""
+    if antes is None and despues is None:
+        return [i * ORDEN_PASO for i in range(1, cantidad + 1)]
+    if antes is None:
+        return [despues - (cantidad - i) * ORDEN_PASO for i in range(cantidad)]
+    if despues is None:
+        return [antes + i * ORDEN_PASO for i in range(1, cantidad + 1)]
+    if despues - antes <= cantidad:
+        return None
+    return [antes + i * (despues - antes) // (cantidad + 1) for i in range(1, cantidad + 1)]
+
+
+def _quietos(posiciones):
+    """
+    Índices de la subsecuencia creciente más larga de `posiciones`: los
+    clientes que NO cambiaron de orden relativo y conservan su llave.
+    """
+    colas, indices_colas, previo = [], [], [None] * len(posiciones)
+    for i, pos in enumerate(posiciones):
+        j = bisect_left(colas, pos)
+        if j == len(colas):
+            colas.append(pos)
+            indices_colas.append(i)
+        else:
+            colas[j] = pos
+            indices_colas[j] = i
+        previo[i] = indices_colas[j - 1] if j else None
+
+    quietos = set()
+    i = indices_colas[-1] if indices_colas else None
+    while i is not None:
+        quietos.add(i)
+        i = previo[i]
+    return quietos
+
+
+def aplicar_orden_completo(ids):
+    """
+    Deja la ruta en el orden de `ids`. Los activos que no vinieron en la
+    lista (p. ej. un alta de otro usuario mientras tanto) quedan al final,
+    en su orden actual; los ids que no son activos se ignoran.
+    Solo cambian de llave los que cambiaron de orden relativo (los demás
+    son la subsecuencia creciente más larga); si no hay hueco, se reparte.
+    Devuelve cuántos clientes cambiaron de llave.
+    """
+    ruta = _ruta_actual()
+    actuales = dict(ruta)
+    vistos = set()
+    secuencia = []
+    for cid in ids:
+        if cid in actuales and cid not in vistos:
+            vistos.add(cid)
+            secuencia.append(cid)
+    secuencia += [cid for cid, _ in ruta if cid not in vistos]
+
+    if None in actuales.values():
+        return _guardar_llaves(_espaciar(secuencia), actuales)
+
+    posicion_actual = {cid: i for i, (cid, _) in enumerate(ruta)}
+    quietos = _quietos([posicion_actual[cid] for cid in secuencia])
+
+    llaves = {}
+    pendientes = []  # movidos entre el último quieto y el próximo
+    anterior = None
+    for i, cid in enumerate(secuencia + [None]):
+        if cid is not None and i not in quietos:
+            pendientes.append(cid)
+            continue
+        siguiente = actuales[cid] if cid is not None else None
+        if pendientes:
+            nuevas = _repartir(anterior, siguiente, len(pendientes))
+            if nuevas is None:
+                return _guardar_llaves(_espaciar(secuencia), actuales)
+            llaves.update(zip(pendientes, nuevas))
+            pendientes = []
+        if cid is not None:
+            llaves[cid] = anterior = siguiente
+
+    return _guardar_llaves(llaves, actuales)
+
+
+def _mover(secuencia, llaves, cid, i):
+    """
+    Pone `cid` en el índice `i` de `secuencia` y le da una llave entre sus
+    vecinos. Si no hay hueco reparte toda la ruta. Devuelve las llaves.
+    """
+    secuencia.insert(i, cid)
+    antes = llaves[secuencia[i - 1]] if i > 0 else None
+    despues = llaves[secuencia[i + 1]] if i + 1 < len(secuencia) else None
+    llave = _entre(antes, despues)
+    if llave is None:
+        return _espaciar(secuencia)
+    llaves[cid] = llave
+    return llaves
+
+
+def _ruta_en_memoria():
+    ruta = _ruta_actual()
+    actuales = dict(ruta)
+    secuencia = [cid for cid, _ in ruta]
+    llaves = dict(actuales)
+    if None in llaves.values():
+        llaves = _espaciar(secuencia)
+    return actuales, secuencia, llaves
+
+
+def aplicar_movimientos(movimientos):
+    """
+    Aplica en orden una lista de (id, posición) —posición 1 = primero—, como
+    si se hicieran uno tras otro. Cada movido recibe una llave entre sus
+    vecinos; si no hay hueco, se reparte la ruta entera (en memoria).
+    Devuelve cuántos clientes cambiaron de llave.
+    """
+    actuales, secuencia, llaves = _ruta_en_memoria()
+
+    for cid, posicion in movimientos:
+        if cid not in llaves:
+            continue
+        secuencia.remove(cid)
+        i = min(max(int(posicion), 1), len(secuencia) + 1) - 1
+        llaves = _mover(secuencia, llaves, cid, i)
+
+    return _guardar_llaves(llaves, actuales)
+
+
+def aplicar_movimientos_entre(movimientos):
+    """
+    Aplica en orden una lista de (id, antes, despues): el cliente queda
+    justo después de `antes` (o antes de `despues` si `antes` es None o ya
+    no está activo). Lo que manda el arrastre del index: los vecinos por id
+    siguen valiendo aunque otro usuario haya movido filas mientras tanto.
+    Un arrastre escribe una sola fila salvo que haya que repartir.
+    Devuelve cuántos clientes cambiaron de llave.
+    """
+    actuales, secuencia, llaves = _ruta_en_memoria()
+
+    for cid, antes, despues in movimientos:
+        if cid not in llaves or cid in (antes, despues):
+            continue
+        ancla_antes = antes in llaves
+        ancla_despues = despues in llaves
+        if not ancla_antes and not ancla_despues and (antes is None) == (despues is None):
+            # Sin vecinos que sigan activos (o sin vecinos): nada que mover
+            continue
+        secuencia.remove(cid)
+        if ancla_antes:
+            i = secuencia.index(antes) + 1
+        elif ancla_despues:
+            i = secuencia.index(despues)
+        elif antes is None:
+            # Iba primero y el de después ya no está: queda primero igual
+            i = 0
+        else:
+            i = len(secuencia)
+        llaves = _mover(secuencia, llaves, cid, i)
+
+    return _guardar_llaves(llaves, actuales)
+
+
+def rebalancear_orden():
+    """
+    Reparte las llaves de los activos de a ORDEN_PASO respetando el orden
+    actual. Un solo executemany con las filas que cambian, sin commit.
+    Devuelve cuántos clientes cambiaron.
+    """
+    ruta = _ruta_actual()
+    return _guardar_llaves(_espaciar([cid for cid, _ in ruta]), dict(ruta))
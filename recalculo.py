@@ -0,0 +1,111 @@
+# ======================================================
+# recalculo.py — recálculos de liquidación en segundo plano
+# ======================================================
+#
+# Un pool fijo de hilos (RECALCULO_WORKERS, 2 por defecto) con una cola por
+# fecha: si ya hay un recálculo pendiente para ese día, los nuevos pedidos se
+# juntan en él; si está corriendo, se repite UNA vez al terminar para no
+# perder lo registrado mientras tanto.
+
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+RECALCULO_WORKERS = int(os.getenv("RECALCULO_WORKERS", "2"))
+
+# fecha -> "en_cola" | "corriendo" | "repetir"
+_estado = {}
+_lock = threading.Lock()
+_executor = None
+_cerrado = False
+
+
+def _obtener_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=RECALCULO_WORKERS,
+            thread_name_prefix="recalculo",
+        )
+    return _executor
+
+
+def recalcular_en_segundo_plano(app, fecha):
+    """Recalcula liquidación y resumen (se ejecuta dentro del pool)."""
+    with app.app_context():
+        from helpers import (
+            obtener_resumenes_del_dia,
+            actualizar_liquidacion_por_movimiento,
+        )
+
+        try:
+            app.logger.info(f"[BG RECALCULO] Iniciando {fecha}")
+
+            # El commit invalida el caché (invalidacion.py); aquí se vuelve a llenar
+            actualizar_liquidacion_por_movimiento(fecha, commit=True)
+            obtener_resumenes_del_dia(fecha)
+
+            app.logger.info(f"[BG RECALCULO] Terminado {fecha}")
+        except Exception:
+            from extensions import db
+            db.session.rollback()
+            app.logger.exception(f"[BG RECALCULO] Error recalculando {fecha}")
+
+
+def _trabajo(app, fecha):
+    """Corre el recálculo de una fecha y lo repite si llegaron pedidos mientras tanto."""
+    while True:
+        with _lock:
+            _estado[fecha] = "corriendo"
+
+        recalcular_en_segundo_plano(app, fecha)
+
+        with _lock:
+            if _estado.get(fecha) == "repetir":
+                continue
+            _estado.pop(fecha, None)
+            return
+
+
+def lanzar_recalculo_async(fecha):
+    """
+    Encola el recálculo de `fecha` sin bloquear la petición.
+    Devuelve False si se juntó con uno ya pendiente.
+    """
+    app = current_app._get_current_object()
+
+    with _lock:
+        estado = _estado.get(fecha)
+        if estado in ("en_cola", "repetir"):
+            return False
+        if estado == "corriendo":
+            _estado[fecha] = "repetir"
+            return False
+
+        if _cerrado:
+            # Worker saliendo: no se encola nada nuevo
+            app.logger.warning(f"[BG RECALCULO] Pool cerrado, se omite {fecha}")
+            return False
+
+        _estado[fecha] = "en_cola"
+        _obtener_executor().submit(_trabajo, app, fecha)
+    return True
+
+
+def detener_recalculos(esperar: bool = True):
+    """
+    Cierra el pool. Con esperar=True termina lo que está en cola antes de salir
+    (lo llama gunicorn en worker_exit y también atexit).
+    """
+    global _executor, _cerrado
+    with _lock:
+        _cerrado = True
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=esperar)
+
+
+atexit.register(detener_recalculos)
@@ -3,26 +3,36 @@
 # ======================================================
 
 import os
-import time
-from threading import Thread
 from datetime import datetime, timedelta
 
 from flask import (
     Blueprint, render_template, request, redirect,
-    url_for, flash, session, jsonify, current_app
+    url_for, flash, session, jsonify, current_app, send_from_directory,
+    make_response, Response, stream_with_context
 )
 from functools import wraps
-from sqlalchemy import func, and_
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, lazyload
 
-from extensions import db
+from extensions import db, cache
+from invalidacion import clave_cache_historial, anotar_cambios, version_datos
 from modelos import Cliente, Prestamo, Abono, MovimientoCaja, Liquidacion
 from helpers import (
     generar_codigo_cliente,
+    listar_clientes_activos,
+    listar_clientes_cancelados,
+    totales_clientes_cancelados,
     crear_liquidacion_para_fecha,
-    obtener_resumen_total,
+    obtener_resumenes_del_dia,
     actualizar_liquidacion_por_movimiento,
-    eliminar_cache_resumen_hoy,
+    aplicar_delta_liquidacion,
+    delta_por_movimiento,
+    delta_por_eliminacion,
+    obtener_liquidacion_del_dia,
+    aplicar_abono,
+    totales_diarios,
+    rebuild_liquidaciones,
 )
 from tiempo import (
     hora_actual,   # ✅ Devuelve hora local de Chile (sin tzinfo)
@@ -32,68 +42,27 @@ from tiempo import (
     mes_actual_chile_bounds,
 )
 import tiempo
-
-# ======================================================
-# 🧠 CACHÉ EN MEMORIA + RECÁLCULO EN SEGUNDO PLANO
-# ======================================================
-
-_cache_resumen = {"fecha": None, "data": None, "timestamp": 0}
-
-
-def recalcular_en_segundo_plano(app, fecha):
-    """Recalcula liquidación y resumen en un hilo separado."""
-    with app.app_context():
-        from helpers import (
-            eliminar_cache_resumen_hoy,
-            obtener_resumen_total,
-            actualizar_liquidacion_por_movimiento,
-        )
-
-        try:
-            print("🧵 Iniciando recálculo en segundo plano...")
-
-            eliminar_cache_resumen_hoy()
-            liq_hoy = actualizar_liquidacion_por_movimiento(fecha, commit=True)
-            resumen_total = obtener_resumen_total()
-
-            global _cache_resumen
-            _cache_resumen["fecha"] = fecha
-            _cache_resumen["data"] = {
-                "clientes": None,
-                "resumen_hoy": {
-                    "entradas": liq_hoy.entradas,
-                    "entradas_caja": liq_hoy.entradas_caja,
-                    "prestamos_hoy": liq_hoy.prestamos_hoy,
-                    "salidas": liq_hoy.salidas,
-                    "gastos": liq_hoy.gastos,
-                    "caja_manual": liq_hoy.caja_manual,
-                    "caja": liq_hoy.caja,
-                },
-                "resumen_total": resumen_total,
-            }
-            _cache_resumen["timestamp"] = time.time()
-
-            print("✅ Recálculo en segundo plano terminado.")
-        except Exception as e:
-            current_app.logger.error(f"[BG RECALCULO] Error: {e}")
-
-
-def lanzar_recalculo_async(fecha):
-    """Lanza el recálculo en un hilo aparte, sin bloquear la petición."""
-    app = current_app._get_current_object()
-    hilo = Thread(
-        target=recalcular_en_segundo_plano,
-        args=(app, fecha),
-        daemon=True,
-    )
-    hilo.start()
-
+from recalculo import lanzar_recalculo_async
+from eventos import suscribir, flujo_eventos
+from exportacion import EXPORTACIONES, filas_csv
+from archivo import archivar_prestamos_viejos
+from busqueda import buscar_clientes, LIMITE_BUSQUEDA
+from codigos import registrar_codigo_manual
+from instrumentacion import instrumentacion_activa, resumen_por_endpoint
+from metricas import generar_metricas
+from orden import (
+    orden_al_final, orden_para_posicion, aplicar_orden_completo, aplicar_movimientos,
+    aplicar_movimientos_entre,
+)
 
 # ======================================================
 # 🔧 CONFIGURACIÓN DEL BLUEPRINT
 # ======================================================
 app_rutas = Blueprint("app_rutas", __name__)
 
+# Historial JSON por cliente: se invalida por eventos, el timeout es solo un tope
+CACHE_TIMEOUT_HISTORIAL = 60 * 60
+
 # ======================================================
 # 🔐 LOGIN / AUTENTICACIÓN
 # ======================================================
@@ -118,7 +87,6 @@ def login_required(f):
 @login_required
 def dashboard():
     hoy = local_date()
-    start, end = day_range(hoy)
 
     total_clientes_activos = (
         db.session.query(func.count(Cliente.id))
@@ -126,52 +94,13 @@ def dashboard():
         .scalar() or 0
     )
 
-    total_abonos = (
-        db.session.query(func.coalesce(func.sum(Abono.monto), 0.0))
-        .filter(Abono.fecha >= start, Abono.fecha < end)
-        .scalar() or 0.0
-    )
-
-    total_prestamos = (
-        db.session.query(func.coalesce(func.sum(Prestamo.monto), 0.0))
-        .join(Cliente, Prestamo.cliente_id == Cliente.id)
-        .filter(
-            Cliente.cancelado == False,
-            Prestamo.fecha >= start,
-            Prestamo.fecha < end,
-        )
-        .scalar() or 0.0
-    )
-
-    total_entradas = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0.0))
-        .filter(
-            MovimientoCaja.tipo == "entrada_manual",
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end,
-        )
-        .scalar() or 0.0
-    )
-
-    total_salidas = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0.0))
-        .filter(
-            MovimientoCaja.tipo == "salida",
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end,
-        )
-        .scalar() or 0.0
-    )
-
-    total_gastos = (
-        db.session.query(func.coalesce(func.sum(MovimientoCaja.monto), 0.0))
-        .filter(
-            MovimientoCaja.tipo == "gasto",
-            MovimientoCaja.fecha >= start,
-            MovimientoCaja.fecha < end,
-        )
-        .scalar() or 0.0
-    )
+    # Todos los totales del día en una sola consulta
+    totales = totales_diarios(hoy)
+    total_abonos = totales["abonos"]
+    total_prestamos = totales["prestamo"]
+    total_entradas = totales["entrada_manual"]
+    total_salidas = totales["salida"]
+    total_gastos = totales["gasto"]
 
     caja_total = total_abonos + total_entradas - (total_prestamos + total_salidas + total_gastos)
 
@@ -191,104 +120,68 @@ def dashboard():
 # ======================================================
 # 🏠 RUTA PRINCIPAL — CLIENTES + TARJETA DE RESUMEN (OPTIMIZADA + EN VIVO)
 # ======================================================
+# ======================================================
+# 🏷️ ETag: 304 con UNA consulta si nada cambió
+# ======================================================
+def etag_datos(*partes):
+    """
+    ETag a partir de la versión de datos (invalidacion.py la sube en cada
+    escritura) más lo que cambie la respuesta. None = sin ETag.
+    """
+    version = version_datos()
+    if version is None:
+        return None
+    return "-".join(str(p) for p in (version, *partes))
+
+
+def no_modificado(etag):
+    """True si el navegador ya tiene esta versión (If-None-Match)."""
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def respuesta_condicional(respuesta, etag):
+    resp = make_response(respuesta)
+    if etag is not None:
+        resp.set_etag(etag, weak=True)
+        # Siempre revalidar: el 304 es barato
+        resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def respuesta_304(etag):
+    return respuesta_condicional(("", 304), etag)
+
+
 @app_rutas.route("/")
 @login_required
 def index():
-    # Evita problemas visuales con otros caches internos
-    eliminar_cache_resumen_hoy()
-
     hoy = local_date()
     resaltado_id = request.args.get("resaltar", type=int)
 
-    # ================== 1) RESÚMENES (USANDO CACHÉ) ==================
-    resumen_hoy = None
-    resumen_total = None
-
-    ahora = time.time()
-    # Solo cacheamos los RESÚMENES, no la lista de clientes
-    if (
-        _cache_resumen["fecha"] == hoy
-        and _cache_resumen["data"] is not None
-        and ahora - _cache_resumen["timestamp"] < 30
-    ):
-        print("♻️ Cache de resúmenes usado.")
-        data = _cache_resumen["data"]
-        resumen_hoy = data["resumen_hoy"]
-        resumen_total = data["resumen_total"]
-    else:
-        print("⚙️ Recalculando resúmenes del index...")
-
-        # Liquidación de hoy (sin commit para no recalcular todo el histórico)
-        liq_hoy = actualizar_liquidacion_por_movimiento(hoy, commit=False)
-
-        resumen_hoy = {
-            "entradas": liq_hoy.entradas,
-            "entradas_caja": liq_hoy.entradas_caja,
-            "prestamos_hoy": liq_hoy.prestamos_hoy,
-            "salidas": liq_hoy.salidas,
-            "gastos": liq_hoy.gastos,
-            "caja_manual": liq_hoy.caja_manual,
-            "caja": liq_hoy.caja,
-        }
-
-        # Resumen total
-        resumen_total = obtener_resumen_total()
-
-        # Guardar en caché SOLO los resúmenes
-        _cache_resumen["fecha"] = hoy
-        _cache_resumen["data"] = {
-            "clientes": None,  # ⚠️ No usamos esto ya, solo se mantiene por compatibilidad
-            "resumen_hoy": resumen_hoy,
-            "resumen_total": resumen_total,
-        }
-        _cache_resumen["timestamp"] = ahora
-
-    # ================== 2) CLIENTES (SIEMPRE DESDE BD) ==================
-    # 👉 Aquí está el cambio clave: NO usamos el caché para clientes.
-    clientes = (
-        Cliente.query.options(
-            selectinload(Cliente.prestamos).selectinload(Prestamo.abonos)
-        )
-        .filter_by(cancelado=False)
-        .order_by(Cliente.orden.asc().nullsfirst(), Cliente.id.asc())
-        .all()
+    # 🏷️ Nada cambió desde la última vez → 304 sin ORM ni render
+    # (con mensajes flash pendientes siempre se renderiza, para mostrarlos)
+    etag = None if session.get("_flashes") else etag_datos(
+        "index", hoy.isoformat(), resaltado_id or "", session.get("usuario", "")
     )
+    if no_modificado(etag):
+        return respuesta_304(etag)
 
-    # 2.a) Reparar orden roto si hace falta
-    orden_cambiado = False
-    for idx, c in enumerate(clientes, start=1):
-        if not c.orden or c.orden != idx:
-            c.orden = idx
-            orden_cambiado = True
-    if orden_cambiado:
-        db.session.commit()
+    # ================== 1) RESÚMENES (CACHÉ COMPARTIDO) ==================
+    # Se invalidan explícitamente en cada escritura, no hay ventana de TTL
+    resumenes = obtener_resumenes_del_dia(hoy)
+    resumen_hoy = resumenes["resumen_hoy"]
+    resumen_total = resumenes["resumen_total"]
 
-    # 2.b) Estado de plazo sin N+1
-    subquery = (
-        db.session.query(
-            Prestamo.cliente_id,
-            func.max(Prestamo.fecha).label("ultima_fecha"),
-        )
-        .group_by(Prestamo.cliente_id)
-        .subquery()
-    )
-
-    ultimos_prestamos = (
-        db.session.query(Prestamo)
-        .join(
-            subquery,
-            and_(
-                Prestamo.cliente_id == subquery.c.cliente_id,
-                Prestamo.fecha == subquery.c.ultima_fecha,
-            ),
-        )
-        .all()
-    )
-    mapa_ultimo_prestamo = {p.cliente_id: p for p in ultimos_prestamos}
+    # ================== 2) CLIENTES (SIEMPRE DESDE BD) ==================
+    # 👉 Aquí está el cambio clave: NO usamos el caché para clientes.
+    # Solo el préstamo vigente y su último abono, no todo el histórico
+    # (la posición 1..n se numera en la plantilla; el GET no escribe nada)
+    clientes = listar_clientes_activos()
 
+    # 2.a) Estado de plazo desde el préstamo vigente (sin subconsulta extra)
     for c in clientes:
         estado = "normal"
-        p = mapa_ultimo_prestamo.get(c.id)
+        p = c.ultimo_prestamo()
         if p and p.plazo:
             fecha_venc = p.fecha + timedelta(days=p.plazo)
             dias_pasados = (hoy - fecha_venc).days
@@ -299,7 +192,7 @@ def index():
         c.estado_plazo = estado
 
     # ================== 3) RENDER ==================
-    return render_template(
+    return respuesta_condicional(render_template(
         "index.html",
         clientes=clientes,
         resumen_hoy=resumen_hoy,
@@ -307,9 +200,47 @@ def index():
         hoy=hoy,
         hora_chile=hora_chile,
         resaltado_id=resaltado_id,
+    ), etag)
+
+
+# ======================================================
+# 📡 EVENTOS EN VIVO (SSE): resumen y saldos sin recargar "/"
+# ======================================================
+@app_rutas.route("/eventos")
+@login_required
+def eventos_en_vivo():
+    cola = suscribir()
+    if cola is None:
+        # Sin hilos libres para otra conexión abierta: 204 hace que EventSource
+        # no reintente y el index pasa a consultar /resumen_en_vivo
+        return "", 204
+
+    return Response(
+        stream_with_context(flujo_eventos(cola)),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # sin buffer en proxies (nginx)
+        },
     )
 
 
+@app_rutas.route("/resumen_en_vivo")
+@login_required
+def resumen_en_vivo():
+    """Resumen del día para el index cuando no hay /eventos (consulta por intervalos)."""
+    hoy = local_date()
+    etag = etag_datos("resumen_en_vivo", hoy.isoformat())
+    if no_modificado(etag):
+        return respuesta_304(etag)
+
+    resumenes = obtener_resumenes_del_dia(hoy)
+    return respuesta_condicional(jsonify({
+        "resumen_hoy": resumenes["resumen_hoy"],
+        "resumen_total": resumenes["resumen_total"],
+    }), etag)
+
+
 # ======================================================
 # 🔐 LOGIN Y LOGOUT
 # ======================================================
@@ -372,15 +303,11 @@ def nuevo_cliente():
                 flash(msg, "warning")
                 return redirect(url_for("app_rutas.nuevo_cliente"))
 
-            # 🔹 Calcular orden si no viene
+            # 🔹 Posición en la ruta → llave de orden (al final si no viene)
             if not orden or orden <= 0:
-                max_orden = (
-                    db.session.query(func.coalesce(func.max(Cliente.orden), 0))
-                    .filter(Cliente.cancelado == False)
-                    .scalar()
-                    or 0
-                )
-                orden = max_orden + 1
+                orden = orden_al_final()
+            else:
+                orden = orden_para_posicion(orden)
 
             hoy = local_date()
 
@@ -414,16 +341,6 @@ def nuevo_cliente():
                 db.session.add(nuevo)
                 db.session.flush()
 
-                # Reordenar clientes activos
-                Cliente.query.filter(
-                    Cliente.id != nuevo.id,
-                    Cliente.cancelado == False,
-                    Cliente.orden >= nuevo.orden,
-                ).update(
-                    {Cliente.orden: Cliente.orden + 1},
-                    synchronize_session=False,
-                )
-
                 # Crear préstamo si hay monto
                 if monto > 0:
                     saldo_total = monto + (monto * interes / 100)
@@ -441,14 +358,18 @@ def nuevo_cliente():
                         monto=monto,
                         descripcion=f"Renovación del préstamo para {nuevo.nombre}",
                         fecha=hora_actual(),
+                        cliente_id=nuevo.id,
+                        prestamo=prestamo,
                     )
                     nuevo.saldo = saldo_total
+                    nuevo.prestamo_actual = prestamo
                     db.session.add_all([prestamo, mov])
+                    aplicar_delta_liquidacion(prestamos_hoy=monto)
 
                 db.session.commit()
 
-                # ❌ recalculo desactivado para evitar lentitud
-                # lanzar_recalculo_async(hoy)
+                # 🧵 Recálculo en el pool (se junta con otros pedidos del día)
+                lanzar_recalculo_async(hoy)
 
                 if es_fetch:
                     return jsonify({"ok": True}), 200
@@ -492,15 +413,8 @@ def nuevo_cliente():
             db.session.add(nuevo)
             db.session.flush()
 
-            # Reordenar clientes activos
-            Cliente.query.filter(
-                Cliente.id != nuevo.id,
-                Cliente.cancelado == False,
-                Cliente.orden >= nuevo.orden,
-            ).update(
-                {Cliente.orden: Cliente.orden + 1},
-                synchronize_session=False,
-            )
+            # Código escrito a mano: que la secuencia no lo vuelva a repartir
+            registrar_codigo_manual(codigo)
 
             # Crear préstamo inicial
             if monto > 0:
@@ -519,14 +433,18 @@ def nuevo_cliente():
                     monto=monto,
                     descripcion=f"Préstamo inicial a {nuevo.nombre}",
                     fecha=hora_actual(),
+                    cliente_id=nuevo.id,
+                    prestamo=prestamo,
                 )
                 nuevo.saldo = saldo_total
+                nuevo.prestamo_actual = prestamo
                 db.session.add_all([prestamo, mov])
+                aplicar_delta_liquidacion(prestamos_hoy=monto)
 
             db.session.commit()
 
-            # ❌ recalculo desactivado para evitar lentitud
-            # lanzar_recalculo_async(hoy)
+            # 🧵 Recálculo en el pool (se junta con otros pedidos del día)
+            lanzar_recalculo_async(hoy)
 
             if es_fetch:
                 return jsonify({"ok": True}), 200
@@ -553,6 +471,17 @@ def nuevo_cliente():
     return render_template("nuevo_cliente.html", codigo_sugerido=codigo_sugerido)
 
 
+@app_rutas.route("/nuevo_codigo_cliente", methods=["POST"])
+@login_required
+def nuevo_codigo_cliente():
+    """Botón "generar código" del formulario: reserva otro código de la secuencia."""
+    try:
+        return jsonify({"ok": True, "codigo": generar_codigo_cliente()})
+    except Exception as e:
+        print("[ERROR nuevo_codigo_cliente]", e)
+        return jsonify({"ok": False, "error": "No se pudo generar el código"}), 500
+
+
 # ======================================================
 # 📋 CLIENTES CANCELADOS — VERSIÓN FINAL (detecta renovados por código activo)
 # ======================================================
@@ -560,96 +489,59 @@ def nuevo_cliente():
 @login_required
 def clientes_cancelados_view():
     """
-    Muestra todos los clientes cancelados (cancelado=True y saldo=0),
-    conservando el histórico y marcando en verde los que fueron renovados.
+    Muestra los clientes cancelados (cancelado=True y saldo=0), conservando
+    el histórico y marcando en verde los que fueron renovados.
     Se considera 'renovado' si existe otro cliente activo con el mismo código.
+    Paginado por llave: ?despues=<orden>_<id> (link "Ver más").
     """
-    from datetime import datetime
-
-    clientes_cancelados = (
-        Cliente.query
-        .filter(Cliente.cancelado == True, Cliente.saldo <= 0.01)
-        .order_by(Cliente.orden.asc().nullslast())
-        .all()
-    )
-
-    data = []
-    for c in clientes_cancelados:
-        if not c.prestamos:
-            continue
-
-        prestamo = max(c.prestamos, key=lambda p: p.fecha)
-        fecha_salida = c.ultimo_abono_fecha or prestamo.fecha
-        salida_total = prestamo.monto + (prestamo.monto * (prestamo.interes or 0) / 100)
-        ultimo_abono_monto = 0.0
-
-        # 💚 Nuevo criterio de renovación:
-        # existe otro cliente activo con el mismo código
-        renovado = Cliente.query.filter(
-            Cliente.codigo == c.codigo,
-            Cliente.cancelado == False,
-            Cliente.id != c.id
-        ).first() is not None
-
-        # 🧮 Días de duración
+    despues = None
+    cursor = request.args.get("despues") or ""
+    if cursor:
         try:
-            dias = (fecha_salida - prestamo.fecha).days if fecha_salida else 0
-        except TypeError:
-            dias = 0
-
-        # 💰 Último abono
-        if prestamo.abonos:
-            ultimo = max(prestamo.abonos, key=lambda a: a.fecha)
-            ultimo_abono_monto = ultimo.monto
-
-        data.append({
-            "id": c.id,
-            "orden": c.orden,
-            "codigo": c.codigo,
-            "dias": dias,
-            "fecha_salida": fecha_salida.strftime("%d-%m-%Y") if fecha_salida else "—",
-            "nombre": c.nombre,
-            "salida_total": salida_total,
-            "ultimo_abono_monto": ultimo_abono_monto,
-            "saldo": round(c.saldo or 0.0, 2),
-            "renovado": renovado,
-        })
+            orden_previo, id_previo = (int(x) for x in cursor.split("_", 1))
+            despues = (orden_previo, id_previo)
+        except ValueError:
+            return redirect(url_for("app_rutas.clientes_cancelados_view"))
 
-    total_cancelados = len(data)
-    total_renovados = sum(1 for c in data if c["renovado"])
+    data, siguiente = listar_clientes_cancelados(despues)
+    total_cancelados, total_renovados = totales_clientes_cancelados()
 
     return render_template(
         "clientes_cancelados.html",
         clientes=data,
         total_cancelados=total_cancelados,
-        total_renovados=total_renovados
+        total_renovados=total_renovados,
+        siguiente=f"{siguiente[0]}_{siguiente[1]}" if siguiente else None,
+        es_continuacion=despues is not None,
+        # Número de fila que se ve (la llave de orden tiene huecos)
+        posicion_inicial=max(request.args.get("n", 0, type=int), 0) if despues else 0,
     )
 
 
 # ======================================================
 # 🧹 LIMPIAR CLIENTES CANCELADOS (versión FINAL mejorada)
 # ======================================================
+# Tope por clic: la petición no se alarga (el resto, en otro clic o por CLI)
+MAX_LOTES_ARCHIVO_POR_PETICION = 20
+
+
 @app_rutas.route("/limpiar_cancelados")
 @login_required
 def limpiar_cancelados():
     """
-    Elimina préstamos antiguos con saldo cero (más de 180 días),
-    manteniendo la base de datos limpia sin afectar registros recientes.
+    Archiva préstamos antiguos con saldo cero (más de 180 días) junto con sus
+    abonos, por lotes cortos (archivo.py). Si quedan muchos, se avisa: se
+    puede volver a pulsar o correr `flask archivar-prestamos`.
     """
-    from datetime import timedelta
-
     try:
-        # 🗓️ Fecha límite (hace 180 días desde hoy)
-        limite = local_date() - timedelta(days=180)
-
-        # 🧾 Buscar y eliminar préstamos viejos cancelados o liquidados
-        prestamos_viejos = Prestamo.query.filter(
-            Prestamo.saldo <= 0,
-            Prestamo.fecha < limite
-        ).delete(synchronize_session=False)
-
-        db.session.commit()
-        flash(f"🧹 Se limpiaron {prestamos_viejos} préstamos antiguos (anteriores a {limite.strftime('%d/%m/%Y')}).", "info")
+        r = archivar_prestamos_viejos(max_lotes=MAX_LOTES_ARCHIVO_POR_PETICION)
+        msg = (
+            f"🧹 Se archivaron {r['prestamos']} préstamos antiguos y {r['abonos']} abonos "
+            f"(anteriores a {r['limite'].strftime('%d/%m/%Y')})."
+        )
+        if r["pendientes"]:
+            msg += f" Quedan {r['pendientes']}: vuelva a ejecutar la limpieza."
+        flash(msg, "info")
 
     except Exception as e:
         db.session.rollback()
@@ -658,6 +550,7 @@ def limpiar_cancelados():
 
     return redirect(url_for("app_rutas.clientes_cancelados_view"))
 
+
 # ======================================================
 # 🔁 REACTIVAR CLIENTE DESDE CANCELADOS (versión FINAL ✅ corregida)
 # ======================================================
@@ -689,7 +582,8 @@ def reactivar_cliente(cliente_id):
     # ======================================================
     # Guardar los valores antes de hacer commit (para evitar DetachedInstanceError)
     codigo_old = cliente_antiguo.codigo
-    orden_old = cliente_antiguo.orden or 1
+    # Vuelve a su lugar de la ruta (su llave), o al final si no tenía
+    orden_old = cliente_antiguo.orden if cliente_antiguo.orden is not None else orden_al_final()
     nombre_old = cliente_antiguo.nombre
     direccion_old = cliente_antiguo.direccion
 
@@ -736,6 +630,7 @@ def reactivar_cliente(cliente_id):
         frecuencia="diario",
     )
     db.session.add(nuevo_prestamo)
+    nuevo_cliente.prestamo_actual = nuevo_prestamo
 
     # ======================================================
     # 💸 5️⃣ Registrar movimiento en caja si hay deuda
@@ -746,6 +641,8 @@ def reactivar_cliente(cliente_id):
             monto=deuda_pendiente,
             descripcion=f"Reactivación de {nuevo_cliente.nombre} — deuda pendiente",
             fecha=hora_actual(),
+            cliente_id=nuevo_cliente.id,
+            prestamo=nuevo_prestamo,
         )
         db.session.add(mov)
 
@@ -755,10 +652,13 @@ def reactivar_cliente(cliente_id):
     nuevo_cliente.saldo = deuda_pendiente
 
     # ======================================================
-    # 💾 7️⃣ Guardar cambios y actualizar liquidación
+    # 💾 7️⃣ Actualizar liquidación y guardar en una sola transacción
     # ======================================================
+    aplicar_delta_liquidacion(
+        prestamos_hoy=deuda_pendiente,
+        salidas=deuda_pendiente if deuda_pendiente > 0 else 0.0,
+    )
     db.session.commit()
-    actualizar_liquidacion_por_movimiento(local_date())
 
     # ======================================================
     # 💬 8️⃣ Respuesta final (Fetch o navegación normal)
@@ -802,6 +702,8 @@ def eliminar_cliente_def(cliente_id):
 
         nombre = cliente.nombre
 
+        # Lo que se borre de HOY sale también de la liquidación del día
+        aplicar_delta_liquidacion(**delta_por_eliminacion(cliente.prestamos))
         db.session.delete(cliente)
         db.session.commit()
 
@@ -823,48 +725,23 @@ def eliminar_cliente_def(cliente_id):
 
 
 # ======================================================
-# ✏️ ACTUALIZAR ORDEN DE CLIENTE — con desplazamiento automático
+# ✏️ ACTUALIZAR ORDEN DE CLIENTE — mueve solo su fila (orden.py)
 # ======================================================
 @app_rutas.route("/actualizar_orden/<int:cliente_id>", methods=["POST"])
 @login_required
 def actualizar_orden(cliente_id):
-    from helpers import eliminar_cache_resumen_hoy
-
-    nueva_orden = request.form.get("orden", type=int)
-    if not nueva_orden or nueva_orden < 1:
+    # "orden" es la posición que ve el usuario (1 = primero de la ruta)
+    nueva_posicion = request.form.get("orden", type=int)
+    if not nueva_posicion or nueva_posicion < 1:
         return "orden inválida", 400
 
     cliente = Cliente.query.get_or_404(cliente_id)
-    orden_actual = cliente.orden or 9999
-
-    if nueva_orden == orden_actual:
-        return "OK"
 
     try:
-        # ✅ REORDENAMIENTO UNIVERSAL (funciona saltos cortos y largos)
-        if nueva_orden < orden_actual:
-            # mover hacia arriba
-            Cliente.query.filter(
-                Cliente.orden >= nueva_orden,
-                Cliente.orden < orden_actual,
-                Cliente.cancelado == False,
-                Cliente.id != cliente.id
-            ).update({Cliente.orden: Cliente.orden + 1}, synchronize_session=False)
-        else:
-            # mover hacia abajo
-            Cliente.query.filter(
-                Cliente.orden <= nueva_orden,
-                Cliente.orden > orden_actual,
-                Cliente.cancelado == False,
-                Cliente.id != cliente.id
-            ).update({Cliente.orden: Cliente.orden - 1}, synchronize_session=False)
-
-        cliente.orden = nueva_orden
+        # Llave entre los vecinos de esa posición: un solo UPDATE
+        cliente.orden = orden_para_posicion(nueva_posicion, excluir_id=cliente.id)
         db.session.commit()
 
-        # 🔥 invalidar cache del día
-        eliminar_cache_resumen_hoy()
-
         return "OK"
 
     except Exception as e:
@@ -872,6 +749,73 @@ def actualizar_orden(cliente_id):
         print("[ERROR actualizar_orden]", e)
         return "error interno", 500
 
+
+# ======================================================
+# 🔀 REORDENAR RUTA COMPLETA — una sola petición (JSON)
+# ======================================================
+MAX_IDS_REORDEN = 5000
+
+
+@app_rutas.route("/reordenar_ruta", methods=["POST"])
+@login_required
+def reordenar_ruta():
+    """
+    Body JSON, una de tres formas:
+      {"movimientos": [{"id": 5, "antes": 2, "despues": 9}]}
+          → lo que manda el arrastre: el movido y sus vecinos (null en los
+            extremos). Una fila por movimiento.
+      {"movimientos": [{"id": 5, "posicion": 1}]}  → por posición (1 = primero)
+      {"ids": [5, 2, 9, ...]}  → la ruta completa (respaldo); solo se
+            reescriben los que cambiaron de orden relativo
+    Todo en una transacción: una lectura de la ruta y un executemany con las
+    llaves que cambian (orden.py).
+    """
+    datos = request.get_json(silent=True) or {}
+    ids = datos.get("ids")
+    movimientos = datos.get("movimientos")
+    por_vecinos = False
+
+    def _id_o_none(valor):
+        return None if valor is None else int(valor)
+
+    try:
+        if isinstance(movimientos, list) and len(movimientos) <= MAX_IDS_REORDEN:
+            por_vecinos = all("posicion" not in m for m in movimientos)
+            if por_vecinos:
+                movimientos = [
+                    (int(m["id"]), _id_o_none(m.get("antes")), _id_o_none(m.get("despues")))
+                    for m in movimientos
+                ]
+            else:
+                movimientos = [(int(m["id"]), int(m["posicion"])) for m in movimientos]
+                if any(pos < 1 for _, pos in movimientos):
+                    raise ValueError
+            ids = None
+        elif isinstance(ids, list) and len(ids) <= MAX_IDS_REORDEN:
+            ids = [int(i) for i in ids]
+        else:
+            raise ValueError
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return jsonify({
+            "ok": False,
+            "error": "Envíe \"movimientos\" ([{id, antes, despues}] o [{id, posicion}]) o \"ids\".",
+        }), 400
+
+    try:
+        if ids is not None:
+            actualizados = aplicar_orden_completo(ids)
+        elif por_vecinos:
+            actualizados = aplicar_movimientos_entre(movimientos)
+        else:
+            actualizados = aplicar_movimientos(movimientos)
+        db.session.commit()
+        return jsonify({"ok": True, "actualizados": actualizados})
+
+    except Exception as e:
+        db.session.rollback()
+        print("[ERROR reordenar_ruta]", e)
+        return jsonify({"ok": False, "error": "No se pudo guardar el orden."}), 500
+
 # ======================================================
 # ❌ ELIMINAR CLIENTE — VERSIÓN FINAL (prestamo_revertido + capital real)
 # ======================================================
@@ -899,21 +843,24 @@ def eliminar_cliente(cliente_id):
         capital_pendiente = capital_total - total_abonos
 
         # ------------------------------------------------------
-        # 2️⃣ Eliminar préstamos y abonos asociados
+        # 2️⃣ Buscar movimientos de caja del cliente (índice por cliente_id)
         # ------------------------------------------------------
-        prestamos_a_eliminar = list(cliente.prestamos)
-        for p in prestamos_a_eliminar:
-            db.session.delete(p)
+        movs_previos = MovimientoCaja.query.filter(
+            MovimientoCaja.cliente_id == cliente.id
+        ).all()
+
+        # Lo borrado que era de HOY se descuenta de la liquidación del día
+        delta_liq = delta_por_eliminacion(cliente.prestamos, movs_previos)
 
         # ------------------------------------------------------
-        # 3️⃣ Eliminar movimientos de caja relacionados anteriores
+        # 3️⃣ Eliminar préstamos, abonos y movimientos asociados
         # ------------------------------------------------------
-        if cliente.nombre:
-            movs_previos = MovimientoCaja.query.filter(
-                MovimientoCaja.descripcion.ilike(f"%{cliente.nombre}%")
-            ).all()
-            for m in movs_previos:
-                db.session.delete(m)
+        prestamos_a_eliminar = list(cliente.prestamos)
+        cliente.prestamo_actual = None
+        for p in prestamos_a_eliminar:
+            db.session.delete(p)
+        for m in movs_previos:
+            db.session.delete(m)
 
         # ------------------------------------------------------
         # 4️⃣ Marcar cliente como cancelado
@@ -930,14 +877,15 @@ def eliminar_cliente(cliente_id):
                 monto=capital_pendiente,
                 descripcion=f"♻️ Reversión de capital del cliente {cliente.nombre}",
                 fecha=hora_actual(),
+                cliente_id=cliente.id,
             )
             db.session.add(mov_reverso)
 
         # ------------------------------------------------------
-        # 6️⃣ Guardar cambios
+        # 6️⃣ Actualizar liquidación y guardar cambios
         # ------------------------------------------------------
+        aplicar_delta_liquidacion(**delta_liq)
         db.session.commit()
-        actualizar_liquidacion_por_movimiento(local_date())
 
         # ------------------------------------------------------
         # 7️⃣ Respuesta flexible (HTML o AJAX)
@@ -1008,6 +956,7 @@ def otorgar_prestamo(cliente_id):
     db.session.add(prestamo)
 
     # 🧍‍♂️ Sincronizar el CLIENTE con este nuevo préstamo
+    cliente.prestamo_actual = prestamo
     cliente.monto = monto
     cliente.interes = interes
     cliente.plazo = plazo
@@ -1021,19 +970,83 @@ def otorgar_prestamo(cliente_id):
         monto=monto,
         descripcion=f"Préstamo a {cliente.nombre}",
         fecha=hora_actual(),
+        cliente_id=cliente.id,
+        prestamo=prestamo,
     )
     db.session.add(mov)
 
-    # 🧮 Actualizar cache / liquidación
-    eliminar_cache_resumen_hoy()
-    db.session.commit()
-
-    actualizar_liquidacion_por_movimiento(hoy, commit=False)
+    # 🧮 Actualizar liquidación (misma transacción)
+    aplicar_delta_liquidacion(prestamos_hoy=monto)
     db.session.commit()
 
     flash(f"Préstamo de ${monto:.0f} otorgado a {cliente.nombre}", "success")
     return redirect(url_for("app_rutas.index", focus_abono=cliente.id))
 
+# ======================================================
+# 📊 MÉTRICAS PROMETHEUS — todos los workers sumados
+# ======================================================
+@app_rutas.route("/metrics")
+def metricas_prometheus():
+    """
+    Formato texto de Prometheus (metricas.py). Con METRICAS_TOKEN se pide
+    "Authorization: Bearer <token>" (para el scraper); sin él, sesión iniciada.
+    """
+    token = os.getenv("METRICAS_TOKEN")
+    if token:
+        if request.headers.get("Authorization", "") != f"Bearer {token}":
+            return Response("no autorizado\n", status=401, mimetype="text/plain")
+    elif "usuario" not in session:
+        return Response("no autorizado\n", status=401, mimetype="text/plain")
+
+    texto, tipo = generar_metricas()
+    return Response(texto, content_type=tipo)
+
+
+# ======================================================
+# 🔬 DIAGNÓSTICO SQL — resumen por endpoint (SQL_INSTRUMENTACION=1)
+# ======================================================
+@app_rutas.route("/diagnostico/sql")
+@login_required
+def diagnostico_sql():
+    """Consultas y tiempo de BD por endpoint, de ESTE worker (instrumentacion.py)."""
+    if not instrumentacion_activa():
+        return jsonify({"ok": False, "error": "Instrumentación desactivada (SQL_INSTRUMENTACION=1)"}), 404
+    return jsonify({"ok": True, "pid": os.getpid(), "endpoints": resumen_por_endpoint()})
+
+
+# ======================================================
+# 🔍 BUSCAR CLIENTES — autocompletar (JSON compacto)
+# ======================================================
+@app_rutas.route("/buscar_clientes")
+@login_required
+def buscar_clientes_json():
+    """
+    ?q=texto&limite=N → primeros N clientes por código, nombre, dirección o
+    teléfono (ver busqueda.py). Menos de 2 caracteres → lista vacía.
+    """
+    try:
+        limite = int(request.args.get("limite", LIMITE_BUSQUEDA))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Límite inválido"}), 400
+
+    filas = buscar_clientes(request.args.get("q", ""), limite)
+    return jsonify({
+        "ok": True,
+        "clientes": [
+            {
+                "id": f.id,
+                "codigo": f.codigo,
+                "nombre": f.nombre,
+                "direccion": f.direccion or "",
+                "telefono": f.telefono or "",
+                "saldo": round(float(f.saldo or 0), 2),
+                "cancelado": bool(f.cancelado),
+            }
+            for f in filas
+        ],
+    })
+
+
 # ======================================================
 # 🧾 HISTORIAL DE ABONOS — para modal (vista cancelados)
 # ======================================================
@@ -1089,7 +1102,25 @@ def historial_abonos_html(cliente_id):
 @app_rutas.route("/historial_abonos/<int:cliente_id>")
 @login_required
 def historial_abonos_json(cliente_id):
-    """Devuelve el historial de abonos y datos del préstamo en formato JSON."""
+    """
+    Devuelve el historial de abonos y datos del préstamo en formato JSON.
+    Se cachea por cliente; invalidacion.py lo borra al cambiar sus abonos/préstamos.
+    Con If-None-Match vigente responde 304 sin tocar cache ni ORM.
+    """
+    etag = etag_datos("historial", cliente_id)
+    if no_modificado(etag):
+        return respuesta_304(etag)
+
+    clave = clave_cache_historial(cliente_id)
+    payload = cache.get(clave)
+    if payload is None:
+        payload = _historial_abonos_payload(cliente_id)
+        cache.set(clave, payload, timeout=CACHE_TIMEOUT_HISTORIAL)
+    return respuesta_condicional(jsonify(payload), etag)
+
+
+def _historial_abonos_payload(cliente_id):
+    """Arma el dict del historial de abonos (404 si el cliente no existe)."""
     from datetime import datetime
 
     cliente = Cliente.query.get_or_404(cliente_id)
@@ -1100,12 +1131,12 @@ def historial_abonos_json(cliente_id):
     )
 
     if not prestamo:
-        return jsonify({"ok": False, "error": "El cliente no tiene préstamos registrados."})
+        return {"ok": False, "error": "El cliente no tiene préstamos registrados."}
 
     # 🔹 Ordenar por fecha ascendente (más antiguos primero)
     abonos = sorted(prestamo.abonos, key=lambda a: a.fecha or datetime.min)
     if not abonos:
-        return jsonify({"ok": False, "error": "No se registran abonos para este cliente."})
+        return {"ok": False, "error": "No se registran abonos para este cliente."}
 
     # 🔹 Calcular el saldo histórico correctamente
     saldo_restante = prestamo.monto + (prestamo.monto * (prestamo.interes or 0) / 100)
@@ -1136,11 +1167,11 @@ def historial_abonos_json(cliente_id):
         "saldo": float(prestamo.saldo or 0),
     }
 
-    return jsonify({
+    return {
         "ok": True,
         "prestamo": data_prestamo,
         "abonos": data_abonos
-    })
+    }
 
 # ======================================================
 # 💰 REGISTRAR ABONO POR CÓDIGO (mensual vs mensual_interes)
@@ -1149,6 +1180,9 @@ def historial_abonos_json(cliente_id):
 @login_required
 def registrar_abono_por_codigo():
     codigo = (request.form.get("codigo") or "").strip()
+    clave = (
+        request.form.get("clave") or request.headers.get("Idempotency-Key") or ""
+    ).strip()[:64] or None
 
     # monto seguro (evita ValueError si viene vacío o texto)
     try:
@@ -1171,6 +1205,12 @@ def registrar_abono_por_codigo():
             flash(msg, "success")
         return redirect(url_for("app_rutas.index"))
 
+    # 🔑 Reintento de un abono ya registrado: responder lo mismo sin cobrar
+    if clave:
+        previo = Abono.query.filter_by(clave_idempotencia=clave).first()
+        if previo:
+            return resp_ok(_respuesta_abono_duplicado(previo, codigo))
+
     # ⚠️ Validar monto
     if monto <= 0:
         return resp_error("Monto inválido.", 400, "danger")
@@ -1199,7 +1239,7 @@ def registrar_abono_por_codigo():
         )
 
     # 🔎 Tomar SIEMPRE el préstamo más reciente del cliente
-    prestamo = (
+    prestamo = cliente.prestamo_actual or (
         Prestamo.query.filter(Prestamo.cliente_id == cliente.id)
         .order_by(Prestamo.fecha.desc(), Prestamo.id.desc())
         .first()
@@ -1207,117 +1247,281 @@ def registrar_abono_por_codigo():
     if not prestamo:
         return resp_error("Cliente sin préstamos registrados.", 400, "warning")
 
-    hoy = local_date()
-    frecuencia = (prestamo.frecuencia or "").lower().strip()
+    # El INSERT con la clave puede fallar en cualquier flush (el del delta o
+    # el del commit): todo va dentro del try
+    try:
+        # 💾 Abono + entrada en caja + saldos (mensual_interes no baja saldo)
+        resultado = aplicar_abono(cliente, prestamo, monto, clave=clave)
 
-    # ======================================================
-    # ✅ CASO 1: MENSUAL SOLO INTERÉS (NO baja saldo, SÍ quita alerta)
-    # ======================================================
-    if frecuencia == "mensual_interes":
-        abono = Abono(
-            prestamo_id=prestamo.id,
-            monto=monto,
-            fecha=hora_actual()
+        # abono + entrada en caja → delta en la liquidación de hoy
+        aplicar_delta_liquidacion(entradas=monto, entradas_caja=monto)
+        db.session.commit()
+    except IntegrityError:
+        # La misma clave entró en paralelo (doble envío): devolver ese abono
+        db.session.rollback()
+        previo = Abono.query.filter_by(clave_idempotencia=clave).first()
+        if not previo:
+            raise
+        return resp_ok(_respuesta_abono_duplicado(previo, codigo))
+
+    if resultado["interes_aplicado"]:
+        msg = f"💰 Interés mensual registrado para {cliente.nombre} ✅ (se quitó la alerta)"
+    else:
+        msg = (
+            f"✅ Abono registrado para {cliente.nombre}. Saldo: {cliente.saldo:.2f}"
+            + (" (cliente cancelado)" if resultado["cancelado"] else "")
         )
-        db.session.add(abono)
+    return resp_ok(resultado, msg=msg)
 
-        db.session.add(MovimientoCaja(
-            tipo="entrada_manual",  # cambia si quieres: "interes"
-            monto=monto,
-            descripcion=f"Pago interés mensual (solo interés) de {cliente.nombre}",
-            fecha=hora_actual()
-        ))
 
-        # ✅ quita la alerta visual
-        cliente.ultimo_interes_fecha = hoy
+# ======================================================
+# 📦 REGISTRAR ABONOS EN LOTE (fin de ruta del cobrador)
+# ======================================================
+MAX_ABONOS_POR_LOTE = 500
 
-        # para mostrar "Último abono" en el index
-        cliente.ultimo_abono_fecha = hoy
 
-        db.session.commit()
-        actualizar_liquidacion_por_movimiento(hoy)
+def _leer_lineas_abono(datos, exigir_clave=False):
+    """
+    Valida el body {"abonos": [...]} y normaliza cada línea a (codigo, monto, clave).
+    Devuelve (pedidos, error).
+    """
+    lineas = (datos or {}).get("abonos")
 
-        return resp_ok(
-            {
-                "ok": True,
-                "cliente_id": cliente.id,
-                "cliente_nombre": cliente.nombre,
-                "saldo": float(cliente.saldo or 0),
-                "cancelado": False,
-                "monto": float(monto),
-                "interes_aplicado": True,
-                "modo": "mensual_interes"
-            },
-            msg=f"💰 Interés mensual registrado para {cliente.nombre} ✅ (se quitó la alerta)"
+    if not isinstance(lineas, list) or not lineas:
+        return None, "Debe enviar una lista de abonos."
+    if len(lineas) > MAX_ABONOS_POR_LOTE:
+        return None, f"Máximo {MAX_ABONOS_POR_LOTE} abonos por lote."
+
+    pedidos = []
+    for linea in lineas:
+        linea = linea if isinstance(linea, dict) else {}
+        codigo = str(linea.get("codigo") or "").strip()
+        try:
+            monto = float(str(linea.get("monto") or "").replace(",", "."))
+        except ValueError:
+            monto = 0.0
+        clave = str(linea.get("clave") or "").strip()[:64] or None
+        if exigir_clave and not clave:
+            return None, "Cada abono debe traer su clave."
+        pedidos.append((codigo, monto, clave))
+    return pedidos, None
+
+
+def _respuesta_abono_duplicado(abono, codigo=None):
+    """Resultado de un abono que ya estaba registrado con esa clave (no se cobra de nuevo)."""
+    cliente = abono.prestamo.cliente if abono.prestamo else None
+    return {
+        "ok": True,
+        "duplicado": True,
+        "codigo": codigo or (cliente.codigo if cliente else None),
+        "clave": abono.clave_idempotencia,
+        "cliente_id": cliente.id if cliente else None,
+        "cliente_nombre": cliente.nombre if cliente else None,
+        "saldo": float(cliente.saldo or 0) if cliente else 0.0,
+        "cancelado": bool(cliente.cancelado) if cliente else False,
+        "monto": float(abono.monto),
+        "interes_aplicado": False,
+    }
+
+
+def _registrar_lineas_abono(pedidos):
+    """
+    Registra (codigo, monto, clave) en la transacción actual, sin commit.
+    Las claves ya registradas (o repetidas en el mismo lote) salen como
+    duplicado sin volver a cobrar. Devuelve (resultados, total).
+    """
+    # 🔑 0) Claves ya registradas: una sola consulta por el índice único
+    claves = {clave for _, _, clave in pedidos if clave}
+    previos = {}
+    if claves:
+        for a in Abono.query.filter(Abono.clave_idempotencia.in_(claves)):
+            previos[a.clave_idempotencia] = a
+
+    codigos = {codigo for codigo, _, _ in pedidos if codigo}
+
+    # 🔍 1) Clientes activos + préstamo vigente (sin cargar histórico)
+    clientes = (
+        Cliente.query.options(
+            selectinload(Cliente.prestamo_actual).lazyload(Prestamo.abonos),
+            lazyload(Cliente.prestamos),
         )
+        .filter(Cliente.codigo.in_(codigos), Cliente.cancelado == False)
+        .order_by(Cliente.id.asc())
+        .all()
+    ) if codigos else []
 
-    # ======================================================
-    # ✅ CASO 2: ABONO NORMAL (SÍ baja saldo)
-    # ======================================================
+    por_codigo = {}
+    for c in clientes:
+        por_codigo.setdefault(c.codigo, c)
+
+    # 🔎 2) Clientes antiguos sin puntero: último préstamo en una consulta
+    sin_puntero = [c.id for c in por_codigo.values() if c.prestamo_actual_id is None]
+    ultimos = {}
+    if sin_puntero:
+        for p in (
+            Prestamo.query.options(lazyload(Prestamo.abonos))
+            .filter(Prestamo.cliente_id.in_(sin_puntero))
+            .order_by(Prestamo.fecha.asc(), Prestamo.id.asc())
+        ):
+            ultimos[p.cliente_id] = p
 
-    # saldo del préstamo (si no existe, usa el del cliente)
-    saldo_prestamo = round(float(getattr(prestamo, "saldo", None) or saldo_cliente), 2)
+    hoy = local_date()
+    resultados = []
+    total = 0.0
+    filas = {"abonos": [], "movimientos": []}
+    vistas = {}
+
+    for codigo, monto, clave in pedidos:
+        if clave in previos:
+            resultados.append(_respuesta_abono_duplicado(previos[clave], codigo))
+            continue
+        if clave in vistas:
+            resultados.append(dict(vistas[clave], duplicado=True))
+            continue
 
-    # aplicar abono
-    nuevo_saldo = round(saldo_prestamo - monto, 2)
-    if nuevo_saldo < 0:
-        nuevo_saldo = 0.0
+        if monto <= 0:
+            resultados.append({"ok": False, "codigo": codigo, "clave": clave, "error": "Monto inválido."})
+            continue
 
-    # registrar abono
-    abono = Abono(
-        prestamo_id=prestamo.id,
-        monto=monto,
-        fecha=hora_actual()
-    )
-    db.session.add(abono)
+        cliente = por_codigo.get(codigo)
+        if cliente is None or cliente.cancelado:
+            resultados.append({
+                "ok": False,
+                "codigo": codigo,
+                "clave": clave,
+                "error": f"El cliente con código {codigo} no existe o ya está cancelado.",
+            })
+            continue
 
-    # caja
-    db.session.add(MovimientoCaja(
-        tipo="entrada_manual",
-        monto=monto,
-        descripcion=f"Abono de {cliente.nombre} (código {cliente.codigo})",
-        fecha=hora_actual()
-    ))
+        # ⛔ Saldo inconsistente: a cancelados (igual que el abono individual)
+        if round(float(cliente.saldo or 0), 2) <= 0:
+            cliente.saldo = 0.0
+            cliente.cancelado = True
+            resultados.append({
+                "ok": False,
+                "codigo": codigo,
+                "clave": clave,
+                "error": "Cliente sin préstamos pendientes (saldo 0, movido a cancelados).",
+            })
+            continue
 
-    # actualizar saldos
-    prestamo.saldo = nuevo_saldo
-    cliente.saldo = nuevo_saldo
+        prestamo = cliente.prestamo_actual or ultimos.get(cliente.id)
+        if prestamo is None:
+            resultados.append({
+                "ok": False, "codigo": codigo, "clave": clave,
+                "error": "Cliente sin préstamos registrados.",
+            })
+            continue
 
-    # para index
-    cliente.ultimo_abono_fecha = hoy
+        resultado = aplicar_abono(cliente, prestamo, monto, hoy, filas=filas, clave=clave)
+        resultado["codigo"] = codigo
+        resultado["clave"] = clave
+        resultados.append(resultado)
+        if clave:
+            vistas[clave] = resultado
+        total += monto
+
+    # 💾 INSERT masivo (executemany) de abonos y movimientos de caja
+    if filas["abonos"]:
+        db.session.execute(insert(Abono), filas["abonos"])
+        db.session.execute(insert(MovimientoCaja), filas["movimientos"])
+        anotar_cambios(
+            db.session,
+            fechas=[hoy],
+            clientes=[r["cliente_id"] for r in resultados if r.get("ok")],
+        )
 
-    # si quieres “quitar alertas” del préstamo normal según tu lógica,
-    # acá es donde se haría (ej: cliente.ultimo_interes_fecha = hoy),
-    # pero solo si aplica en tu sistema.
+    # Un solo delta a la liquidación
+    if total:
+        aplicar_delta_liquidacion(entradas=total, entradas_caja=total)
 
-    # cancelar si llegó a 0
-    cancelado = False
-    if nuevo_saldo <= 0:
-        prestamo.saldo = 0.0
-        cliente.saldo = 0.0
-        cliente.cancelado = True
-        cancelado = True
+    return resultados, total
 
-    db.session.commit()
-    actualizar_liquidacion_por_movimiento(hoy)
 
-    return resp_ok(
-        {
-            "ok": True,
-            "cliente_id": cliente.id,
-            "cliente_nombre": cliente.nombre,
-            "saldo": float(cliente.saldo or 0),
-            "cancelado": cancelado,
-            "monto": float(monto),
-            "interes_aplicado": False,
-            "modo": "normal"
-        },
-        msg=f"✅ Abono registrado para {cliente.nombre}. Saldo: {cliente.saldo:.2f}"
-            + (" (cliente cancelado)" if cancelado else "")
+def _respuesta_lote(resultados, total):
+    registrados = sum(1 for r in resultados if r["ok"] and not r.get("duplicado"))
+    duplicados = sum(1 for r in resultados if r.get("duplicado"))
+    return jsonify({
+        "ok": True,
+        "registrados": registrados,
+        "duplicados": duplicados,
+        "rechazados": len(resultados) - registrados - duplicados,
+        "total": round(total, 2),
+        "resultados": resultados,
+    }), 200
+
+
+@app_rutas.route("/registrar_abonos_lote", methods=["POST"])
+@login_required
+def registrar_abonos_lote():
+    """
+    Registra muchos abonos en UNA transacción.
+    Body JSON: {"abonos": [{"codigo": "123456", "monto": 5000, "clave": "..."}, ...]}
+    ("clave" es opcional).
+
+    Resuelve clientes y préstamos vigentes en dos consultas, inserta todos los
+    Abono/MovimientoCaja con un INSERT masivo, aplica un solo delta a la
+    liquidación y hace un solo commit. Responde el resultado de cada línea, en orden.
+    """
+    pedidos, error = _leer_lineas_abono(request.get_json(silent=True))
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+
+    try:
+        resultados, total = _registrar_lineas_abono(pedidos)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("[ERROR registrar_abonos_lote]")
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    return _respuesta_lote(resultados, total)
+
+
+# ======================================================
+# 📴 SINCRONIZAR COLA OFFLINE (service worker)
+# ======================================================
+@app_rutas.route("/sincronizar_abonos", methods=["POST"])
+@login_required
+def sincronizar_abonos():
+    """
+    Recibe los abonos que el service worker guardó sin señal.
+    Igual que el lote, pero cada línea DEBE traer su "clave": si ya se
+    registró (reintento tras un corte), se responde duplicado sin cobrar.
+    """
+    pedidos, error = _leer_lineas_abono(request.get_json(silent=True), exigir_clave=True)
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+
+    try:
+        resultados, total = _registrar_lineas_abono(pedidos)
+        db.session.commit()
+    except IntegrityError:
+        # Otro envío con las mismas claves ganó la carrera: reintentar lo resuelve como duplicado
+        db.session.rollback()
+        return jsonify({"ok": False, "reintentar": True, "error": "Sincronización simultánea, reintente."}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("[ERROR sincronizar_abonos]")
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    return _respuesta_lote(resultados, total)
+
+
+# ======================================================
+# 📲 SERVICE WORKER (alcance "/" para poder encolar abonos)
+# ======================================================
+@app_rutas.route("/service-worker.js")
+def service_worker():
+    resp = send_from_directory(
+        current_app.static_folder, "service-worker.js",
+        mimetype="application/javascript",
     )
+    resp.headers["Service-Worker-Allowed"] = "/"
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 
-        
 # ======================================================
 # 🗑️ ELIMINAR ABONO (reactiva y recalcula caja histórica)
 # ======================================================
@@ -1367,18 +1571,11 @@ def eliminar_abono(abono_id):
             # lo consideramos "movido" hoy porque tocaste su deuda
             cliente.ultimo_abono_fecha = local_date()
 
+        # 📅 Reconstruir liquidaciones desde la fecha del abono hasta hoy
+        #    (una consulta por tabla y un solo commit junto con el borrado)
+        rebuild_liquidaciones(fecha_abono, local_date(), commit=False)
         db.session.commit()
 
-        # 📅 Recalcular liquidaciones desde la fecha del abono hasta hoy
-        def _recalc_desde(fecha_inicio):
-            d = fecha_inicio
-            hoy = local_date()
-            while d <= hoy:
-                actualizar_liquidacion_por_movimiento(d, commit=True)
-                d = d + timedelta(days=1)
-
-        _recalc_desde(fecha_abono)
-
         # ✅ Respuesta AJAX
         if request.headers.get("X-Requested-With") == "fetch":
             return jsonify({
@@ -1488,10 +1685,10 @@ def caja_movimiento(tipo):
         fecha=hora_actual(),  # ✅ Corregido: hora local de Chile
     )
     db.session.add(mov)
-    db.session.commit()
 
-    # 🔄 Actualizar liquidación del día
-    actualizar_liquidacion_por_movimiento(local_date())
+    # 🔄 Actualizar liquidación del día (misma transacción)
+    aplicar_delta_liquidacion(**delta_por_movimiento(tipo, monto))
+    db.session.commit()
 
     flash(f"{tipo.replace('_', ' ').capitalize()} registrada correctamente en la caja.", "success")
     return redirect(url_for("app_rutas.liquidacion_view"))
@@ -1532,8 +1729,8 @@ def caja_gasto():
             fecha=hora_actual(),  # ✅ hora real Chile (UTC)
         )
         db.session.add(mov)
+        aplicar_delta_liquidacion(gastos=monto)
         db.session.commit()
-        actualizar_liquidacion_por_movimiento(local_date())
         flash(f"🧾 Gasto de ${monto:.2f} registrado correctamente.", "warning")
     else:
         flash("Debe ingresar un monto válido.", "danger")
@@ -1615,18 +1812,15 @@ def liquidacion_view():
     try:
         hoy = local_date()
 
-        # 1) Garantiza registro de liquidación de hoy con caja_anterior arrastrada
-        crear_liquidacion_para_fecha(hoy)
+        # 1) Liquidación de hoy mantenida por el libro incremental
+        #    (si es el primer acceso del día se reconstruye con caja arrastrada)
+        liq = obtener_liquidacion_del_dia(hoy, commit=True)
 
-        # 2) Recalcula totales del día usando movimientos y abonos (no doble commit)
-        liq = actualizar_liquidacion_por_movimiento(hoy, commit=False)
-        db.session.commit()
-
-        # 3) Resumen global (caja total acumulada y cartera)
-        resumen = obtener_resumen_total()
+        # 2) Resumen global (caja total acumulada y cartera) desde el caché
+        resumen = obtener_resumenes_del_dia(hoy)["resumen_total"]
         cartera_total = float(resumen.get("cartera_total", 0.0))
 
-        # 4) Render compatible con plantilla `liquidacion.html`
+        # 3) Render compatible con plantilla `liquidacion.html`
         return render_template(
             "liquidacion.html",
             hoy=hoy,
@@ -1654,7 +1848,7 @@ def liquidaciones():
     # 🔎 Sin rango: últimos 10 registros reales en BD
     if not fecha_desde or not fecha_hasta:
         items = Liquidacion.query.order_by(Liquidacion.fecha.desc()).limit(10).all()
-        resumen = obtener_resumen_total()
+        resumen = obtener_resumenes_del_dia()["resumen_total"]
         return render_template(
             "liquidaciones.html",
             liquidaciones=items,
@@ -1705,7 +1899,7 @@ def liquidaciones():
             )
         items.append(liq)
 
-    resumen = obtener_resumen_total()
+    resumen = obtener_resumenes_del_dia()["resumen_total"]
     return render_template(
         "liquidaciones.html",
         liquidaciones=items,
@@ -1785,6 +1979,41 @@ def movimientos_por_dia(tipo, fecha):
         hoy=local_date(),
     )
 
+# ======================================================
+# 📤 EXPORTAR CSV (abonos, movimientos, liquidaciones) por rango
+# ======================================================
+@app_rutas.route("/exportar/<tipo>.csv")
+@login_required
+def exportar_csv(tipo):
+    """
+    /exportar/abonos.csv?desde=2025-01-01&hasta=2025-12-31
+    (hasta es opcional: por defecto hoy). Las filas salen en streaming.
+    """
+    if tipo not in EXPORTACIONES:
+        return jsonify({"ok": False, "error": "Tipo de exportación no válido."}), 404
+
+    try:
+        desde = datetime.strptime(request.args.get("desde") or "", "%Y-%m-%d").date()
+        hasta = (
+            datetime.strptime(request.args["hasta"], "%Y-%m-%d").date()
+            if request.args.get("hasta") else local_date()
+        )
+    except ValueError:
+        return jsonify({"ok": False, "error": "Fechas inválidas (use YYYY-MM-DD)."}), 400
+    if hasta < desde:
+        return jsonify({"ok": False, "error": "La fecha 'hasta' es anterior a 'desde'."}), 400
+
+    inicio, _ = day_range(desde)
+    _, fin = day_range(hasta)
+    nombre = f"{tipo}_{desde.isoformat()}_{hasta.isoformat()}.csv"
+
+    return Response(
+        stream_with_context(filas_csv(tipo, inicio, fin)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
 # ======================================================
 # 📅 REPORTES — PRÉSTAMOS POR DÍA
 # ======================================================
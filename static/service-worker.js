@@ -1,19 +1,255 @@
-const CACHE_NAME = 'arquitos-cache-v1';
+// ======================================================
+// service-worker.js — caché de la app + cola offline de abonos
+// ======================================================
+//
+// - Páginas: red primero, copia en caché si no hay señal.
+// - Estáticos: caché primero.
+// - POST /registrar_abono_por_codigo sin señal: el abono se guarda en
+//   IndexedDB (con su clave de idempotencia) y se envía en lotes a
+//   /sincronizar_abonos cuando vuelve la conexión. El servidor descarta las
+//   claves repetidas, así que reenviar nunca cobra dos veces.
+
+const CACHE_NAME = 'arquitos-cache-v2';
 const urlsToCache = [
   '/',
   '/static/style.css',
-  '/static/icon-192.png',
-  '/static/icon-512.png'
+  // Solo archivos que existen: un 404 hace fallar addAll y el worker no se instala
+  '/static/icon-192.png'
 ];
 
+const RUTA_ABONO = '/registrar_abono_por_codigo';
+const RUTA_SYNC = '/sincronizar_abonos';
+const TAG_SYNC = 'sync-abonos';
+const TAMANO_LOTE = 100;
+
+const DB_NOMBRE = 'arquitos-offline';
+const DB_STORE = 'abonos_pendientes';
+
 self.addEventListener('install', event => {
   event.waitUntil(
     caches.open(CACHE_NAME).then(cache => cache.addAll(urlsToCache))
   );
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(k => k !== CACHE_NAME).map(k => caches.delete(k))))
+      .then(() => self.clients.claim())
+      .then(() => sincronizarAbonos())
+  );
 });
 
 self.addEventListener('fetch', event => {
+  const req = event.request;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+
+  // 💰 Abonos: si no hay señal, a la cola
+  if (req.method === 'POST' && url.pathname === RUTA_ABONO) {
+    event.respondWith(registrarAbono(req));
+    return;
+  }
+
+  if (req.method !== 'GET') return;
+
+  // 📄 Páginas: red primero (la lista cambia con cada abono)
+  if (req.mode === 'navigate') {
+    event.respondWith(
+      fetch(req)
+        .then(resp => {
+          if (url.pathname === '/' && resp.ok) {
+            const copia = resp.clone();
+            caches.open(CACHE_NAME).then(cache => cache.put('/', copia));
+          }
+          return resp;
+        })
+        .catch(() => caches.match(req).then(r => r || caches.match('/')))
+    );
+    // Hay señal de nuevo: aprovechar para vaciar la cola
+    event.waitUntil(sincronizarAbonos());
+    return;
+  }
+
+  // 🎨 Estáticos: caché primero
   event.respondWith(
-    caches.match(event.request).then(response => response || fetch(event.request))
+    caches.match(req).then(response => response || fetch(req))
   );
 });
+
+// Background Sync (Chrome/Android); en el resto la página avisa con un mensaje
+self.addEventListener('sync', event => {
+  if (event.tag === TAG_SYNC) {
+    event.waitUntil(sincronizarAbonos(true));
+  }
+});
+
+self.addEventListener('message', event => {
+  if (event.data && event.data.tipo === 'sincronizar_abonos') {
+    event.waitUntil(sincronizarAbonos());
+  }
+});
+
+
+// ======================================================
+// 💰 ABONO: red, o cola si no hay señal
+// ======================================================
+async function registrarAbono(req) {
+  const esFetch = req.headers.get('X-Requested-With') === 'fetch';
+  const form = await req.clone().formData();
+
+  let clave = form.get('clave');
+  if (!clave) {
+    clave = nuevaClave();
+    form.set('clave', clave);
+  }
+
+  try {
+    return await fetch(req.url, {
+      method: 'POST',
+      body: form,
+      headers: { 'X-Requested-With': req.headers.get('X-Requested-With') || '' },
+      credentials: 'same-origin',
+      redirect: esFetch ? 'follow' : 'manual'
+    });
+  } catch (err) {
+    // Sin señal: guardar y responder como si estuviera registrado (pendiente)
+    const codigo = (form.get('codigo') || '').trim();
+    const monto = (form.get('monto') || '').toString().replace(',', '.');
+    await guardarPendiente({ clave, codigo, monto, creado: Date.now() });
+    await pedirSync();
+
+    if (!esFetch) return Response.redirect('/', 303);
+    return new Response(JSON.stringify({
+      ok: true,
+      encolado: true,
+      clave,
+      codigo,
+      monto: Number(monto)
+    }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+  }
+}
+
+function nuevaClave() {
+  if (self.crypto && self.crypto.randomUUID) return self.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function pedirSync() {
+  try {
+    if (self.registration.sync) await self.registration.sync.register(TAG_SYNC);
+  } catch (err) {}
+}
+
+
+// ======================================================
+// 🔁 SINCRONIZAR COLA (lotes, un envío a la vez)
+// ======================================================
+let sincronizando = null;
+
+function sincronizarAbonos(desdeSync = false) {
+  // Varios disparadores a la vez (online, navegación, sync) → un solo envío
+  if (!sincronizando) {
+    sincronizando = vaciarCola(desdeSync).finally(() => { sincronizando = null; });
+  }
+  return sincronizando;
+}
+
+async function vaciarCola(desdeSync) {
+  let enviados = 0;
+
+  while (true) {
+    const pendientes = await leerPendientes(TAMANO_LOTE);
+    if (!pendientes.length) break;
+
+    let resp, data;
+    try {
+      resp = await fetch(RUTA_SYNC, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json', 'X-Requested-With': 'fetch' },
+        body: JSON.stringify({
+          abonos: pendientes.map(p => ({ clave: p.clave, codigo: p.codigo, monto: p.monto }))
+        })
+      });
+      data = await resp.json();
+    } catch (err) {
+      // Sin señal o sesión vencida (login en HTML): queda en cola
+      if (desdeSync) throw err;  // el navegador reintenta el sync más tarde
+      return;
+    }
+
+    if (!resp.ok || !data.ok) {
+      // 409 = otro envío con las mismas claves; el próximo intento las verá como duplicadas
+      return;
+    }
+
+    // Registrados, duplicados y rechazados ya tienen respuesta definitiva
+    await borrarPendientes(data.resultados.map(r => r.clave).filter(Boolean));
+    enviados += pendientes.length;
+    await avisarPaginas({ tipo: 'abonos_sincronizados', resultados: data.resultados });
+  }
+
+  return enviados;
+}
+
+async function avisarPaginas(mensaje) {
+  const paginas = await self.clients.matchAll({ type: 'window' });
+  paginas.forEach(p => p.postMessage(mensaje));
+}
+
+
+// ======================================================
+// 🗄️ INDEXEDDB
+// ======================================================
+function abrirDB() {
+  return new Promise((resolve, reject) => {
+    const pedido = indexedDB.open(DB_NOMBRE, 1);
+    pedido.onupgradeneeded = () => {
+      const store = pedido.result.createObjectStore(DB_STORE, { keyPath: 'clave' });
+      store.createIndex('creado', 'creado');
+    };
+    pedido.onsuccess = () => resolve(pedido.result);
+    pedido.onerror = () => reject(pedido.error);
+  });
+}
+
+async function transaccion(modo, trabajo) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(DB_STORE, modo);
+    const resultado = trabajo(tx.objectStore(DB_STORE));
+    tx.oncomplete = () => { db.close(); resolve(resultado.valor); };
+    tx.onerror = () => { db.close(); reject(tx.error); };
+  });
+}
+
+function guardarPendiente(abono) {
+  return transaccion('readwrite', store => {
+    store.put(abono);
+    return {};
+  });
+}
+
+function leerPendientes(limite) {
+  return transaccion('readonly', store => {
+    const resultado = { valor: [] };
+    // En el orden en que se cobraron
+    store.index('creado').openCursor().onsuccess = e => {
+      const cursor = e.target.result;
+      if (cursor && resultado.valor.length < limite) {
+        resultado.valor.push(cursor.value);
+        cursor.continue();
+      }
+    };
+    return resultado;
+  });
+}
+
+function borrarPendientes(claves) {
+  return transaccion('readwrite', store => {
+    claves.forEach(clave => store.delete(clave));
+    return {};
+  });
+}
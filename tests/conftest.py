@@ -0,0 +1,57 @@
+# ======================================================
+# conftest.py — app contra un SQLite temporal
+# ======================================================
+#
+# app.py lee DATABASE_URL y CACHE_DIR al importarse: se fijan antes.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="arquitos_tests_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_DIRECTORIO, "tests.db")
+os.environ["CACHE_DIR"] = os.path.join(_DIRECTORIO, "cache")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as _app  # noqa: E402
+from cartera import asegurar_estado_global  # noqa: E402
+from extensions import cache, db  # noqa: E402
+
+FETCH = {"X-Requested-With": "fetch"}
+
+
+@pytest.fixture
+def app():
+    _app.config["TESTING"] = True
+    with _app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        asegurar_estado_global()
+        cache.clear()
+        yield _app
+        db.session.remove()
+
+
+@pytest.fixture
+def cliente_http(app):
+    c = app.test_client()
+    with c.session_transaction() as s:
+        s["usuario"] = "tests"
+    return c
+
+
+@pytest.fixture
+def nuevo_cliente(cliente_http):
+    """Crea un cliente con su préstamo por la ruta real; devuelve el código."""
+    def _crear(codigo="111", nombre="Ana", monto=1000, interes=20, plazo=30):
+        r = cliente_http.post(
+            "/nuevo_cliente",
+            data=dict(nombre=nombre, codigo=codigo, monto=monto, interes=interes, plazo=plazo),
+            headers=FETCH,
+        )
+        assert r.status_code == 200, r.data[:300]
+        return codigo
+    return _crear
@@ -0,0 +1,54 @@
+from sqlalchemy import func, insert
+
+import rutas
+from conftest import FETCH
+from extensions import db
+from helpers import local_date
+from modelos import Abono, Cliente, Liquidacion
+
+
+def _abonar(cliente_http, codigo, monto, clave):
+    return cliente_http.post(
+        "/registrar_abono_por_codigo",
+        data=dict(codigo=codigo, monto=monto, clave=clave),
+        headers=FETCH,
+    )
+
+
+def test_reintento_con_la_misma_clave_no_cobra_dos_veces(cliente_http, nuevo_cliente):
+    codigo = nuevo_cliente()
+    primero = _abonar(cliente_http, codigo, 100, "K1")
+    segundo = _abonar(cliente_http, codigo, 100, "K1")
+
+    assert primero.status_code == 200 and not primero.json.get("duplicado")
+    assert segundo.status_code == 200 and segundo.json["duplicado"]
+    assert Abono.query.filter_by(clave_idempotencia="K1").count() == 1
+
+
+def test_clave_insertada_en_paralelo_responde_duplicado(app, cliente_http, nuevo_cliente, monkeypatch):
+    codigo = nuevo_cliente()
+    liq = Liquidacion.query.filter_by(fecha=local_date()).one()
+    entradas_antes = float(liq.entradas or 0)
+    aplicar_abono_real = rutas.aplicar_abono
+
+    def otra_peticion_gana(cliente, prestamo, monto, **kwargs):
+        # Entre la consulta previa de la clave y el flush: otra conexión
+        # registra el mismo abono y hace commit
+        with db.engine.begin() as conexion:
+            conexion.execute(insert(Abono).values(
+                prestamo_id=prestamo.id, monto=monto, clave_idempotencia="K1",
+            ))
+        return aplicar_abono_real(cliente, prestamo, monto, **kwargs)
+
+    monkeypatch.setattr(rutas, "aplicar_abono", otra_peticion_gana)
+    r = _abonar(cliente_http, codigo, 100, "K1")
+
+    assert r.status_code == 200, r.data[:300]
+    assert r.json["duplicado"]
+    db.session.expire_all()
+    assert Abono.query.filter_by(clave_idempotencia="K1").count() == 1
+    # El abono perdedor no dejó delta ni baja de saldo
+    liq = Liquidacion.query.filter_by(fecha=local_date()).one()
+    assert float(liq.entradas or 0) == entradas_antes
+    saldo = db.session.query(func.sum(Cliente.saldo)).filter(Cliente.codigo == codigo).scalar()
+    assert saldo == 1200
@@ -0,0 +1,60 @@
+from datetime import datetime, time, timedelta
+
+from archivo import archivar_prestamos_viejos
+from extensions import db
+from helpers import rebuild_liquidaciones, totales_diarios
+from modelos import Abono, AbonoArchivado, Cliente, Liquidacion, MovimientoCaja, Prestamo
+from tiempo import local_date
+
+
+def _cartera_con_prestamo_viejo_pagado(hoy):
+    """Un préstamo de hace 200 días ya pagado (archivable) y otro vigente."""
+    viejo = hoy - timedelta(days=200)
+    cliente = Cliente(codigo="900", nombre="Vieja", cancelado=True, saldo=0)
+    db.session.add(cliente)
+    db.session.flush()
+
+    pagado = Prestamo(cliente_id=cliente.id, monto=300, saldo=0, fecha=viejo)
+    vigente = Prestamo(cliente_id=cliente.id, monto=100, saldo=60, fecha=hoy - timedelta(days=5))
+    db.session.add_all([pagado, vigente])
+    db.session.flush()
+
+    # Abonos del pagado: uno al inicio y el último HOY (archivar no mira su fecha)
+    for dias, monto in ((199, 100), (150, 100), (0, 100)):
+        db.session.add(Abono(
+            prestamo_id=pagado.id, monto=monto,
+            fecha=datetime.combine(hoy - timedelta(days=dias), time(10)),
+        ))
+    db.session.add(Abono(
+        prestamo_id=vigente.id, monto=40,
+        fecha=datetime.combine(hoy - timedelta(days=2), time(10)),
+    ))
+    db.session.add(MovimientoCaja(
+        tipo="entrada_manual", monto=1000,
+        fecha=datetime.combine(viejo - timedelta(days=1), time(9)),
+    ))
+    db.session.commit()
+    return viejo - timedelta(days=1)
+
+
+def _cajas():
+    return {l.fecha: (l.entradas, l.prestamos_hoy, l.caja) for l in Liquidacion.query}
+
+
+def test_reconstruir_despues_de_archivar_no_cambia_la_caja(app):
+    hoy = local_date()
+    desde = _cartera_con_prestamo_viejo_pagado(hoy)
+
+    rebuild_liquidaciones(desde, hoy)
+    antes = _cajas()
+    totales_hoy = totales_diarios(hoy)
+
+    r = archivar_prestamos_viejos()
+    assert r["prestamos"] == 1 and r["abonos"] == 3
+    assert Abono.query.count() == 1 and AbonoArchivado.query.count() == 3
+
+    rebuild_liquidaciones(desde, hoy)
+    db.session.expire_all()
+    assert _cajas() == antes
+    assert totales_diarios(hoy) == totales_hoy
+    assert antes[hoy][2] == 1000 - 300 + 300 - 100 + 40
@@ -0,0 +1,17 @@
+import eventos
+
+
+def test_tope_deja_hilos_libres_para_el_resto():
+    assert eventos.MAX_SUSCRIPTORES <= eventos.HILOS_WORKER - eventos.HILOS_RESERVADOS
+
+
+def test_eventos_lleno_responde_204_y_queda_la_consulta(cliente_http, monkeypatch):
+    monkeypatch.setattr(eventos, "MAX_SUSCRIPTORES", 0)
+    assert cliente_http.get("/eventos").status_code == 204
+
+    cliente_http.get("/resumen_en_vivo")  # la primera crea la liquidación del día
+    r = cliente_http.get("/resumen_en_vivo")
+    assert r.status_code == 200
+    assert {"resumen_hoy", "resumen_total"} <= set(r.json)
+    r = cliente_http.get("/resumen_en_vivo", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
@@ -0,0 +1,74 @@
+import threading
+
+from sqlalchemy import event, update
+
+from conftest import FETCH
+import helpers
+from extensions import db
+from invalidacion import version_datos
+from modelos import EstadoGlobal, Liquidacion
+
+
+def _escrituras(app, accion):
+    """Tablas escritas (INSERT/UPDATE/DELETE) por `accion`, en orden."""
+    tablas = []
+    # Solo este hilo: el recálculo en segundo plano tiene sus propias transacciones
+    hilo = threading.get_ident()
+
+    def anotar(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() != hilo:
+            return
+        palabras = statement.split()
+        verbo = palabras[0].upper()
+        if verbo == "UPDATE":
+            tablas.append(palabras[1])
+        elif verbo in ("INSERT", "DELETE"):
+            tablas.append(palabras[2])
+
+    event.listen(db.engine, "before_cursor_execute", anotar)
+    try:
+        accion()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", anotar)
+    return tablas
+
+
+def test_estado_global_se_escribe_al_final_de_la_transaccion(app, cliente_http, nuevo_cliente):
+    codigo = nuevo_cliente()
+    version = version_datos()
+
+    tablas = _escrituras(app, lambda: cliente_http.post(
+        "/registrar_abono_por_codigo", data=dict(codigo=codigo, monto=100), headers=FETCH,
+    ))
+
+    assert "liquidacion" in tablas
+    primera = tablas.index("estado_global")
+    # Nada después de estado_global: la fila id=1 se bloquea al final
+    assert set(tablas[primera:]) == {"estado_global"}
+    assert tablas.index("liquidacion") < primera
+    db.session.expire_all()
+    assert version_datos() > version
+
+
+def test_resumen_armado_durante_un_commit_no_queda_servido(app, monkeypatch):
+    hoy = helpers.local_date()
+    helpers.obtener_resumenes_del_dia(hoy)  # crea la liquidación del día
+    original = helpers.obtener_liquidacion_del_dia
+
+    def leer_y_otro_confirma(fecha, commit=True):
+        liq = original(fecha, commit=commit)
+        monkeypatch.setattr(helpers, "obtener_liquidacion_del_dia", original)
+        # Otro worker confirma una escritura después de nuestra lectura
+        with db.engine.begin() as conn:
+            conn.execute(update(Liquidacion).where(Liquidacion.fecha == hoy)
+                         .values(entradas=Liquidacion.entradas + 500))
+            conn.execute(update(EstadoGlobal).where(EstadoGlobal.id == 1)
+                         .values(version=EstadoGlobal.version + 1))
+        return liq
+
+    monkeypatch.setattr(helpers, "obtener_liquidacion_del_dia", leer_y_otro_confirma)
+    viejo = helpers.obtener_resumenes_del_dia(hoy)
+
+    db.session.expire_all()
+    nuevo = helpers.obtener_resumenes_del_dia(hoy)
+    assert nuevo["resumen_hoy"]["entradas"] == viejo["resumen_hoy"]["entradas"] + 500
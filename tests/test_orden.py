@@ -0,0 +1,76 @@
+import pytest
+
+from conftest import FETCH
+from extensions import db
+from modelos import Cliente
+from orden import ORDEN_PASO
+
+
+@pytest.fixture
+def ruta_de_diez(nuevo_cliente):
+    for i in range(10):
+        nuevo_cliente(codigo=f"{i:03d}", nombre=f"C{i}")
+    return _ruta()
+
+
+def _ruta():
+    return [c.id for c in Cliente.query.filter_by(cancelado=False).order_by(Cliente.orden, Cliente.id)]
+
+
+def _llaves():
+    return {c.id: c.orden for c in Cliente.query.filter_by(cancelado=False)}
+
+
+def _reordenar(cliente_http, cuerpo):
+    r = cliente_http.post("/reordenar_ruta", json=cuerpo, headers=FETCH)
+    assert r.status_code == 200, r.data[:300]
+    return r.json["actualizados"]
+
+
+def test_arrastre_escribe_solo_la_fila_movida(cliente_http, ruta_de_diez):
+    ids = ruta_de_diez
+    # El último entre el 2.º y el 3.º
+    movido = {"id": ids[-1], "antes": ids[1], "despues": ids[2]}
+    assert _reordenar(cliente_http, {"movimientos": [movido]}) == 1
+    assert _ruta() == ids[:2] + [ids[-1]] + ids[2:-1]
+
+
+def test_arrastres_seguidos_en_un_envio(cliente_http, ruta_de_diez):
+    ids = ruta_de_diez
+    movimientos = [
+        {"id": ids[5], "antes": None, "despues": ids[0]},   # al principio
+        {"id": ids[0], "antes": ids[9], "despues": None},   # al final
+    ]
+    assert _reordenar(cliente_http, {"movimientos": movimientos}) == 2
+    assert _ruta() == [ids[5]] + ids[1:5] + ids[6:] + [ids[0]]
+
+
+def test_lista_completa_reescribe_solo_lo_que_cambio_de_orden(cliente_http, ruta_de_diez):
+    ids = ruta_de_diez
+    antes = _llaves()
+    nuevo = ids[:3] + [ids[8]] + ids[3:8] + [ids[9]]
+
+    assert _reordenar(cliente_http, {"ids": nuevo}) == 1
+    assert _ruta() == nuevo
+    despues = _llaves()
+    assert [cid for cid in ids if antes[cid] != despues[cid]] == [ids[8]]
+
+
+def test_lista_completa_sin_hueco_reparte(cliente_http, ruta_de_diez):
+    ids = ruta_de_diez
+    # Llaves pegadas (1, 2, 3...): no cabe nadie entre dos quietos
+    for i, cid in enumerate(ids, start=1):
+        db.session.get(Cliente, cid).orden = i
+    db.session.commit()
+
+    orden = ids[:2] + [ids[5]] + ids[2:5] + ids[6:]
+    _reordenar(cliente_http, {"ids": orden})
+    db.session.expire_all()
+    assert _ruta() == orden
+    assert sorted(_llaves().values()) == [i * ORDEN_PASO for i in range(1, 11)]
+
+
+def test_por_posicion_sigue_funcionando(cliente_http, ruta_de_diez):
+    ids = ruta_de_diez
+    assert _reordenar(cliente_http, {"movimientos": [{"id": ids[4], "posicion": 1}]}) == 1
+    assert _ruta() == [ids[4]] + ids[:4] + ids[5:]